@@ -0,0 +1,141 @@
+"""
+Benchmark embedding backend: torch (sentence-transformers) vs ONNX Runtime (int8 / fp32).
+
+Mỗi backend chạy trong 1 process con riêng -> đo được RSS của riêng backend đó.
+Báo cáo: thời gian load, throughput (text/s), RSS tăng thêm, và chất lượng so với torch:
+cosine từng vector + độ trùng top-k khi search trên chính tập chunk (recall@k so với torch).
+
+Ví dụ (chạy từ thư mục gốc repo):
+    python -m Scripts.bench_embeddings --backends torch,onnx-int8,onnx-fp32 --texts 2000 --queries 200
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+from Scripts.run_load import rss_bytes
+
+BACKENDS = {
+    "torch": {"backend": "torch"},
+    "onnx-int8": {"backend": "onnx", "quantize": True},
+    "onnx-fp32": {"backend": "onnx", "quantize": False},
+}
+
+
+def load_texts(path: str, n: int) -> list:
+    """Chunk thật trong data/processed/chunks.json (lặp lại nếu ít hơn n)."""
+    with open(path, encoding="utf-8") as f:
+        chunks = [c for c in json.load(f) if c.strip()]
+    return [chunks[i % len(chunks)] for i in range(n)]
+
+
+def run_child(name: str, texts_path: str, out_path: str, batch_size: int, threads: int):
+    """Process con: load backend, embed toàn bộ text, ghi vector + số đo."""
+    from src.embeddings.embedding_builder import EmbeddingBuilder
+
+    with open(texts_path, encoding="utf-8") as f:
+        texts = json.load(f)
+    kwargs = dict(BACKENDS[name])
+    if kwargs["backend"] == "onnx" and threads:
+        kwargs["threads"] = threads
+    rss_before = rss_bytes()
+    start = time.perf_counter()
+    builder = EmbeddingBuilder(batch_size=batch_size, **kwargs)
+    load_s = time.perf_counter() - start
+    builder.embed_texts(texts[:batch_size])  # warm-up
+    start = time.perf_counter()
+    vectors = builder.embed_texts(texts)
+    embed_s = time.perf_counter() - start
+    np.save(out_path, vectors)
+    print(json.dumps({
+        "backend": name,
+        "dimension": builder.dimension,
+        "load_s": round(load_s, 2),
+        "texts_per_s": round(len(texts) / embed_s, 1),
+        "rss_mb": round((rss_bytes() - rss_before) / 1e6, 1),
+    }))
+
+
+def topk(vectors: np.ndarray, queries: np.ndarray, k: int) -> np.ndarray:
+    v = vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+    q = queries / np.linalg.norm(queries, axis=1, keepdims=True)
+    return np.argsort(-(q @ v.T), axis=1)[:, :k]
+
+
+def compare(reference: np.ndarray, other: np.ndarray, n_queries: int, k: int) -> dict:
+    """Cosine từng vector + recall@k của top-k (query = n_queries chunk đầu) so với reference."""
+    ref = reference / np.linalg.norm(reference, axis=1, keepdims=True)
+    oth = other / np.linalg.norm(other, axis=1, keepdims=True)
+    cosine = np.sum(ref * oth, axis=1)
+    ref_top = topk(reference, reference[:n_queries], k)
+    oth_top = topk(other, other[:n_queries], k)
+    recall = np.mean([len(set(a) & set(b)) / k for a, b in zip(ref_top, oth_top)])
+    return {"cosine_mean": round(float(cosine.mean()), 5), "cosine_min": round(float(cosine.min()), 5),
+            f"recall@{k}": round(float(recall), 4)}
+
+
+def parse_args(argv=None):
+    p = argparse.ArgumentParser(description="Benchmark torch vs ONNX embedding backends")
+    p.add_argument("--backends", default="torch,onnx-int8", help=f"Danh sách, phân cách dấu phẩy ({','.join(BACKENDS)})")
+    p.add_argument("--chunks", default="data/processed/chunks.json")
+    p.add_argument("--texts", type=int, default=2000)
+    p.add_argument("--queries", type=int, default=200)
+    p.add_argument("--k", type=int, default=10)
+    p.add_argument("--batch-size", type=int, default=32)
+    p.add_argument("--threads", type=int, default=0, help="intra-op threads cho ONNX Runtime (0 = mặc định)")
+    p.add_argument("--json", default=None, help="Ghi report ra file JSON")
+    p.add_argument("--child", default=None, help=argparse.SUPPRESS)
+    p.add_argument("--texts-path", default=None, help=argparse.SUPPRESS)
+    p.add_argument("--out", default=None, help=argparse.SUPPRESS)
+    return p.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    if args.child:
+        run_child(args.child, args.texts_path, args.out, args.batch_size, args.threads)
+        return
+
+    names = [b.strip() for b in args.backends.split(",") if b.strip()]
+    texts = load_texts(args.chunks, args.texts)
+    workdir = tempfile.mkdtemp(prefix="bench_embeddings_")
+    texts_path = os.path.join(workdir, "texts.json")
+    with open(texts_path, "w", encoding="utf-8") as f:
+        json.dump(texts, f, ensure_ascii=False)
+
+    report, vectors = {}, {}
+    for name in names:
+        out = os.path.join(workdir, f"{name}.npy")
+        result = subprocess.run(
+            [sys.executable, "-m", "Scripts.bench_embeddings", "--child", name, "--texts-path", texts_path,
+             "--out", out, "--batch-size", str(args.batch_size), "--threads", str(args.threads)],
+            capture_output=True, text=True,
+        )
+        if result.returncode != 0:
+            print(f"[{name}] failed:\n{result.stderr[-2000:]}")
+            continue
+        report[name] = json.loads(result.stdout.strip().splitlines()[-1])
+        vectors[name] = np.load(out)
+
+    reference = "torch" if "torch" in vectors else next(iter(vectors), None)
+    for name in vectors:
+        if name != reference:
+            report[name]["vs_" + reference] = compare(vectors[reference], vectors[name], args.queries, args.k)
+
+    print(f"{'backend':<10} {'dim':>5} {'load s':>7} {'text/s':>8} {'RSS MB':>8}  quality vs {reference}")
+    for name, r in report.items():
+        quality = r.get("vs_" + str(reference), {})
+        print(f"{name:<10} {r['dimension']:>5} {r['load_s']:>7} {r['texts_per_s']:>8} {r['rss_mb']:>8}  "
+              f"{' '.join(f'{k}={v}' for k, v in quality.items())}")
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
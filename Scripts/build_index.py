@@ -1,10 +1,26 @@
+import argparse
+import json
+
 from src.ingestion.pdf_parsing import PDFParser
 from src.ingestion.chunking import TextChunker
+from src.ingestion.dedup import MinHashDeduplicator
+from src.utils.config_loader import config
+from src.vectordb import index_versions
+from src.vectordb.collection_manager import DEFAULT_COLLECTION, get_collection_manager
 from src.vectordb.faiss_index import VectorDB
 
+args_parser = argparse.ArgumentParser(description="Parse PDF -> chunk -> dedup -> build FAISS index")
+args_parser.add_argument("--collection", default=DEFAULT_COLLECTION,
+                         help="Tên collection (mặc định: FAISS_INDEX_PATH; khác: COLLECTIONS_DIR/<name>)")
+args = args_parser.parse_args()
+
 parser = PDFParser()
 chunker = TextChunker()
-vectordb = VectorDB()
+deduplicator = MinHashDeduplicator()
+# build vào version mới; server vẫn phục vụ version CURRENT cho tới khi publish ở cuối
+base = get_collection_manager().path(args.collection)
+version, version_dir = index_versions.new_version(base)
+vectordb = VectorDB(index_path=str(version_dir))
 
 # 1️⃣ Parse PDF
 texts = parser.parse_all_pdfs()
@@ -12,5 +28,17 @@ texts = parser.parse_all_pdfs()
 # 2️⃣ Chunking
 chunks = chunker.chunk_folder()
 
-# 3️⃣ Build FAISS index
+# 3️⃣ Bỏ chunk gần trùng (MinHash + LSH) trước khi embed
+dim = vectordb.embeddings.dimension
+chunks, report = deduplicator.dedup(chunks, embedding_dim=dim)
+print(f" Dedup: removed {report['removed']}/{report['chunks_in']} chunks ({report['removed_ratio']:.1%}), "
+      f"index {report['index_bytes_in'] / 1e6:.1f}MB -> {report['index_bytes_out'] / 1e6:.1f}MB, "
+      f"text {report['text_bytes_in'] / 1e6:.1f}MB -> {report['text_bytes_out'] / 1e6:.1f}MB in {report['seconds']}s")
+with open("data/processed/dedup_report.json", "w", encoding="utf-8") as f:
+    json.dump(report, f, indent=2)
+
+# 4️⃣ Build FAISS index rồi trỏ CURRENT sang version mới (server tự đổi, xem INDEX_WATCH_INTERVAL)
 vectordb.build_index(chunks)
+index_versions.publish(base, version)
+removed = index_versions.prune(base, keep=config.INDEX_KEEP_VERSIONS)
+print(f" Published {args.collection} version {version} ({len(chunks)} chunks), pruned {len(removed)} old versions")
@@ -0,0 +1,64 @@
+"""
+Kiểm tra tất cả worker gunicorn (gunicorn.conf.py) đã khởi tạo xong.
+Dùng làm healthcheck / bước chờ sau khi deploy:
+
+    python -m Scripts.check_workers --wait 60
+Exit code 0 khi số worker sẵn sàng (pid còn sống) >= số worker mong đợi, 1 nếu chưa.
+"""
+import argparse
+import os
+import sys
+import time
+
+
+def live_ready_pids(ready_dir: str) -> list:
+    pids = []
+    try:
+        names = os.listdir(ready_dir)
+    except FileNotFoundError:
+        return pids
+    for name in names:
+        if not name.isdigit():
+            continue
+        try:
+            os.kill(int(name), 0)  # chỉ kiểm tra process còn sống
+        except ProcessLookupError:
+            continue
+        except PermissionError:
+            pass
+        pids.append(int(name))
+    return sorted(pids)
+
+
+def expected_workers(ready_dir: str, override: int = None) -> int:
+    if override:
+        return override
+    try:
+        with open(os.path.join(ready_dir, "expected")) as f:
+            return int(f.read().strip())
+    except (FileNotFoundError, ValueError):
+        return int(os.getenv("WEB_CONCURRENCY", "2"))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--ready-dir", default=os.getenv("WORKER_READY_DIR", "/tmp/multi-agent-workers"))
+    parser.add_argument("--workers", type=int, default=None, help="số worker mong đợi (mặc định: theo gunicorn)")
+    parser.add_argument("--wait", type=float, default=0, help="chờ tối đa N giây")
+    args = parser.parse_args()
+
+    deadline = time.monotonic() + args.wait
+    while True:
+        expected = expected_workers(args.ready_dir, args.workers)
+        ready = live_ready_pids(args.ready_dir)
+        if len(ready) >= expected:
+            print(f"ready: {len(ready)}/{expected} workers {ready}")
+            return 0
+        if time.monotonic() >= deadline:
+            print(f"not ready: {len(ready)}/{expected} workers {ready}", file=sys.stderr)
+            return 1
+        time.sleep(0.5)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,221 @@
+"""
+Load-test offline cho backend FastAPI.
+
+- Mặc định chạy app in-process (httpx ASGITransport) với stub LLM / stub web search
+  (độ trễ cấu hình được) nên không tốn quota Gemini và không cần mạng.
+- --url http://localhost:8000 để bắn vào một uvicorn đang chạy (dùng Scripts/stub_server.py để server chạy với stub).
+- Báo cáo: throughput, p50/p95/p99 latency, error rate, memory growth (RSS).
+
+Ví dụ (chạy từ thư mục gốc repo):
+    python -m Scripts.run_load --endpoints /chat,/route --concurrency 8 --rate 4 --requests 200 \\
+        --llm-latency lognormal:-0.7,0.5 --search-latency uniform:0.2,0.8 --web-search
+"""
+import argparse
+import asyncio
+import json
+import math
+import random
+import resource
+import time
+
+import httpx
+
+from src.utils.stubs import LatencyModel, install_stubs
+
+QUERIES = [
+    "What is the Transformer architecture?",
+    "Explain self-attention with an example.",
+    "Show me Python code for scaled dot-product attention.",
+    "Summarize the Llama 3 paper.",
+    "What problem does retrieval-augmented generation solve?",
+    "Hi there!",
+]
+
+
+def build_payload(endpoint: str, query: str, web_search: bool) -> dict:
+    """Payload mặc định cho từng endpoint (giống frontend gửi lên)."""
+    if endpoint == "/route":
+        return {"query": query, "agent": "auto", "web_search": web_search, "mode": "auto"}
+    if endpoint == "/chat/batch":
+        # 1 request = cả bộ câu hỏi (body JSONL được đọc hết, latency = thời gian cả batch)
+        return {"queries": [query] + [q for q in QUERIES if q != query]}
+    return {"query": query, "agent": "auto", "web_search": web_search}
+
+
+def rss_bytes(pid: int = None) -> int:
+    """RSS hiện tại (Linux /proc), fallback ru_maxrss của process hiện tại."""
+    path = f"/proc/{pid or 'self'}/status"
+    try:
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    if pid:
+        return 0
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def percentile(values: list, pct: float) -> float:
+    """Nearest-rank percentile (values chưa cần sort)."""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = max(0, min(len(ordered) - 1, math.ceil(pct / 100.0 * len(ordered)) - 1))
+    return ordered[rank]
+
+
+async def send_one(client: httpx.AsyncClient, endpoint: str, payload: dict, arrived: float, timeout: float) -> dict:
+    """Gửi 1 request, đọc hết body (hỗ trợ endpoint streaming), đo TTFB và tổng latency."""
+    ttfb = None
+    status = 0
+    error = None
+    try:
+        async with client.stream("POST", endpoint, json=payload, timeout=timeout) as resp:
+            status = resp.status_code
+            async for _ in resp.aiter_bytes():
+                if ttfb is None:
+                    ttfb = time.perf_counter() - arrived
+    except Exception as e:
+        error = type(e).__name__
+    latency = time.perf_counter() - arrived
+    return {
+        "endpoint": endpoint,
+        "status": status,
+        "latency": latency,
+        "ttfb": ttfb if ttfb is not None else latency,
+        "ok": error is None and 200 <= status < 300,
+        "error": error or (None if 200 <= status < 300 else f"HTTP {status}"),
+    }
+
+
+async def run_load(client, endpoints, total, concurrency, rate, web_search, timeout, seed):
+    """
+    - rate > 0: open-loop, inter-arrival ~ Exp(rate), latency tính từ lúc request "đến"
+      (bao gồm thời gian chờ slot concurrency phía client).
+    - rate == 0: closed-loop, luôn giữ đúng `concurrency` request đang bay.
+    """
+    rng = random.Random(seed)
+    sem = asyncio.Semaphore(concurrency)
+    results = []
+
+    async def worker(i):
+        endpoint = endpoints[i % len(endpoints)]
+        payload = build_payload(endpoint, rng.choice(QUERIES), web_search)
+        arrived = time.perf_counter()
+        async with sem:
+            results.append(await send_one(client, endpoint, payload, arrived, timeout))
+
+    tasks = []
+    for i in range(total):
+        tasks.append(asyncio.create_task(worker(i)))
+        if rate > 0:
+            await asyncio.sleep(rng.expovariate(rate))
+    await asyncio.gather(*tasks)
+    return results
+
+
+def summarize(results: list, elapsed: float) -> dict:
+    report = {"total": len(results), "elapsed_s": round(elapsed, 3), "by_endpoint": {}}
+
+    def block(rows):
+        lat = [r["latency"] for r in rows]
+        ok = [r for r in rows if r["ok"]]
+        return {
+            "requests": len(rows),
+            "throughput_rps": round(len(ok) / elapsed, 3) if elapsed else 0.0,
+            "error_rate": round(1 - len(ok) / len(rows), 4) if rows else 0.0,
+            "p50_s": round(percentile(lat, 50), 4),
+            "p95_s": round(percentile(lat, 95), 4),
+            "p99_s": round(percentile(lat, 99), 4),
+            "ttfb_p50_s": round(percentile([r["ttfb"] for r in rows], 50), 4),
+            "errors": sorted({r["error"] for r in rows if r["error"]}),
+        }
+
+    report.update(block(results))
+    for endpoint in sorted({r["endpoint"] for r in results}):
+        report["by_endpoint"][endpoint] = block([r for r in results if r["endpoint"] == endpoint])
+    return report
+
+
+async def main_async(args):
+    endpoints = [e.strip() for e in args.endpoints.split(",") if e.strip()]
+
+    if args.url:
+        client = httpx.AsyncClient(base_url=args.url)
+        pid = args.pid
+    else:
+        install_stubs(
+            llm_latency=LatencyModel.parse(args.llm_latency, error_rate=args.llm_error_rate, seed=args.seed),
+            search_latency=LatencyModel.parse(args.search_latency, error_rate=args.search_error_rate, seed=args.seed),
+        )
+        from src.api.main import app  # import sau khi đã cài stub
+
+        client = httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://loadtest")
+        pid = None
+
+    async with client:
+        # warmup: 1 request/endpoint để không tính chi phí load model vào kết quả
+        for endpoint in endpoints:
+            await send_one(client, endpoint, build_payload(endpoint, QUERIES[0], args.web_search),
+                           time.perf_counter(), args.timeout)
+
+        rss_before = rss_bytes(pid)
+        started = time.perf_counter()
+        results = await run_load(client, endpoints, args.requests, args.concurrency,
+                                 args.rate, args.web_search, args.timeout, args.seed)
+        elapsed = time.perf_counter() - started
+        rss_after = rss_bytes(pid)
+
+    report = summarize(results, elapsed)
+    report["config"] = {
+        "target": args.url or "in-process",
+        "concurrency": args.concurrency,
+        "rate_rps": args.rate,
+        "llm_latency": None if args.url else args.llm_latency,
+        "search_latency": None if args.url else args.search_latency,
+        "web_search": args.web_search,
+    }
+    if args.url and not pid:
+        report["memory"] = None
+    else:
+        report["memory"] = {
+            "rss_before_mb": round(rss_before / 2**20, 1),
+            "rss_after_mb": round(rss_after / 2**20, 1),
+            "growth_mb": round((rss_after - rss_before) / 2**20, 1),
+        }
+    return report
+
+
+def parse_args(argv=None):
+    p = argparse.ArgumentParser(description="Offline load test for the multi-agent backend")
+    p.add_argument("--url", default=None, help="Base URL của server đang chạy (mặc định: in-process)")
+    p.add_argument("--pid", type=int, default=None, help="PID server (để đo RSS khi dùng --url)")
+    p.add_argument("--endpoints", default="/chat,/route", help="Danh sách endpoint, phân cách bằng dấu phẩy")
+    p.add_argument("--requests", type=int, default=100)
+    p.add_argument("--concurrency", type=int, default=8)
+    p.add_argument("--rate", type=float, default=0.0, help="Arrival rate (req/s); 0 = closed-loop")
+    p.add_argument("--timeout", type=float, default=120.0)
+    p.add_argument("--web-search", action="store_true", help="Bật web search trong payload")
+    p.add_argument("--llm-latency", default="lognormal:-1.0,0.5")
+    p.add_argument("--llm-error-rate", type=float, default=0.0)
+    p.add_argument("--search-latency", default="uniform:0.2,0.8")
+    p.add_argument("--search-error-rate", type=float, default=0.0)
+    p.add_argument("--seed", type=int, default=0)
+    p.add_argument("--json", default=None, help="Ghi report ra file JSON")
+    return p.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    report = asyncio.run(main_async(args))
+    print(json.dumps(report, indent=2, ensure_ascii=False))
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2, ensure_ascii=False)
+    return report
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,23 @@
+"""
+Backend FastAPI với stub LLM / stub web search, để load-test qua uvicorn thật:
+
+    STUB_LLM_LATENCY=lognormal:-1.0,0.5 STUB_SEARCH_LATENCY=uniform:0.2,0.8 \\
+        uvicorn Scripts.stub_server:app --port 8000
+    python -m Scripts.run_load --url http://localhost:8000 --pid <uvicorn pid>
+"""
+import os
+
+from src.utils.stubs import LatencyModel, install_stubs
+
+install_stubs(
+    llm_latency=LatencyModel.parse(
+        os.getenv("STUB_LLM_LATENCY", "lognormal:-1.0,0.5"),
+        error_rate=float(os.getenv("STUB_LLM_ERROR_RATE", "0")),
+    ),
+    search_latency=LatencyModel.parse(
+        os.getenv("STUB_SEARCH_LATENCY", "uniform:0.2,0.8"),
+        error_rate=float(os.getenv("STUB_SEARCH_ERROR_RATE", "0")),
+    ),
+)
+
+from src.api.main import app  # noqa: E402  (import sau khi cài stub)
@@ -5,6 +5,8 @@ import json
 from datetime import datetime
 from pathlib import Path
 
+from chat_index import default_index
+
 # ===================== CONFIG =====================
 st.set_page_config(
     page_title="Multi-Agent Knowledge Chat",
@@ -17,6 +19,17 @@ DATA_DIR = Path("frontend/data/chats")
 DATA_DIR.mkdir(parents=True, exist_ok=True)
 
 
+@st.cache_resource
+def get_chat_index():
+    """Full-text index (SQLite FTS5) của các session; đồng bộ với thư mục 1 lần khi app khởi động."""
+    index = default_index(DATA_DIR)
+    index.sync()
+    return index
+
+
+CHAT_INDEX = get_chat_index()
+
+
 # ===================== UTILITIES =====================
 def list_sessions():
     """Trả về danh sách file chat đã lưu (sorted by time desc)."""
@@ -34,9 +47,18 @@ def load_session(filepath):
 
 
 def save_session(filepath, data):
-    """Lưu nội dung hội thoại vào JSON."""
+    """Lưu nội dung hội thoại vào JSON + cập nhật search index (chỉ các message mới)."""
     with open(filepath, "w", encoding="utf-8") as f:
         json.dump(data, f, ensure_ascii=False, indent=2)
+    CHAT_INDEX.index_session(filepath, data)
+
+
+def delete_session(filepath):
+    try:
+        os.remove(filepath)
+    except OSError:  # file đã bị xóa ở nơi khác: vẫn xóa khỏi index
+        pass
+    CHAT_INDEX.remove_session(filepath)
 
 
 def create_new_session(title: str = None):
@@ -102,12 +124,8 @@ with st.sidebar:
         prev_state = st.session_state["web_search"]
         new_state = st.checkbox("🌍 Bật Web Search (ép buộc cho KnowledgeAgent)", value=prev_state)
         if new_state != prev_state:
+            # gửi kèm từng request (payload["web_search"]), backend không giữ toggle toàn cục
             st.session_state["web_search"] = new_state
-            try:
-                api_base = "http://localhost:8000"
-                requests.post(f"{api_base}/toggle_websearch", params={"enable": new_state})
-            except Exception as e:
-                st.warning(f"Không thể cập nhật WebSearch backend: {e}")
     else:
         # Tự động tắt web search nếu không phải KnowledgeAgent
         st.session_state["web_search"] = False
@@ -123,23 +141,45 @@ with st.sidebar:
         st.session_state["messages"] = []
         st.rerun()
 
-    # Lịch sử chat
+    # Tìm trong lịch sử chat (full-text index, không mở từng file)
+    st.subheader("🔎 Tìm trong lịch sử")
+    search_query = st.text_input("Từ khóa", value="", key="chat_search")
+    if search_query.strip():
+        hits = CHAT_INDEX.search(search_query)
+        if not hits:
+            st.caption("Không có kết quả.")
+        for j, hit in enumerate(hits):
+            cols = st.columns([1, 5])
+            if cols[0].button("Open", key=f"hit_{j}"):
+                path = DATA_DIR / hit["session"]
+                if path.exists():
+                    st.session_state["current_session"] = path
+                    st.session_state["messages"] = load_session(path).get("messages", [])
+                    st.rerun()
+                # file đã bị xóa ngoài app: bỏ khỏi index để không còn hiện trong kết quả
+                CHAT_INDEX.remove_session(path)
+                cols[1].caption("Hội thoại này không còn tồn tại.")
+            cols[1].markdown(f"**{hit['title'] or hit['session']}** · {hit['role']}\n\n{hit['snippet']}")
+        st.markdown("---")
+
+    # Lịch sử chat (tiêu đề lấy từ index, file JSON chỉ đọc khi mở)
     st.subheader("💬 Lịch sử Chat")
     sessions = list_sessions()
+    titles = CHAT_INDEX.titles()
     for i, s in enumerate(sessions):
-        data = load_session(s)
-        label = data.get("title", f"Chat {i+1}")
+        title, created_at = titles.get(s.name) or (None, None)
+        if title is None:
+            data = load_session(s)
+            title, created_at = data.get("title"), data.get("created_at", "")
+        label = title or f"Chat {i+1}"
         cols = st.columns([1, 4, 1])
         if cols[0].button("Open", key=f"open_{i}"):
             st.session_state["current_session"] = s
-            st.session_state["messages"] = data.get("messages", [])
+            st.session_state["messages"] = load_session(s).get("messages", [])
             st.rerun()
-        cols[1].markdown(f"**{label}**\n<small>{data.get('created_at','')}</small>", unsafe_allow_html=True)
+        cols[1].markdown(f"**{label}**\n<small>{created_at or ''}</small>", unsafe_allow_html=True)
         if cols[2].button("Xóa", key=f"del_{i}"):
-            try:
-                os.remove(s)
-            except:
-                pass
+            delete_session(s)
             if s == st.session_state["current_session"]:
                 st.session_state["current_session"] = create_new_session()
                 st.session_state["messages"] = []
@@ -150,8 +190,9 @@ with st.sidebar:
         for s in sessions:
             try:
                 os.remove(s)
-            except:
+            except OSError:
                 pass
+        CHAT_INDEX.clear()
         st.session_state["messages"] = []
         st.session_state["current_session"] = create_new_session()
         st.rerun()
@@ -222,7 +263,8 @@ if query:
         "query": query,
         "agent": st.session_state["agent"],
         "web_search": st.session_state["web_search"],
-        "mode": st.session_state["mode"].lower()
+        "mode": st.session_state["mode"].lower(),
+        "session_id": Path(st.session_state["current_session"]).stem,
     }
 
     with st.spinner("🤖 Thinking..."):
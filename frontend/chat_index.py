@@ -0,0 +1,162 @@
+# frontend/chat_index.py
+"""
+Chỉ mục full-text cho các chat session đã lưu (frontend/data/chats/*.json), dùng SQLite FTS5.
+- Inverted index nằm trong 1 file SQLite cạnh thư mục chats; không cần đọc lại file JSON khi tìm.
+- Cập nhật tăng dần: index_session() sau mỗi lần lưu chỉ thêm các message mới (chat chỉ append);
+  session bị sửa khác đi (ít message hơn) -> index lại cả session đó.
+- sync(): đối chiếu với thư mục (mtime + size) -> index file mới / đổi, xóa file đã mất.
+- search(): xếp hạng bm25, mỗi session 1 kết quả (message khớp nhất) kèm snippet; không phân biệt dấu
+  tiếng Việt ("giai thich" khớp "giải thích"), từ cuối khớp theo tiền tố (gõ tới đâu tìm tới đó).
+"""
+import json
+import re
+import sqlite3
+import threading
+from pathlib import Path
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS sessions (
+    name TEXT PRIMARY KEY,
+    title TEXT,
+    created_at TEXT,
+    mtime REAL,
+    size INTEGER,
+    message_count INTEGER
+);
+CREATE VIRTUAL TABLE IF NOT EXISTS messages USING fts5(
+    content,
+    session UNINDEXED,
+    role UNINDEXED,
+    position UNINDEXED,
+    tokenize = 'unicode61 remove_diacritics 2'
+);
+"""
+
+_TOKEN = re.compile(r"\w+", re.UNICODE)
+
+
+def to_match_query(text: str) -> str:
+    """Chuỗi người dùng gõ -> FTS5 MATCH an toàn: các từ AND với nhau, từ cuối khớp tiền tố."""
+    tokens = _TOKEN.findall(text or "")
+    if not tokens:
+        return ""
+    quoted = [f'"{t}"' for t in tokens]
+    quoted[-1] += "*"
+    return " ".join(quoted)
+
+
+class ChatIndex:
+    def __init__(self, db_path, chats_dir):
+        self.db_path = Path(db_path)
+        self.chats_dir = Path(chats_dir)
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        # Streamlit chạy script ở nhiều thread -> 1 connection dùng chung, khóa bằng lock
+        self._conn = sqlite3.connect(str(self.db_path), check_same_thread=False)
+        self._conn.executescript(SCHEMA)
+        self._lock = threading.Lock()
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+    # ---------------------------------------------------------------- cập nhật
+    def _file_state(self, path: Path):
+        st = path.stat()
+        return st.st_mtime, st.st_size
+
+    def _insert_messages(self, name: str, messages: list, start: int):
+        self._conn.executemany(
+            "INSERT INTO messages (content, session, role, position) VALUES (?, ?, ?, ?)",
+            [(str(m.get("content", "")), name, m.get("role", ""), i)
+             for i, m in enumerate(messages[start:], start)],
+        )
+
+    def index_session(self, path, data: dict):
+        """Gọi sau mỗi lần lưu session (data = nội dung vừa ghi, không đọc lại file)."""
+        path = Path(path)
+        messages = data.get("messages", [])
+        mtime, size = self._file_state(path) if path.exists() else (0.0, 0)
+        with self._lock, self._conn:
+            row = self._conn.execute("SELECT message_count FROM sessions WHERE name = ?", (path.name,)).fetchone()
+            indexed = row[0] if row else 0
+            if indexed > len(messages):
+                # session bị cắt bớt / sửa -> index lại từ đầu
+                self._conn.execute("DELETE FROM messages WHERE session = ?", (path.name,))
+                indexed = 0
+            self._insert_messages(path.name, messages, indexed)
+            self._conn.execute(
+                "INSERT OR REPLACE INTO sessions (name, title, created_at, mtime, size, message_count) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (path.name, data.get("title", ""), data.get("created_at", ""), mtime, size, len(messages)),
+            )
+
+    def remove_session(self, path):
+        name = Path(path).name
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM messages WHERE session = ?", (name,))
+            self._conn.execute("DELETE FROM sessions WHERE name = ?", (name,))
+
+    def clear(self):
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM messages")
+            self._conn.execute("DELETE FROM sessions")
+
+    def sync(self) -> dict:
+        """Đồng bộ với thư mục chats (file sửa / thêm / xóa ngoài app). Chỉ stat, đọc file khi đã đổi."""
+        with self._lock:
+            known = {name: (mtime, size) for name, mtime, size in
+                     self._conn.execute("SELECT name, mtime, size FROM sessions")}
+        on_disk = {p.name: p for p in self.chats_dir.glob("*.json")}
+        changed = [p for name, p in on_disk.items() if known.get(name) != self._file_state(p)]
+        removed = [name for name in known if name not in on_disk]
+        for name in removed:
+            self.remove_session(name)
+        for path in changed:
+            try:
+                with open(path, "r", encoding="utf-8") as f:
+                    data = json.load(f)
+            except (OSError, ValueError):
+                continue
+            self.remove_session(path)  # file đổi ngoài app: không giả định chỉ append
+            self.index_session(path, data)
+        return {"indexed": len(changed), "removed": len(removed)}
+
+    # ---------------------------------------------------------------- truy vấn
+    def titles(self) -> dict:
+        """{tên file: (title, created_at)} để sidebar không phải mở từng file JSON."""
+        with self._lock:
+            rows = self._conn.execute("SELECT name, title, created_at FROM sessions").fetchall()
+        return {name: (title, created_at) for name, title, created_at in rows}
+
+    def search(self, text: str, limit: int = 10) -> list:
+        """
+        Session khớp nhất trước: [{"session", "title", "created_at", "role", "position", "snippet", "score"}].
+        score = bm25 (nhỏ hơn = khớp hơn).
+        """
+        match = to_match_query(text)
+        if not match:
+            return []
+        sql = (
+            "SELECT messages.session, sessions.title, sessions.created_at, messages.role, messages.position, "
+            "snippet(messages, 0, '**', '**', '…', 16), bm25(messages) AS score "
+            "FROM messages JOIN sessions ON sessions.name = messages.session "
+            "WHERE messages MATCH ? ORDER BY score LIMIT ?"
+        )
+        with self._lock:
+            rows = self._conn.execute(sql, (match, limit * 5)).fetchall()
+        results, seen = [], set()
+        for session, title, created_at, role, position, snippet, score in rows:
+            if session in seen:
+                continue
+            seen.add(session)
+            results.append({"session": session, "title": title, "created_at": created_at, "role": role,
+                            "position": int(position), "snippet": snippet, "score": round(score, 4)})
+            if len(results) >= limit:
+                break
+        return results
+
+
+def default_index(chats_dir) -> ChatIndex:
+    """Index cạnh thư mục chats: <chats_dir>/../chat_index.sqlite."""
+    chats_dir = Path(chats_dir)
+    return ChatIndex(chats_dir.parent / "chat_index.sqlite", chats_dir)
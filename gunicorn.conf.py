@@ -0,0 +1,99 @@
+"""
+Chạy backend nhiều worker (gunicorn + UvicornWorker), model load 1 lần trước khi fork:
+
+    gunicorn -c gunicorn.conf.py
+    python -m Scripts.check_workers            # exit 0 khi đủ worker đã sẵn sàng
+
+- preload_app: master import src.api.main rồi chạy warmup.load() -> SentenceTransformer, FAISS index,
+  long-term memory được load 1 lần rồi fork; các worker dùng chung các page đó theo copy-on-write.
+- Mỗi worker tự chạy phần probe của warmup (1 embedding + 1 FAISS search, sau fork) và ghi file
+  <WORKER_READY_DIR>/<pid> khi warmup xong (cùng lúc /ready của worker trả 200), xóa khi thoát.
+  Master chờ đủ WEB_CONCURRENCY worker và log kết quả; Scripts/check_workers.py kiểm tra từ ngoài.
+- History của session (short-term memory, context hội thoại) và long-term memory lấy file trong
+  data/processed làm nguồn chung: đọc lại khi file đổi, ghi read-merge-write dưới file lock -> lượt
+  kế tiếp vào worker nào cũng thấy đủ history, 2 worker ghi cùng lúc không mất lượt. Các worker phải
+  dùng chung thư mục đó (cùng máy / cùng volume).
+- Metrics, cache và tổng token theo session (SESSION_TOKEN_BUDGET) vẫn là riêng từng worker.
+"""
+import os
+import threading
+import time
+
+# tokenizers (HF) dùng thread pool riêng -> tắt trước khi fork để tránh deadlock trong worker
+os.environ.setdefault("TOKENIZERS_PARALLELISM", "false")
+
+wsgi_app = "src.api.main:app"
+bind = os.getenv("BIND", "0.0.0.0:8000")
+workers = int(os.getenv("WEB_CONCURRENCY", "2"))
+worker_class = "uvicorn.workers.UvicornWorker"
+preload_app = True
+timeout = int(os.getenv("GUNICORN_TIMEOUT", "120"))
+graceful_timeout = int(os.getenv("GUNICORN_GRACEFUL_TIMEOUT", "30"))
+
+READY_DIR = os.getenv("WORKER_READY_DIR", "/tmp/multi-agent-workers")
+READY_TIMEOUT = float(os.getenv("WORKER_READY_TIMEOUT", "60"))
+
+
+def _ready_pids() -> set:
+    try:
+        return {int(name) for name in os.listdir(READY_DIR) if name.isdigit()}
+    except FileNotFoundError:
+        return set()
+
+
+def on_starting(server):
+    # chạy sau khi preload app xong (trước khi fork): load model / index 1 lần trong master
+    if server.cfg.preload_app:
+        from src.api import warmup
+
+        try:
+            start = time.perf_counter()
+            warmup.load()
+            server.log.info("Preloaded models in %.1fs", time.perf_counter() - start)
+        except Exception as e:  # worker sẽ tự load lại trong warmup của nó
+            server.log.error("Preload failed: %s", e)
+
+    # xóa marker của lần chạy trước
+    os.makedirs(READY_DIR, exist_ok=True)
+    for pid in _ready_pids():
+        os.remove(os.path.join(READY_DIR, str(pid)))
+    with open(os.path.join(READY_DIR, "expected"), "w") as f:
+        f.write(str(server.num_workers))
+
+
+def post_worker_init(worker):
+    pid = worker.pid
+
+    def mark_ready():
+        with open(os.path.join(READY_DIR, str(pid)), "w") as f:
+            f.write(str(time.time()))
+
+    from src.api import warmup
+    from src.utils.config_loader import config
+
+    if config.WARMUP_ON_STARTUP:
+        warmup.on_ready(mark_ready)
+    else:  # không warmup -> sẵn sàng ngay khi init xong
+        mark_ready()
+
+
+def worker_exit(server, worker):
+    try:
+        os.remove(os.path.join(READY_DIR, str(worker.pid)))
+    except FileNotFoundError:
+        pass
+
+
+def when_ready(server):
+    def wait_for_workers():
+        deadline = time.monotonic() + READY_TIMEOUT
+        while time.monotonic() < deadline:
+            ready = _ready_pids() & set(server.WORKERS)
+            if len(ready) >= server.num_workers:
+                server.log.info("All %d workers ready (pids %s)", len(ready), sorted(ready))
+                return
+            time.sleep(0.5)
+        server.log.error("Only %d/%d workers ready after %.0fs",
+                         len(_ready_pids() & set(server.WORKERS)), server.num_workers, READY_TIMEOUT)
+
+    threading.Thread(target=wait_for_workers, name="worker-readiness", daemon=True).start()
@@ -3,20 +3,87 @@
 BaseAgent: lớp cơ sở cho tất cả agent.
 - Định chuẩn method run(query) -> dict {"answer":..., ...}
 - Có logger tiện lợi
+- stage(name): đo thời gian 1 bước trong run (metrics + timings của request)
+- conversation(): context hội thoại (summary + lượt gần nhất) của session hiện tại
+- remember(): ghi 1 message vào short memory của session, đầy thì đẩy sang long-term memory
+- render_history(): history cho prompt, thu nhỏ khi token budget của request / session sắp hết
+- run_admitted(): run() trong slot của pool admission_pool (giới hạn concurrency theo agent)
+- vector_db: VectorDB của collection request hiện tại chọn (mặc định "default")
 """
 import logging
 
+from src.agents.memory.conversation_context import get_conversation_context
+from src.agents.memory.memory_manager import get_short_memory
+from src.utils.config_loader import config
+from src.utils import admission, token_usage
+from src.utils.metrics import timed
+
 class AgentBase:
+    # pool admission control của agent (None = không giới hạn)
+    admission_pool = None
+    # LongTermMemory dùng chung (agent có memory gán trong __init__)
+    long_memory = None
+
     def __init__(self, name: str):
         self.name = name
         self.logger = logging.getLogger(name)
 
-    def run(self, query: str) -> dict:
+    def run(self, query: str, **kwargs) -> dict:
         """
         Mỗi agent phải implement run trả dict:
         {"answer": str, "retrieved": [...], "long_contexts": [...]}
+        kwargs tùy chọn (agent không dùng thì bỏ qua), vd prefetched_docs: list[Document]
+        đã retrieval sẵn bởi router.
         """
         raise NotImplementedError("Agent must implement run(query)")
 
+    def run_admitted(self, query: str, **kwargs) -> dict:
+        """run() sau khi có slot của admission_pool; quá tải -> admission.Rejected."""
+        if self.admission_pool is None:
+            return self.run(query, **kwargs)
+        with admission.slot(self.admission_pool):
+            return self.run(query, **kwargs)
+
+    @property
+    def vector_db(self):
+        """VectorDB của collection request hiện tại chọn (lease giữ tới hết request)."""
+        from src.vectordb.collection_manager import collection_db
+
+        return collection_db()
+
     def info(self, msg: str):
         self.logger.info(f"[{self.name}] {msg}")
+
+    def stage(self, name: str):
+        """Context manager đo 1 stage, tên dạng "<AgentName>.<name>"."""
+        return timed(f"{self.name}.{name}")
+
+    def conversation(self):
+        """ConversationContext của session hiện tại (dùng chung giữa các agent)."""
+        return get_conversation_context()
+
+    @property
+    def short_memory(self):
+        """Short-term memory của session hiện tại (agent dùng chung giữa các session -> không giữ trên instance)."""
+        return get_short_memory()
+
+    def remember(self, role: str, content: str):
+        """Ghi message vào short memory của session; đủ LONG_MEMORY_PUSH_THRESHOLD thì tóm tắt sang long-term."""
+        memory = self.short_memory
+        memory.add_message(role, content)
+        if self.long_memory is not None:
+            context = memory.pop_context(config.LONG_MEMORY_PUSH_THRESHOLD)
+            if context is not None:
+                self.long_memory.add_memory(context)
+
+    @staticmethod
+    def render_history(conversation) -> str:
+        """conversation.render() trong trần token_usage.history_budget() (= CONTEXT_MAX_TOKENS khi còn budget)."""
+        return conversation.render(max_tokens=token_usage.history_budget(conversation.max_tokens))
+
+    @staticmethod
+    def with_history(query: str, history: str) -> str:
+        """Prompt cho call LLM trực tiếp: chèn history (nếu có) trước câu hỏi."""
+        if not history:
+            return query
+        return f"Conversation so far:\n{history}\n\nUser: {query}\nAssistant:"
@@ -0,0 +1,112 @@
+# src/agents/batch.py
+"""
+Trả lời nhiều câu hỏi 1 lượt (đánh giá offline, sinh báo cáo) bằng FAISS path của KnowledgeAgent:
+1. Embed mọi query trong 1 lần encode theo batch + 1 lần FAISS search nhiều query.
+2. LLM call của các query chạy đồng thời, tối đa `concurrency` (vẫn qua pool / limiter của llm_manager).
+3. Kết quả trả về theo thứ tự hoàn thành (generator) -> /chat/batch stream JSONL.
+Retrieval trên collection của request (hoặc `collection`), lease giữ trong lúc search: generator chạy
+sau khi middleware đã kết thúc request nên không dùng lease theo request.
+Không đọc / ghi memory hội thoại: mỗi query độc lập.
+Quá tải (admission.Rejected) / ngắt mạch (CircuitOpen) -> dòng lỗi của từng query kèm retry_after
+(stream đã trả 200 nên không đổi được status như /chat).
+"""
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from src.utils import admission, request_context
+from src.utils.circuit_breaker import CircuitOpen
+from src.utils.config_loader import config
+from src.utils.metrics import LLM_CALLS_PER_REQUEST, Counter, Histogram, timed
+from src.utils.token_usage import TOKENS_PER_REQUEST
+from src.vectordb.collection_manager import current_collection, get_collection_manager
+
+BATCH_QUERIES = Counter("batch_queries_total", "Queries answered by the batch API", ["status"])
+BATCH_SIZE = Histogram("batch_size", "Queries per batch", buckets=(1, 5, 10, 25, 50, 100, 250, 500, 1000))
+
+
+def _sources(docs: list) -> list:
+    return [{"chunk_id": d.metadata.get("chunk_id"), "score": round(d.metadata.get("score", 0.0), 4)} for d in docs]
+
+
+def _error_item(i: int, query: str, exc: Exception, started: float) -> dict:
+    """Dòng lỗi của 1 query; quá tải / ngắt mạch kèm status + retry_after như response của /chat."""
+    item = {"index": i, "query": query, "error": f"{type(exc).__name__}: {exc}",
+            "ms": round((time.perf_counter() - started) * 1000, 2)}
+    if isinstance(exc, admission.Rejected):
+        item.update(status=429, pool=exc.pool, retry_after=exc.retry_after)
+    elif isinstance(exc, CircuitOpen):
+        item.update(status=503, breaker=exc.breaker, retry_after=exc.retry_after)
+    return item
+
+
+def answer_batch(queries: list, agent=None, concurrency: int = None, k: int = None, collection: str = None):
+    """
+    Generator: mỗi query xong -> 1 dict {"index", "query", "answer", "sources", "ms"} (hoặc "error"),
+    theo thứ tự hoàn thành; dict cuối {"done": True, "count", "errors", "total_ms"}.
+    agent mặc định: KnowledgeAgent mới (dùng chung VectorDB / LLM client với agent của API).
+    """
+    if agent is None:
+        from src.agents.knowledge_agent import KnowledgeAgent
+
+        agent = KnowledgeAgent()
+    concurrency = max(1, concurrency or config.BATCH_CONCURRENCY)
+    k = k or agent.retrieval_k
+    ctx = request_context.current()
+    start = time.perf_counter()
+    BATCH_SIZE.observe(len(queries))
+
+    collection = collection or current_collection()
+    try:
+        with get_collection_manager().lease(collection) as db, timed("batch.retrieval"):
+            docs_per_query = db.search_documents_batch(queries, k=k)
+    except (admission.Rejected, CircuitOpen) as e:
+        # embedding quá tải: mọi query cùng lỗi, vẫn kết thúc stream đúng format
+        BATCH_QUERIES.inc(len(queries), status="error")
+        for i, query in enumerate(queries):
+            yield _error_item(i, query, e, start)
+        yield {"done": True, "count": len(queries), "errors": len(queries),
+               "total_ms": round((time.perf_counter() - start) * 1000, 2)}
+        return
+
+    def answer(i: int):
+        with request_context.bind(ctx):
+            item_start = time.perf_counter()
+            try:
+                with admission.slot(agent.admission_pool):
+                    answer_text = agent.answer_from_docs(queries[i], docs_per_query[i])
+                BATCH_QUERIES.inc(status="ok")
+                return {"index": i, "query": queries[i], "answer": answer_text,
+                        "sources": _sources(docs_per_query[i]),
+                        "ms": round((time.perf_counter() - item_start) * 1000, 2)}
+            except Exception as e:
+                BATCH_QUERIES.inc(status="error")
+                return _error_item(i, queries[i], e, item_start)
+
+    errors = 0
+    pool = ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="batch")
+    futures = [pool.submit(answer, i) for i in range(len(queries))]
+    try:
+        for future in as_completed(futures):
+            item = future.result()
+            errors += "error" in item
+            yield item
+    finally:
+        # client ngắt stream giữa chừng -> không chạy tiếp các query chưa bắt đầu
+        pool.shutdown(wait=False, cancel_futures=True)
+    yield {"done": True, "count": len(queries), "errors": errors,
+           "total_ms": round((time.perf_counter() - start) * 1000, 2)}
+
+
+def stream_jsonl(items, ctx=None):
+    """
+    dict -> dòng JSONL (bytes) cho StreamingResponse. Middleware ghi metrics trước khi stream chạy
+    (ctx.streaming) -> số LLM call / token của request được ghi ở đây, khi stream kết thúc.
+    """
+    try:
+        for item in items:
+            yield (json.dumps(item, ensure_ascii=False) + "\n").encode("utf-8")
+    finally:
+        if ctx is not None:
+            LLM_CALLS_PER_REQUEST.observe(ctx.llm_calls)
+            TOKENS_PER_REQUEST.observe(ctx.total_tokens())
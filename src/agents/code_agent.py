@@ -1,9 +1,8 @@
 # src/agents/code_agent.py
-import io
-import contextlib
 from src.agents.base_agent import AgentBase
-from src.agents.memory.memory_manager import MemoryManager
-from src.agents.memory.long_term_memory import LongTermMemory
+from src.agents.code_sandbox import get_sandbox_pool
+from src.utils import admission
+from src.agents.memory.long_term_memory import get_long_term_memory
 from src.utils.llm_manager import create_langchain_llm
 from src.utils.config_loader import config
 
@@ -13,32 +12,24 @@ class CodeAgent(AgentBase):
     CodeAgent:
     - Nhận câu hỏi / yêu cầu về code.
     - Dùng LLM (model chuyên về coding) để tạo hoặc giải thích code.
-    - Có thể thực thi Python code bằng sandbox exec() thay cho PythonREPLTool.
+    - Có thể thực thi Python code trong pool sandbox subprocess (timeout, giới hạn CPU/RAM/output).
     """
+    admission_pool = "code"
 
     def __init__(self):
         super().__init__("CodeAgent")
-        self.short_memory = MemoryManager(max_memory=config.SHORT_MEMORY_MAX)
-        self.long_memory = LongTermMemory()
+        self.long_memory = get_long_term_memory()
         self.llm = create_langchain_llm(model_name=config.MODEL_CODE, temperature=0.3)
 
     def _run_python_code(self, code: str) -> str:
-        """Chạy code Python trong môi trường an toàn (sandbox đơn giản)."""
-        buffer = io.StringIO()
-        try:
-            # redirect stdout để capture kết quả print()
-            with contextlib.redirect_stdout(buffer):
-                # Restrict builtins to a very small safe set if desired; currently empty.
-                exec(code, {"__builtins__": {}})
-            output = buffer.getvalue().strip()
-            return output or "(no output)"
-        except Exception as e:
-            return f"Error: {e}"
-        finally:
-            buffer.close()
+        """Chạy code Python trong worker subprocess của sandbox pool (không chạy trong process API)."""
+        return get_sandbox_pool().run(code)
 
     def run(self, query: str) -> dict:
-        self.short_memory.add_message("user", query)
+        conversation = self.conversation()
+        history = self.render_history(conversation)
+        conversation.add_message("user", query)
+        self.remember("user", query)
 
         # If user sends a fenced python block, execute it
         stripped = query.strip()
@@ -47,18 +38,22 @@ class CodeAgent(AgentBase):
             code = stripped.strip("`")
             if code.startswith("python"):
                 code = code[len("python"):].strip()
-            result = self._run_python_code(code)
-            self.short_memory.add_message("assistant", result)
+            with self.stage("code_exec"):
+                result = self._run_python_code(code)
+            conversation.add_message("assistant", result)
+            self.remember("assistant", result)
             return {"answer": result, "executed": True}
 
         # Otherwise ask LLM to produce code/explanation via invoke
         prompt = (
             "You are a helpful Python coding assistant. Read the request and respond with helpful code or explanation.\n\n"
+            f"Conversation history:\n{history or '(none)'}\n\n"
             f"User request:\n{query}\n\nAnswer:"
         )
         try:
             # LangChain 0.3+ only needs invoke(string)
-            resp = self.llm.invoke(prompt)
+            with self.stage("llm_answer"):
+                resp = self.llm.invoke(prompt)
             if hasattr(resp, "content"):
                 answer = resp.content
             elif hasattr(resp, "generations"):
@@ -67,13 +62,12 @@ class CodeAgent(AgentBase):
                 answer = resp.get("answer") or resp.get("result") or str(resp)
             else:
                 answer = str(resp)
+        except admission.Rejected:
+            raise  # LLM quá tải: không trả câu lỗi như một answer (-> 429)
         except Exception as e:
             answer = f"Error calling LLM: {e}"
 
-        self.short_memory.add_message("assistant", answer)
-
-        if len(self.short_memory) >= config.LONG_MEMORY_PUSH_THRESHOLD:
-            self.long_memory.add_memory(self.short_memory.get_context())
-            self.short_memory.clear()
+        conversation.add_message("assistant", answer)
+        self.remember("assistant", answer)
 
         return {"answer": answer, "executed": False}
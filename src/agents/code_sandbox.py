@@ -0,0 +1,227 @@
+# src/agents/code_sandbox.py
+"""
+Sandbox chạy Python code cho CodeAgent bằng pool worker subprocess (pre-warmed trong warmup.probe()).
+- Mỗi worker là 1 process riêng (src/agents/sandbox_worker.py, `python -I`), không kế thừa gì của
+  process API: env tối thiểu (không có GOOGLE_API_KEY, ADMIN_TOKEN...), cwd là thư mục tạm riêng.
+- Server chạy bằng root (image Docker): worker chroot vào thư mục tạm đó, bỏ quyền root sang
+  SANDBOX_USER (mặc định nobody, không fork được) và tách network namespace khi container cho phép
+  (cần CAP_SYS_ADMIN; không được thì vẫn còn mạng). Không phải root -> chỉ có env + cwd + rlimit:
+  snippet thoát được builtins giới hạn (vd qua object.__subclasses__()) vẫn đọc được file / mạng
+  mà user của server đọc được -> production nên chạy bằng root trong container.
+- RLIMIT_AS giới hạn RAM, RLIMIT_CPU giới hạn CPU mỗi lần chạy, RLIMIT_FSIZE = 0 (không ghi file).
+- Parent áp wall-clock timeout: quá hạn -> kill worker và thay bằng worker mới.
+- stdout bị cắt ở SANDBOX_MAX_OUTPUT ký tự.
+- Worker được recycle sau SANDBOX_MAX_RUNS lần chạy hoặc khi crash.
+- Kết quả cache theo sha256(code) (LRU) -> snippet giống hệt không chạy lại. Chỉ cache kết quả
+  chạy xong (output / exception của snippet); timeout, crash, vượt CPU, pool bận phụ thuộc tải
+  lúc chạy nên lần sau chạy lại.
+- builtins bị giới hạn, import chỉ cho phép các module trong ALLOWED_MODULES: chỉ để giảm bề mặt lỗi,
+  KHÔNG phải ranh giới an toàn (bypass được).
+"""
+import atexit
+import hashlib
+import os
+import pwd
+import queue
+import shutil
+import signal
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+from collections import OrderedDict
+from multiprocessing.connection import Connection
+
+from src.agents.sandbox_worker import ALLOWED_MODULES, SAFE_BUILTINS  # noqa: F401  (re-export)
+from src.utils.config_loader import config
+from src.utils.metrics import Counter, record_cache
+
+SANDBOX_RUNS = Counter("code_sandbox_runs_total", "Code sandbox executions", ["outcome"])
+SANDBOX_RECYCLES = Counter("code_sandbox_worker_recycles_total", "Sandbox workers replaced", ["reason"])
+
+# =========================== Parent side ===========================
+WORKER_SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "sandbox_worker.py")
+
+
+def _sandbox_user() -> str:
+    """"uid:gid" của SANDBOX_USER khi server chạy bằng root, "-" = không đổi user."""
+    if os.geteuid() != 0 or not config.SANDBOX_USER:
+        return "-"
+    entry = pwd.getpwnam(config.SANDBOX_USER)
+    return f"{entry.pw_uid}:{entry.pw_gid}"
+
+
+class _Worker:
+    def __init__(self):
+        parent_sock, child_sock = socket.socketpair()
+        user = _sandbox_user()
+        self.workdir = tempfile.mkdtemp(prefix="sandbox-")
+        if user != "-":
+            uid, gid = (int(part) for part in user.split(":"))
+            os.chown(self.workdir, uid, gid)
+        env = {"PATH": "/usr/bin:/bin", "LANG": "C.UTF-8", "HOME": self.workdir, "TMPDIR": self.workdir}
+        self.process = subprocess.Popen(
+            [sys.executable, "-I", WORKER_SCRIPT, str(child_sock.fileno()),
+             str(config.SANDBOX_MEMORY_MB), str(config.SANDBOX_MAX_OUTPUT), user],
+            env=env, cwd=self.workdir, pass_fds=(child_sock.fileno(),),
+            stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+        )
+        child_sock.close()
+        self.conn = Connection(parent_sock.detach())
+        self.runs = 0
+
+    def exitcode(self):
+        """Exit code sau khi process đã thoát (-signal nếu bị kill), None nếu vẫn chạy."""
+        try:
+            return self.process.wait(timeout=1)
+        except subprocess.TimeoutExpired:
+            return None
+
+    def kill(self):
+        try:
+            self.conn.close()
+        except Exception:
+            pass
+        if self.process.poll() is None:
+            self.process.kill()
+        self.exitcode()
+        shutil.rmtree(self.workdir, ignore_errors=True)
+
+
+class SandboxPool:
+    """Pool worker subprocess pre-warmed + cache kết quả theo hash của code."""
+
+    def __init__(self, size: int = None):
+        self.size = size or config.SANDBOX_WORKERS
+        self._idle = queue.Queue()
+        self._cache = OrderedDict()
+        self._cache_lock = threading.Lock()
+        self._closed = False
+        for _ in range(self.size):
+            self._idle.put(_Worker())
+
+    # ---------- cache ----------
+    def _cache_get(self, key):
+        with self._cache_lock:
+            if key in self._cache:
+                self._cache.move_to_end(key)
+                return self._cache[key]
+        return None
+
+    def _cache_put(self, key, value):
+        with self._cache_lock:
+            self._cache[key] = value
+            self._cache.move_to_end(key)
+            while len(self._cache) > config.SANDBOX_CACHE_SIZE:
+                self._cache.popitem(last=False)
+
+    # ---------- workers ----------
+    def _replace(self, worker: _Worker, reason: str):
+        """Kill worker cũ, spawn worker mới ở background để không cộng thêm latency cho request."""
+        SANDBOX_RECYCLES.inc(reason=reason)
+        worker.kill()
+
+        def spawn():
+            if self._closed:
+                return
+            self._idle.put(_Worker())
+            if self._closed:  # shutdown() chạy trong lúc spawn -> dọn luôn worker mới
+                self.shutdown()
+
+        threading.Thread(target=spawn, name="sandbox-respawn", daemon=True).start()
+
+    def _execute(self, code: str) -> tuple:
+        """(outcome, text); outcome: "ok" | "error" | "busy" | "timeout" | "cpu_limit" | "crash"."""
+        try:
+            worker = self._idle.get(timeout=config.SANDBOX_WALL_TIMEOUT)
+        except queue.Empty:
+            SANDBOX_RUNS.inc(outcome="busy")
+            return "busy", "Error: code sandbox is busy, try again later"
+
+        try:
+            worker.conn.send((code, config.SANDBOX_CPU_SECONDS))
+            if not worker.conn.poll(config.SANDBOX_WALL_TIMEOUT):
+                self._replace(worker, "timeout")
+                SANDBOX_RUNS.inc(outcome="timeout")
+                return "timeout", f"Error: execution timed out after {config.SANDBOX_WALL_TIMEOUT:g}s"
+            result = worker.conn.recv()
+        except (EOFError, OSError, BrokenPipeError):
+            exitcode = worker.exitcode()
+            self._replace(worker, "crash")
+            if exitcode == -signal.SIGXCPU:
+                SANDBOX_RUNS.inc(outcome="cpu_limit")
+                return "cpu_limit", f"Error: CPU time limit exceeded ({config.SANDBOX_CPU_SECONDS:g}s)"
+            SANDBOX_RUNS.inc(outcome="crash")
+            return "crash", f"Error: sandbox process crashed (exit code {exitcode})"
+
+        worker.runs += 1
+        if worker.runs >= config.SANDBOX_MAX_RUNS:
+            self._replace(worker, "max_runs")
+        else:
+            self._idle.put(worker)
+
+        output = (result.get("output") or "").strip()
+        if result.get("truncated"):
+            output += f"\n... (output truncated at {config.SANDBOX_MAX_OUTPUT} chars)"
+        if result.get("ok"):
+            SANDBOX_RUNS.inc(outcome="ok")
+            return "ok", output or "(no output)"
+        SANDBOX_RUNS.inc(outcome="error")
+        error = f"Error: {result.get('error')}"
+        return "error", f"{output}\n{error}".strip() if output else error
+
+    def run(self, code: str) -> str:
+        """Chạy code (hoặc lấy từ cache), trả về stdout / thông báo lỗi dạng text."""
+        key = hashlib.sha256(code.encode("utf-8")).hexdigest()
+        cached = self._cache_get(key)
+        record_cache("code_sandbox", cached is not None)
+        if cached is not None:
+            return cached
+        outcome, result = self._execute(code)
+        if outcome in ("ok", "error"):  # timeout / crash / busy: lần sau chạy lại
+            self._cache_put(key, result)
+        return result
+
+    def shutdown(self):
+        self._closed = True
+        while True:
+            try:
+                worker = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            try:
+                worker.conn.send(None)
+            except Exception:
+                pass
+            worker.kill()
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_sandbox_pool() -> SandboxPool:
+    """Pool dùng chung cho mọi CodeAgent (tạo trong warmup.probe(), sau fork; hoặc lần đầu khi cần)."""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = SandboxPool()
+            atexit.register(_shutdown_pool)
+        return _pool
+
+
+def _shutdown_pool():
+    # pool của process hiện tại (sau fork, process con không đụng tới worker của process cha)
+    if _pool is not None:
+        _pool.shutdown()
+
+
+def _after_fork_in_child():
+    # pipe tới worker của process cha không dùng chung được -> process con tạo pool riêng
+    global _pool, _pool_lock
+    _pool = None
+    _pool_lock = threading.Lock()
+
+
+os.register_at_fork(after_in_child=_after_fork_in_child)
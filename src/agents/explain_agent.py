@@ -1,12 +1,11 @@
 # src/agents/explain_agent.py
 from src.agents.base_agent import AgentBase
-from src.agents.memory.memory_manager import MemoryManager
-from src.agents.memory.long_term_memory import LongTermMemory
+from src.agents.memory.long_term_memory import get_long_term_memory
+from src.utils import admission
+from src.utils.circuit_breaker import CircuitOpen
 from src.utils.llm_manager import create_langchain_llm
-from src.vectordb.faiss_index import VectorDB
 from src.utils.config_loader import config
 
-from langchain.chains import create_retrieval_chain
 from langchain.chains.combine_documents import create_stuff_documents_chain
 from langchain_core.prompts import ChatPromptTemplate
 
@@ -14,21 +13,21 @@ from langchain_core.prompts import ChatPromptTemplate
 class ExplainAgent(AgentBase):
     """
     ExplainAgent:
-    - Dùng RetrievalChain (LangChain mới) để lấy context từ FAISS nếu có.
+    - Lấy context từ FAISS (vector_db.search_documents) rồi "stuff" vào prompt nếu có index.
     - Dùng model chuyên cho explain (config.MODEL_EXPLAIN) để trả lời.
     - Nếu FAISS chưa build sẽ fallback gọi LLM trực tiếp.
+    - LLM đang bị ngắt mạch (CircuitOpen) -> trả lỗi ngay, không thử lại bằng call khác.
     """
+    admission_pool = "explain"
 
     def __init__(self):
         super().__init__("ExplainAgent")
 
-        # memory
-        self.short_memory = MemoryManager(max_memory=config.SHORT_MEMORY_MAX)
-        self.long_memory = LongTermMemory()
+        # memory (short-term: self.short_memory của session hiện tại)
+        self.long_memory = get_long_term_memory()
 
-        # vector DB
-        self.vector_db = VectorDB(index_path=config.FAISS_INDEX_PATH)
-        self.retriever = self.vector_db.get_retriever(k=4) if self.vector_db.vectordb else None
+        # vector DB: self.vector_db (AgentBase) = collection của request hiện tại
+        self.retrieval_k = 4
 
         # LLM cho phần giải thích
         self.llm = create_langchain_llm(model_name=config.MODEL_EXPLAIN, temperature=0.2)
@@ -36,15 +35,12 @@ class ExplainAgent(AgentBase):
         # Prompt mới theo ChatPromptTemplate
         self.prompt = ChatPromptTemplate.from_template(
             "You are an AI educator. Explain the question clearly, with examples, and keep concise.\n\n"
+            "Conversation history:\n{history}\n\n"
             "Context:\n{context}\n\nQuestion:\n{input}\nAnswer:"
         )
 
-        # Build retrieval chain (thay thế RetrievalQA)
-        if self.retriever:
-            self.combine_docs_chain = create_stuff_documents_chain(self.llm, self.prompt)
-            self.chain = create_retrieval_chain(self.retriever, self.combine_docs_chain)
-        else:
-            self.chain = None
+        # Chain "stuff documents" (retrieval gọi riêng qua vector_db.search_documents để đo từng stage)
+        self.combine_docs_chain = create_stuff_documents_chain(self.llm, self.prompt)
 
     def _safe_extract_answer(self, obj):
         try:
@@ -58,14 +54,22 @@ class ExplainAgent(AgentBase):
             pass
         return str(obj)
 
-    def run(self, query: str) -> dict:
-        self.short_memory.add_message("user", query)
+    def run(self, query: str, prefetched_docs: list = None) -> dict:
+        conversation = self.conversation()
+        history = self.render_history(conversation)
+        conversation.add_message("user", query)
+        self.remember("user", query)
 
-        if not self.chain:
-            # fallback: không có index
+        if prefetched_docs is None and not self.vector_db.vectordb:
+            # fallback: collection chưa có index
             try:
-                resp = self.llm.invoke(query)
+                with self.stage("llm_answer"):
+                    resp = self.llm.invoke(self.with_history(query, history))
                 answer = self._safe_extract_answer(resp)
+            except admission.Rejected:
+                raise  # LLM quá tải: không trả câu lỗi như một answer (-> 429)
+            except CircuitOpen as e:
+                answer = f"Error calling LLM: {e}"  # LLM đang bị ngắt mạch: không gọi lại ngay
             except Exception:
                 try:
                     resp = self.llm.generate([{"role": "user", "content": query}])
@@ -75,27 +79,38 @@ class ExplainAgent(AgentBase):
             retrieved_texts = []
         else:
             try:
-                result = self.chain.invoke({"input": query})
+                if prefetched_docs is not None:
+                    # router đã retrieval song song với classify_intent
+                    src_docs = prefetched_docs
+                else:
+                    with self.stage("retrieval"):
+                        src_docs = self.vector_db.search_documents(query, k=self.retrieval_k)
+                with self.stage("llm_answer"):
+                    result = self.combine_docs_chain.invoke(
+                        {"input": query, "context": src_docs, "history": history or "(none)"}
+                    )
+            except admission.Rejected:
+                raise
+            except CircuitOpen as e:
+                answer = f"Error calling LLM: {e}"
+                retrieved_texts = []
             except Exception as e:
                 # fallback to direct LLM if chain fails
                 try:
-                    resp = self.llm.invoke(query)
+                    with self.stage("llm_answer"):
+                        resp = self.llm.invoke(self.with_history(query, history))
                     answer = self._safe_extract_answer(resp)
                     retrieved_texts = []
+                except admission.Rejected:
+                    raise
                 except Exception:
                     answer = f"Error running retrieval chain: {e}"
                     retrieved_texts = []
             else:
-                answer = result.get("answer") or result.get("output") or result.get("result") or result.get("output_text") or ""
-                if not answer:
-                    answer = self._safe_extract_answer(result)
-                src_docs = result.get("context") or result.get("source_documents") or []
+                answer = result if isinstance(result, str) else self._safe_extract_answer(result)
                 retrieved_texts = [d.page_content for d in src_docs if hasattr(d, "page_content")]
 
-        self.short_memory.add_message("assistant", answer)
-
-        if len(self.short_memory) >= config.LONG_MEMORY_PUSH_THRESHOLD:
-            self.long_memory.add_memory(self.short_memory.get_context())
-            self.short_memory.clear()
+        conversation.add_message("assistant", answer)
+        self.remember("assistant", answer)
 
         return {"answer": answer, "retrieved": retrieved_texts}
@@ -4,70 +4,99 @@ from dotenv import load_dotenv
 load_dotenv()
 
 # LangChain primitives
-from langchain.chains import create_retrieval_chain
 from langchain.chains.combine_documents import create_stuff_documents_chain
 from langchain_core.prompts import ChatPromptTemplate
-from langchain.text_splitter import RecursiveCharacterTextSplitter
-
-# DuckDuckGo "Run" tool (returns a single summary-like string)
-from langchain_community.tools import DuckDuckGoSearchRun
 
 # Local project modules (keep FAISS + memory + llm factory)
 from src.agents.base_agent import AgentBase
-from src.vectordb.faiss_index import VectorDB
-from src.agents.memory.memory_manager import MemoryManager
-from src.agents.memory.long_term_memory import LongTermMemory
+from src.agents.memory.long_term_memory import get_long_term_memory
 from src.utils.llm_manager import create_langchain_llm
+from src.utils import admission
+from src.utils.circuit_breaker import CircuitOpen, get_breaker
 from src.utils.config_loader import config
+from src.utils.request_context import current, web_search_enabled
+from src.agents.web_retriever import format_passages
+from src.agents.summarizer import WebSummarizer
 
 # Logging
 import logging
+import threading
 logger = logging.getLogger("KnowledgeAgent")
 
 
+def make_web_tool():
+    """DuckDuckGo "Run" tool (returns a single summary-like string); import lazily (chỉ khi bật web search)."""
+    from langchain_community.tools import DuckDuckGoSearchRun
+
+    return DuckDuckGoSearchRun()
+
+
+def make_web_retriever():
+    """Search top N trang -> fetch song song -> rank passage theo embedding (stub thay được khi test)."""
+    from src.agents.web_retriever import WebRetriever
+
+    return WebRetriever()
+
+
 class KnowledgeAgent(AgentBase):
     """
     KnowledgeAgent:
-    - Khi KnowledgeAgent.enable_web_search == True: ALWAYS use DuckDuckGoSearchRun to fetch web info,
-      then summarize + answer via LLM. Memory (short + long) kept.
-    - Khi enable_web_search == False: use FAISS retriever (if exists) + LLM + memory.
+    - Khi request bật web search (request_context.web_search_enabled()): ALWAYS fetch web info
+      (WebRetriever, fallback DuckDuckGoSearchRun); text ngắn đưa thẳng vào prompt, text dài được
+      tóm tắt extractive (hoặc LLM nếu SUMMARY_MODE=llm), rồi answer via LLM. Memory (short + long) kept.
+    - Khi tắt, hoặc khi breaker "search" đang mở (DuckDuckGo chậm / chặn) / pool search đầy: use FAISS retriever
+      (if exists) + LLM + memory.
+    - Agent không giữ state theo request -> 1 instance dùng chung cho mọi request / thread.
     """
-
-    # class-level toggle (can be set from backend GlobalState)
-    enable_web_search = False
+    admission_pool = "knowledge"
 
     def __init__(self):
         # khởi tạo base agent (tên)
         super().__init__("KnowledgeAgent")
 
-        # FAISS vector DB (nếu index tồn tại)
-        self.vector_db = VectorDB(index_path=config.FAISS_INDEX_PATH)
-        # lấy retriever nếu vectordb được khởi tạo thành công
-        self.retriever = self.vector_db.get_retriever(k=4) if self.vector_db.vectordb else None
+        # FAISS vector DB: self.vector_db (AgentBase) = collection của request hiện tại
+        # số document lấy ra mỗi lần retrieval
+        self.retrieval_k = 4
 
         # tạo LLM chuẩn để trả lời (dùng factory của project)
         self.llm = create_langchain_llm(model_name=config.MODEL_KNOWLEDGE, temperature=0.0)
 
-        # memory objects: short-term (conversation buffer) + long-term (persist)
-        self.short_memory = MemoryManager(max_memory=config.SHORT_MEMORY_MAX)
-        self.long_memory = LongTermMemory()
+        # long-term memory (persist); short-term = self.short_memory của session hiện tại (AgentBase)
+        self.long_memory = get_long_term_memory()
 
         # prompt template cho retrieval chain (nếu dùng FAISS)
         self.prompt = ChatPromptTemplate.from_template(
-            "You are an expert assistant. Use the context below to answer clearly.\n\n"
+            "You are an expert assistant. Use the conversation history and the context below to answer clearly.\n\n"
+            "Conversation history:\n{history}\n\n"
             "Context:\n{context}\n\nQuestion:\n{input}\n\nAnswer:"
         )
 
-        # nếu có retriever, build retrieval chain
-        if self.retriever:
-            self.combine_docs_chain = create_stuff_documents_chain(self.llm, self.prompt)
-            self.chain = create_retrieval_chain(self.retriever, self.combine_docs_chain)
-        else:
-            self.chain = None
+        # chain "stuff documents" (retrieval gọi riêng qua vector_db.search_documents để đo được thời gian
+        # retrieval và LLM tách biệt); chỉ dùng khi collection của request có index
+        self.combine_docs_chain = create_stuff_documents_chain(self.llm, self.prompt)
+
+        # tóm tắt web text theo token budget (direct / extractive / llm); embedding model dùng chung của VectorDB
+        self.summarizer = WebSummarizer(llm=self.llm, model_name=config.MODEL_KNOWLEDGE)
+
+        # Web retriever + DuckDuckGo Run tool (fallback): tạo ở lần web search đầu tiên
+        self._web_tool = None
+        self._web_retriever = None
+        self._web_tool_lock = threading.Lock()
+
+    @property
+    def web_retriever(self):
+        with self._web_tool_lock:
+            if self._web_retriever is None:
+                self._web_retriever = make_web_retriever()
+            return self._web_retriever
 
-        # DuckDuckGo Run tool (returns a single synthesized string)
+    @property
+    def web_tool(self):
         # note: DuckDuckGoSearchRun.invoke(query) -> string (summary-like)
-        self.web_tool = DuckDuckGoSearchRun()
+        with self._web_tool_lock:
+            if self._web_tool is None:
+                self._web_tool = make_web_tool()
+            return self._web_tool
 
     # helper robust extract (LLM responses có nhiều dạng)
     def _safe_extract(self, obj):
@@ -85,129 +114,194 @@ class KnowledgeAgent(AgentBase):
     # web_search_tool: dùng DuckDuckGoSearchRun.invoke để trả về 1 chuỗi
     def web_search_tool(self, query: str) -> str:
         """
-        Run DuckDuckGoSearchRun.invoke(query) and return cleaned text.
-        This returns one synthesized string (ideal for direct LLM summarization).
+        Web retriever: top trang -> fetch song song -> top passage theo embedding (kèm url).
+        Không có passage nào -> fallback DuckDuckGoSearchRun.invoke(query) (1 chuỗi tổng hợp).
         """
+        breaker = get_breaker("search")
+        try:
+            with self.stage("web_retrieve"), breaker.guard():
+                passages = self.web_retriever.retrieve(query)
+            if passages:
+                logger.info(f"[WEB] {len(passages)} passages for {query!r}")
+                return format_passages(passages)
+        except admission.Rejected:
+            self._mark_search_degraded()  # backend search quá tải -> run() xuống FAISS path
+            return ""
+        except CircuitOpen as e:
+            logger.info(f"[WEB] {e}")
+            return ""
+        except Exception as e:
+            logger.exception(f"[WEB] retriever error, falling back to DuckDuckGoRun: {e}")
         try:
             logger.info(f"[WEB] DuckDuckGoRun searching for: {query!r}")
-            raw = self.web_tool.invoke(query)  # returns a string summary-like
+            with admission.slot("search"), self.stage("web_search"), breaker.guard():
+                raw = self.web_tool.invoke(query)  # returns a string summary-like
             if not raw:
                 logger.info("[WEB] DuckDuckGo returned empty.")
                 return ""
             # normalize whitespace, truncate to avoid huge context
             text = " ".join(str(raw).split())
             return text[:8000]  # keep a big slice but safe
+        except admission.Rejected:
+            self._mark_search_degraded()
+            return ""
+        except CircuitOpen as e:
+            logger.info(f"[WEB] {e}")
+            return ""
         except Exception as e:
             logger.exception(f"[WEB] DuckDuckGo error: {e}")
             return ""
 
-    # summary_tool: nếu cần tách block dài và tóm tắt (dùng LLM)
-    def summary_tool(self, text: str) -> str:
+    @staticmethod
+    def _mark_search_degraded():
+        """Web path không dùng được trong request này (breaker mở / pool search đầy)."""
+        ctx = current()
+        if ctx is not None:
+            ctx.add_degraded("web_search")
+
+    @staticmethod
+    def search_unavailable() -> bool:
+        """
+        Breaker "search" đang mở, hoặc pool search đã từ chối request này -> bỏ web path
+        (ghi "web_search" vào degraded của request).
+        """
+        ctx = current()
+        if ctx is not None and "web_search" in ctx.degraded:
+            return True
+        if not get_breaker("search").is_open():
+            return False
+        KnowledgeAgent._mark_search_degraded()
+        return True
+
+    # summary_tool: web text -> context cho prompt (chỉ gọi LLM khi SUMMARY_MODE=llm và text dài)
+    def summary_tool(self, query: str, text: str) -> str:
         """
-        Optionally chunk & summarize a long web string using the LLM.
-        Keeps memory of chunks small and robust.
+        Token-budget policy (xem WebSummarizer): text ngắn giữ nguyên, text dài tóm tắt extractive.
         """
         try:
-            splitter = RecursiveCharacterTextSplitter(chunk_size=2000, chunk_overlap=200)
-            chunks = splitter.split_text(text)
-            summaries = []
-            for chunk in chunks:
-                prompt = f"Summarize concisely the following text to support an answer:\n\n{chunk}"
-                resp = self.llm.invoke(prompt)
-                summaries.append(self._safe_extract(resp))
-            # join chunk summaries into one paragraph
-            return " ".join(summaries).strip()
+            summary, mode = self.summarizer.summarize(query, text)
+            logger.info(f"[SUMMARY] mode={mode}")
+            return summary
         except Exception as e:
             logger.exception(f"[SUMMARY] error: {e}")
             return text[:2000] if text else ""
 
+    def answer_from_docs(self, query: str, docs: list, history: str = "") -> str:
+        """1 LLM call trả lời từ các Document đã retrieval (không đọc / ghi memory)."""
+        if not docs:
+            with self.stage("llm_answer"):
+                return self._safe_extract(self.llm.invoke(self.with_history(query, history)))
+        # combine_docs_chain trả về string (đã qua output parser)
+        with self.stage("llm_answer"):
+            result = self.combine_docs_chain.invoke({"input": query, "context": docs, "history": history or "(none)"})
+        return result if isinstance(result, str) else self._safe_extract(result)
+
     # main run pipeline
-    def run(self, query: str) -> dict:
+    def run(self, query: str, prefetched_docs: list = None) -> dict:
         """
         Behavior:
         - always record user message in short memory
-        - if class toggle enable_web_search True -> use web_search_tool -> summary_tool -> llm to answer
-        - else -> try FAISS retrieval chain -> LLM; fallback to direct LLM
+        - prompts include the session history (rolling summary + last turns, token-bounded)
+        - if the request's web_search toggle is on -> use web_search_tool -> summary_tool (direct / extractive
+          / llm by token budget) -> llm to answer
+        - else -> try FAISS retrieval (or prefetched_docs from the router) -> LLM; fallback to direct LLM
+          (not when the LLM was rejected -> 429, or its circuit is open -> error answer, no retry)
         - push short memory to long memory when threshold reached
         """
-        logger.info(f"[RUN] query={query!r} web_toggle={KnowledgeAgent.enable_web_search}")
-        # save user message to short memory
-        self.short_memory.add_message("user", query)
+        web_search = web_search_enabled()
+        logger.info(f"[RUN] query={query!r} web_toggle={web_search}")
+        # history của session (render trước khi thêm câu hỏi hiện tại)
+        conversation = self.conversation()
+        history = self.render_history(conversation)
+        conversation.add_message("user", query)
+        # save user message to the session's short memory
+        self.remember("user", query)
+
+        # search đang bị ngắt mạch -> trả lời từ FAISS ngay, không chờ DuckDuckGo timeout
+        if web_search and self.search_unavailable():
+            logger.info("[RUN] Search circuit open -> FAISS path.")
+            web_search = False
 
         # if web_search toggle is enabled -> force web path
-        if KnowledgeAgent.enable_web_search:
+        if web_search:
             logger.info("[RUN] Forced web-search path (toggle ON).")
             web_text = self.web_search_tool(query)
             if web_text:
-                # optional: summarize long web_text into concise summary
-                summary = self.summary_tool(web_text)
+                # text dài -> tóm tắt (mặc định extractive, không gọi LLM); text ngắn giữ nguyên
+                with self.stage("summary_tool"):
+                    summary = self.summary_tool(query, web_text)
                 # ask LLM to produce a natural answer based on the web summary
                 prompt = (
-                    "You are an assistant. Use the web summary below to answer the user's question clearly and concisely.\n\n"
-                    f"Web summary:\n{summary}\n\nQuestion:\n{query}\n\nAnswer:"
+                    "You are an assistant. Use the web context below to answer the user's question clearly and concisely.\n\n"
+                    f"Conversation history:\n{history or '(none)'}\n\n"
+                    f"Web context:\n{summary}\n\nQuestion:\n{query}\n\nAnswer:"
                 )
                 try:
-                    resp = self.llm.invoke(prompt)
+                    with self.stage("llm_answer"):
+                        resp = self.llm.invoke(prompt)
                     answer = self._safe_extract(resp)
+                except admission.Rejected:
+                    raise  # LLM quá tải: không trả câu lỗi như một answer (-> 429)
                 except Exception as e:
                     logger.exception(f"[LLM] error when answering from web summary: {e}")
                     answer = "Error: failed to produce answer from web summary."
 
-                # store assistant reply
-                self.short_memory.add_message("assistant", answer)
-
-                # push to long term memory if threshold exceeded
-                if len(self.short_memory) >= config.LONG_MEMORY_PUSH_THRESHOLD:
-                    conv = self.short_memory.get_context()
-                    self.long_memory.add_memory(conv)
-                    self.short_memory.clear()
+                # store assistant reply (pushes to long term memory if threshold exceeded)
+                conversation.add_message("assistant", answer)
+                self.remember("assistant", answer)
 
                 return {"answer": answer, "retrieved": [summary], "source": "web"}
 
             # no web result -> return informative message (but still keep memory)
-            logger.info("[RUN] Web search returned empty. Returning no-results message.")
-            nores = "Không tìm thấy kết quả web phù hợp."
-            self.short_memory.add_message("assistant", nores)
-            if len(self.short_memory) >= config.LONG_MEMORY_PUSH_THRESHOLD:
-                conv = self.short_memory.get_context()
-                self.long_memory.add_memory(conv)
-                self.short_memory.clear()
-            return {"answer": nores, "retrieved": [], "source": "web"}
+            if not self.search_unavailable():
+                logger.info("[RUN] Web search returned empty. Returning no-results message.")
+                nores = "Không tìm thấy kết quả web phù hợp."
+                conversation.add_message("assistant", nores)
+                self.remember("assistant", nores)
+                return {"answer": nores, "retrieved": [], "source": "web"}
+            # search vừa bị ngắt mạch / pool search từ chối trong request này -> xuống FAISS path bên dưới
+            logger.info("[RUN] Search circuit opened -> FAISS path.")
 
         # else: web toggle off -> use FAISS retrieval if available
         logger.info("[RUN] FAISS/Local path (toggle OFF).")
-        if self.chain:
+        answer = None
+        if prefetched_docs is not None or self.vector_db.vectordb:
             try:
-                # chain.invoke returns a dict-like object with 'answer' or 'output'
-                result = self.chain.invoke({"input": query})
-                # robust extract
-                answer = result.get("answer") or result.get("output") or result.get("result") or ""
-                # attempt to extract source documents text
-                source_docs = result.get("context") or result.get("source_documents") or []
+                if prefetched_docs is not None:
+                    # router đã retrieval song song với classify_intent
+                    source_docs = prefetched_docs
+                else:
+                    with self.stage("retrieval"):
+                        source_docs = self.vector_db.search_documents(query, k=self.retrieval_k)
+                answer = self.answer_from_docs(query, source_docs, history)
                 retrieved_texts = [d.page_content for d in source_docs if hasattr(d, "page_content")]
                 if answer:
-                    self.short_memory.add_message("assistant", answer)
-                    if len(self.short_memory) >= config.LONG_MEMORY_PUSH_THRESHOLD:
-                        conv = self.short_memory.get_context()
-                        self.long_memory.add_memory(conv)
-                        self.short_memory.clear()
+                    conversation.add_message("assistant", answer)
+                    self.remember("assistant", answer)
                     return {"answer": answer, "retrieved": retrieved_texts, "source": "faiss"}
+            except admission.Rejected:
+                raise  # LLM quá tải: không gọi lại bằng direct path (-> 429)
+            except CircuitOpen as e:
+                # LLM đang bị ngắt mạch: direct path cũng sẽ bị chặn -> trả lỗi ngay, không gọi lại
+                logger.info(f"[LLM] {e}")
+                answer = "Xin lỗi, tôi không thể trả lời ngay lúc này."
             except Exception as e:
                 logger.exception(f"[FAISS] retrieval error: {e}")
 
         # fallback: direct LLM answer (no web)
-        try:
-            resp = self.llm.invoke(query)
-            answer = self._safe_extract(resp)
-        except Exception as e:
-            logger.exception(f"[LLM] direct call failed: {e}")
-            answer = "Xin lỗi, tôi không thể trả lời ngay lúc này."
+        if not answer:
+            try:
+                with self.stage("llm_answer"):
+                    resp = self.llm.invoke(self.with_history(query, history))
+                answer = self._safe_extract(resp)
+            except admission.Rejected:
+                raise
+            except Exception as e:
+                logger.exception(f"[LLM] direct call failed: {e}")
+                answer = "Xin lỗi, tôi không thể trả lời ngay lúc này."
 
         # save assistant reply and push memory if needed
-        self.short_memory.add_message("assistant", answer)
-        if len(self.short_memory) >= config.LONG_MEMORY_PUSH_THRESHOLD:
-            conv = self.short_memory.get_context()
-            self.long_memory.add_memory(conv)
-            self.short_memory.clear()
+        conversation.add_message("assistant", answer)
+        self.remember("assistant", answer)
 
         return {"answer": answer, "retrieved": [], "source": "model"}
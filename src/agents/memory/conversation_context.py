@@ -0,0 +1,200 @@
+# src/agents/memory/conversation_context.py
+"""
+Context hội thoại cho prompt (mỗi session 1 object, cache trong RAM):
+- Giữ nguyên văn vài message gần nhất (CONTEXT_RECENT_TURNS).
+- Message cũ hơn được gộp dần vào 1 rolling summary: mỗi lần chỉ gửi LLM
+  (summary hiện tại + 1 message mới bị đẩy ra) -> chi phí mỗi lượt là hằng số.
+- render() luôn nằm trong trần CONTEXT_MAX_TOKENS -> prompt không phình theo độ dài hội thoại,
+  và không bao giờ chờ LLM gộp (gộp chỉ chạy ở background).
+- Session có tên: state (summary, recent, message chờ gộp) nằm trong file của session
+  (<SESSION_MEMORY_DIR>/<key>.context.json), là nguồn chung của mọi worker process: đọc lại khi
+  file đổi, ghi theo read-merge-write dưới file lock; kết quả gộp chỉ được ghi nếu state chưa bị
+  worker khác gộp trước (so summary + message đầu hàng chờ).
+"""
+import os
+import threading
+from collections import OrderedDict, deque
+
+from src.agents.memory import memory_manager
+from src.utils.concurrency import submit
+from src.utils import token_usage
+from src.utils.file_store import file_version, locked, read_json, write_json
+from src.utils.config_loader import config
+from src.utils.llm_manager import create_langchain_llm
+from src.utils.metrics import record_cache, timed
+from src.utils.request_context import current, current_session_id
+from src.utils.tokens import count_tokens, truncate_to_tokens
+
+FOLD_PROMPT = (
+    "You maintain a running summary of a conversation between a user and an assistant.\n"
+    "Update the summary with the new message. Keep names, topics, definitions and decisions "
+    "that later questions may refer to. Reply with the updated summary only, at most {max_words} words.\n\n"
+    "Current summary:\n{summary}\n\nNew message:\n{message}\n\nUpdated summary:"
+)
+
+
+class ConversationContext:
+    """Rolling summary + các message gần nhất của 1 session (state_file=None: chỉ trong RAM)."""
+
+    def __init__(self, recent_turns: int = None, max_tokens: int = None, summary_max_tokens: int = None,
+                 state_file: str = None):
+        self.recent_turns = recent_turns or config.CONTEXT_RECENT_TURNS
+        self.max_tokens = max_tokens or config.CONTEXT_MAX_TOKENS
+        self.summary_max_tokens = summary_max_tokens or config.CONTEXT_SUMMARY_MAX_TOKENS
+        self.summary = ""
+        self.recent = deque()
+        self._to_fold = deque()  # message đã rời cửa sổ recent, chờ gộp vào summary (giữ thứ tự)
+        self._lock = threading.Lock()
+        self._fold_lock = threading.Lock()
+        self.state_file = state_file
+        self._version = None  # file_version lúc đọc / ghi gần nhất
+        with self._lock:
+            self._reload()
+
+    # ------------------------------------------------------------------ state chung giữa worker
+    def _reload(self, force: bool = False):
+        """Nạp state từ file nếu worker khác đã ghi (gọi khi đang giữ self._lock)."""
+        if self.state_file is None:
+            return
+        version = file_version(self.state_file)
+        if version is None or (version == self._version and not force):
+            return
+        state = read_json(self.state_file)
+        if isinstance(state, dict):
+            self.summary = state.get("summary", "")
+            self.recent = deque(state.get("recent", []))
+            self._to_fold = deque(state.get("to_fold", []))
+        self._version = version
+
+    def _save(self):
+        """Ghi state ra file (gọi khi đang giữ self._lock + locked(state_file))."""
+        if self.state_file is None:
+            return
+        write_json(self.state_file, {
+            "summary": self.summary, "recent": list(self.recent), "to_fold": list(self._to_fold),
+        })
+        self._version = file_version(self.state_file)
+
+    def _fold(self, summary: str, message: dict) -> str:
+        """Summary mới = summary + 1 message (delta) qua 1 LLM call; lỗi thì nối thô rồi cắt theo budget."""
+        line = f"{message['role']}: {message['content']}"
+        if token_usage.should_degrade("context_fold", need=2 * self.summary_max_tokens):
+            return truncate_to_tokens(f"{summary}\n{line}".strip(), self.summary_max_tokens, keep="tail")
+        try:
+            with timed("memory.context_fold"):
+                llm = create_langchain_llm(model_name=config.MODEL_MEMORY, temperature=0.0)
+                resp = llm.invoke(FOLD_PROMPT.format(
+                    max_words=int(self.summary_max_tokens * 0.7),
+                    summary=summary or "(empty)",
+                    message=truncate_to_tokens(line, self.summary_max_tokens),
+                ))
+            updated = resp.content if hasattr(resp, "content") else str(resp)
+        except Exception as e:
+            print(f"[ConversationContext] fold error: {e}")
+            updated = f"{summary}\n{line}".strip()
+        return truncate_to_tokens(updated.strip(), self.summary_max_tokens, keep="tail")
+
+    def _drain(self):
+        """
+        Gộp lần lượt các message đang chờ. LLM call chạy ngoài self._lock (add_message / render không
+        phải chờ nó); _fold_lock giữ cho các lần gộp nối tiếp nhau theo đúng thứ tự message.
+        Message chỉ rời _to_fold khi summary mới đã có -> render() không lúc nào thiếu nó.
+        Worker khác đã gộp trước (summary / message đầu hàng chờ đã đổi) -> bỏ kết quả, gộp tiếp từ state mới.
+        """
+        with self._fold_lock:
+            while True:
+                with self._lock, locked(self.state_file):
+                    self._reload(force=True)
+                    if not self._to_fold:
+                        return
+                    message = self._to_fold[0]
+                    summary = self.summary
+                updated = self._fold(summary, message)
+                with self._lock, locked(self.state_file):
+                    self._reload(force=True)
+                    if self.summary == summary and self._to_fold and self._to_fold[0] == message:
+                        self.summary = updated
+                        self._to_fold.popleft()
+                        self._save()
+
+    def add_message(self, role: str, content: str):
+        """
+        Thêm 1 message. Message bị đẩy khỏi cửa sổ recent được gộp vào summary
+        ở background (request hiện tại không phải chờ LLM tóm tắt).
+        """
+        with self._lock, locked(self.state_file):
+            self._reload(force=True)
+            self.recent.append({"role": role, "content": content})
+            while len(self.recent) > self.recent_turns:
+                self._to_fold.append(self.recent.popleft())
+            self._save()
+            if self._to_fold:
+                submit(self._drain)
+
+    def render(self, max_tokens: int = None) -> str:
+        """
+        Block history để chèn vào prompt (rỗng nếu chưa có hội thoại), luôn <= max_tokens.
+        Không chờ LLM gộp: dùng summary đã gộp xong + nguyên văn các message còn chờ gộp
+        (cũ hơn recent) -> request không phải trả chi phí tóm tắt.
+        """
+        with self._lock:
+            self._reload()
+            summary = self.summary
+            messages = list(self._to_fold) + list(self.recent)
+
+        lines = [f"{m['role']}: {m['content']}" for m in messages]
+        budget = self.max_tokens if max_tokens is None else min(max_tokens, self.max_tokens)
+        if budget <= 0:
+            return ""
+        parts = []
+        if summary:
+            summary = truncate_to_tokens(summary, min(self.summary_max_tokens, budget), keep="tail")
+            parts.append(f"Summary of earlier conversation:\n{summary}")
+            budget -= count_tokens(parts[0])
+
+        # giữ các message mới nhất trước, bỏ dần message cũ khi vượt budget
+        kept = []
+        for line in reversed(lines):
+            cost = count_tokens(line)
+            if cost > budget:
+                if not kept and budget > 0:
+                    kept.append(truncate_to_tokens(line, budget, keep="tail"))
+                break
+            kept.append(line)
+            budget -= cost
+        if kept:
+            parts.append("Recent messages:\n" + "\n".join(reversed(kept)))
+        return "\n\n".join(parts)
+
+
+_contexts = OrderedDict()
+_contexts_lock = threading.Lock()
+
+
+def session_context_file(session_id: str) -> str:
+    """File state context của session, cạnh file short-term memory của session."""
+    return os.path.join(memory_manager.SESSION_MEMORY_DIR, f"{memory_manager.session_key(session_id)}.context.json")
+
+
+def get_conversation_context(session_id: str = None) -> ConversationContext:
+    """
+    Context của session (mặc định: session của request hiện tại), LRU giới hạn CONTEXT_MAX_SESSIONS.
+    Object trong RAM chỉ là cache: file của session là nguồn chung của mọi worker (đọc lại khi file đổi).
+    Request không gửi session_id -> context riêng của request đó (bỏ khi request xong), không dùng
+    chung "default" giữa các người dùng ẩn danh.
+    """
+    if session_id is None:
+        ctx = current()
+        if ctx is not None and ctx.session_id is None:
+            return ctx.resource("conversation_context", ConversationContext)
+        session_id = current_session_id()
+    with _contexts_lock:
+        ctx = _contexts.get(session_id)
+        record_cache("conversation_context", ctx is not None)
+        if ctx is None:
+            ctx = _contexts[session_id] = ConversationContext(state_file=session_context_file(session_id))
+            while len(_contexts) > config.CONTEXT_MAX_SESSIONS:
+                _contexts.popitem(last=False)
+        else:
+            _contexts.move_to_end(session_id)
+        return ctx
@@ -1,71 +1,183 @@
 # src/agents/memory/long_term_memory.py
 
 import os
+import threading
+import time
 import faiss
 import numpy as np
 from datetime import datetime
-from dotenv import load_dotenv
-from sentence_transformers import SentenceTransformer
-from google import generativeai as genai
 
-# load .env để lấy GEMINI_API_KEY
-load_dotenv()
-# cấu hình Gemini API key
-genai.configure(api_key=os.getenv("GEMINI_API_KEY"))
+from src.utils import token_usage
+from src.utils.config_loader import config
+from src.utils.file_store import file_version, locked
+from src.utils.llm_manager import create_langchain_llm
+from src.utils.metrics import Counter, Gauge, Histogram, timed
+from src.utils.tokens import count_tokens, truncate_to_tokens
+
+LTM_SIZE = Gauge("long_term_memory_size", "Entries in long-term memory")
+LTM_EVENTS = Counter("long_term_memory_events_total", "Long-term memory add / merge / evict events", ["event"])
+LTM_SEARCH = Histogram("long_term_memory_search_seconds", "Long-term memory search latency")
+
+META_VERSION = 2
+
 
 class LongTermMemory:
     """
     Lưu và truy xuất ký ức dài hạn:
-      - Tóm tắt conversation text bằng Gemini (gemini-2.5-flash)
-      - Sinh embedding cho summary bằng SentenceTransformer
-      - Thêm vào FAISS index và lưu metadata
+      - Tóm tắt conversation text bằng Gemini (config.MODEL_MEMORY, client dùng chung)
+      - Sinh embedding (chuẩn hóa L2) cho summary bằng SentenceTransformer
+      - FAISS IndexIDMap2(IndexFlatIP) -> inner product = cosine, xóa được theo id
+      - Summary mới gần trùng (cosine >= LONG_MEMORY_MERGE_THRESHOLD) được gộp vào entry cũ:
+        nối 2 summary (cắt theo LONG_MEMORY_SUMMARY_MAX_TOKENS, giữ phần mới) rồi embed lại
+      - Giới hạn LONG_MEMORY_CAPACITY entry, evict theo recency + usage; usage (hits) = số lần entry
+        được truy xuất hoặc chủ đề của nó quay lại (gộp)
+      - File trên đĩa là nguồn chung của mọi worker process: ghi theo read-merge-write dưới file lock
+        (nạp lại trước nếu worker khác đã ghi), search nạp lại khi file đổi
     """
 
     def __init__(self,
                  memory_index_path="data/processed/memory_index.faiss",
                  meta_path="data/processed/memory_meta.npy",
-                 embed_model_name="all-MiniLM-L6-v2"):
+                 embed_model_name="all-MiniLM-L6-v2",
+                 capacity: int = None,
+                 merge_threshold: float = None,
+                 embedder=None):
         # Đường dẫn lưu index FAISS
         self.memory_index_path = memory_index_path
-        # Đường dẫn lưu metadata (list of dict)
+        # Đường dẫn lưu metadata (dict id -> entry)
         self.meta_path = meta_path
 
-        # Model embedder (SentenceTransformer) -> trả về dim = 384
-        self.embedder = SentenceTransformer(embed_model_name)
-        self.dimension = 384  # fixed for all-MiniLM-L6-v2
+        self.capacity = capacity or config.LONG_MEMORY_CAPACITY
+        self.merge_threshold = merge_threshold if merge_threshold is not None else config.LONG_MEMORY_MERGE_THRESHOLD
 
-        # Khởi tạo FAISS index dạng L2 flat
-        self.index = faiss.IndexFlatL2(self.dimension)
+        # Model embedder (SentenceTransformer) -> trả về dim = 384; có thể truyền embedder khác (test / dùng chung)
+        if embedder is None:
+            from sentence_transformers import SentenceTransformer  # import chậm (torch) -> chỉ khi cần
 
-        # Danh sách metadata (mỗi phần tử: {"timestamp":..., "summary":...})
-        self.memory_texts = []
+            embedder = SentenceTransformer(embed_model_name)
+        self.embedder = embedder
+        self.dimension = 384  # fixed for all-MiniLM-L6-v2
+
+        self.index = self._new_index()
+        # id -> {"timestamp", "summary", "last_used", "hits", "merged"}
+        self.entries = {}
+        self.next_id = 0
+        self.stats_counters = {"adds": 0, "merges": 0, "evictions": 0, "searches": 0, "search_seconds": 0.0}
+        self._lock = threading.RLock()
+        self._version = None  # file_version(meta_path) lúc đọc / ghi gần nhất
 
         # Nếu index/meta đã tồn tại, load chúng lên
         if os.path.exists(self.memory_index_path) and os.path.exists(self.meta_path):
-            self._load_memory()
+            with locked(self.meta_path):
+                self._load_memory()
+        LTM_SIZE.set(len(self.entries))
+
+    # ------------------------------------------------------------------ storage
+    def _new_index(self):
+        return faiss.IndexIDMap2(faiss.IndexFlatIP(self.dimension))
+
+    def _embed(self, texts: list) -> np.ndarray:
+        emb = np.asarray(self.embedder.encode(texts), dtype=np.float32).reshape(len(texts), -1)
+        faiss.normalize_L2(emb)
+        return emb
+
+    @property
+    def memory_texts(self) -> list:
+        """Danh sách entry (tương thích code cũ: list of {"timestamp", "summary"})."""
+        return [self.entries[i] for i in sorted(self.entries)]
 
     def _save_memory(self):
         """
         Lưu index và metadata ra đĩa.
         - index: .faiss
-        - metadata: numpy file chứa list -> dễ load lại
+        - metadata: numpy file chứa dict (version, next_id, entries, stats)
         """
-        faiss.write_index(self.index, self.memory_index_path)
-        np.save(self.meta_path, np.array(self.memory_texts, dtype=object), allow_pickle=True)
+        # ghi ra file tạm rồi os.replace -> worker khác không bao giờ đọc phải file ghi dở
+        tmp_index = f"{self.memory_index_path}.{os.getpid()}.tmp"
+        faiss.write_index(self.index, tmp_index)
+        meta = {
+            "version": META_VERSION,
+            "next_id": self.next_id,
+            "entries": self.entries,
+            "stats": self.stats_counters,
+        }
+        tmp_meta = f"{self.meta_path}.{os.getpid()}.tmp"
+        with open(tmp_meta, "wb") as f:
+            np.save(f, np.array(meta, dtype=object), allow_pickle=True)
+        os.replace(tmp_index, self.memory_index_path)
+        os.replace(tmp_meta, self.meta_path)
+        self._version = file_version(self.meta_path)
+
+    def _refresh(self):
+        """Worker khác đã ghi file từ lần đọc / ghi trước -> nạp lại (gọi trong locked(meta_path))."""
+        version = file_version(self.meta_path)
+        if version is not None and version != self._version and os.path.exists(self.memory_index_path):
+            self._load_memory()
 
     def _load_memory(self):
         """
         Load index và metadata từ đĩa nếu có.
+        Format cũ (IndexFlatL2 + list summary) được chuyển sang format mới bằng cách embed lại.
         """
-        self.index = faiss.read_index(self.memory_index_path)
-        self.memory_texts = np.load(self.meta_path, allow_pickle=True).tolist()
+        raw = np.load(self.meta_path, allow_pickle=True)
+        meta = raw.item() if raw.shape == () else None
+        if isinstance(meta, dict) and meta.get("version") == META_VERSION:
+            self.index = faiss.read_index(self.memory_index_path)
+            self.entries = meta["entries"]
+            self.next_id = meta["next_id"]
+            self.stats_counters.update(meta.get("stats", {}))
+            self._version = file_version(self.meta_path)
+            return
+
+        # legacy: list of {"timestamp", "summary"} theo thứ tự vị trí trong IndexFlatL2
+        legacy = raw.tolist()
+        self.index = self._new_index()
+        self.entries = {}
+        self.next_id = 0
+        for item in legacy:
+            self._insert(item["summary"], self._embed([item["summary"]]), timestamp=item.get("timestamp"))
+        self._save_memory()
+
+    # ------------------------------------------------------------------ write path
+    def _insert(self, summary: str, emb: np.ndarray, timestamp: str = None) -> int:
+        mem_id = self.next_id
+        self.next_id += 1
+        self.index.add_with_ids(emb, np.array([mem_id], dtype=np.int64))
+        now = timestamp or datetime.now().isoformat()
+        self.entries[mem_id] = {"timestamp": now, "summary": summary, "last_used": time.time(), "hits": 0, "merged": 0}
+        return mem_id
+
+    def _eviction_score(self, entry: dict) -> float:
+        """Điểm giữ lại: càng mới dùng và càng hay được truy xuất thì càng cao."""
+        return entry["last_used"] + entry["hits"] * config.LONG_MEMORY_HIT_BONUS_SECONDS
+
+    def _evict_if_needed(self):
+        while len(self.entries) > self.capacity:
+            victim = min(self.entries, key=lambda i: self._eviction_score(self.entries[i]))
+            self.index.remove_ids(np.array([victim], dtype=np.int64))
+            del self.entries[victim]
+            self.stats_counters["evictions"] += 1
+            LTM_EVENTS.inc(event="evict")
+
+    @staticmethod
+    def _combine(old: str, new: str) -> str:
+        """Summary sau khi gộp: giữ chi tiết của cả 2 (bỏ phần lặp nguyên văn), trong trần token."""
+        if new in old:
+            return old
+        combined = new if old in new else f"{old}\n{new}"
+        return truncate_to_tokens(combined, config.LONG_MEMORY_SUMMARY_MAX_TOKENS, keep="tail")
 
     def summarize_conversation(self, conversation_text: str) -> str:
+        # token budget sắp hết -> lưu đoạn đầu của hội thoại thay vì gọi LLM tóm tắt
+        if token_usage.should_degrade("memory_summary", need=count_tokens(conversation_text) + 200):
+            return conversation_text[:200]
         try:
-            model = genai.GenerativeModel("gemini-2.5-flash")
-            prompt = f"Summarize the following conversation briefly, preserving main points and decisions:\n\n{conversation_text}"
-            response = model.generate_content(prompt)
-            return response.text.strip() if response.text else conversation_text[:200]
+            with timed("memory.summarize"):
+                llm = create_langchain_llm(model_name=config.MODEL_MEMORY, temperature=0.0)
+                prompt = f"Summarize the following conversation briefly, preserving main points and decisions:\n\n{conversation_text}"
+                response = llm.invoke(prompt)
+            text = response.content if hasattr(response, "content") else str(response)
+            return text.strip() if text else conversation_text[:200]
         except Exception as e:
             print(f"[LongTermMemory] Summarization error: {e}")
             # fallback để tránh crash khi API lỗi
@@ -75,38 +187,118 @@ class LongTermMemory:
         """
         Thêm 1 memory long-term:
         - Tóm tắt conversation_text
-        - Tạo embedding
-        - Thêm vào FAISS + metadata
+        - Tạo embedding (chuẩn hóa)
+        - Nếu gần trùng entry cũ -> gộp (nối 2 summary, embed lại, tính 1 hit cho entry), ngược lại thêm mới
+        - Evict khi vượt capacity, rồi lưu xuống đĩa
         """
         # tóm tắt
         summary = self.summarize_conversation(conversation_text)
-        # tạo embedding (mảng shape (1, dim))
-        emb = self.embedder.encode([summary]).astype(np.float32)
-        # add embedding vào faiss index
-        self.index.add(emb)
-        # thêm metadata
-        self.memory_texts.append({
-            "timestamp": datetime.now().isoformat(),
-            "summary": summary
-        })
-        # lưu state xuống đĩa
-        self._save_memory()
+        with timed("memory.long_term_add"):
+            emb = self._embed([summary])
+            with self._lock, locked(self.meta_path):
+                self._refresh()
+                self.stats_counters["adds"] += 1
+                LTM_EVENTS.inc(event="add")
+                merged_into = None
+                if self.index.ntotal > 0 and self.merge_threshold <= 1.0:
+                    scores, ids = self.index.search(emb, 1)
+                    if ids[0][0] >= 0 and scores[0][0] >= self.merge_threshold:
+                        merged_into = int(ids[0][0])
 
+                if merged_into is not None:
+                    old = self.entries[merged_into]
+                    combined = self._combine(old["summary"], summary)
+                    if combined != summary:
+                        emb = self._embed([combined])
+                    self.index.remove_ids(np.array([merged_into], dtype=np.int64))
+                    self.index.add_with_ids(emb, np.array([merged_into], dtype=np.int64))
+                    old.update({
+                        "summary": combined,
+                        "timestamp": datetime.now().isoformat(),
+                        "last_used": time.time(),
+                        # chủ đề quay lại = 1 lần dùng (agent không gọi retrieve_relevant_memory)
+                        "hits": old["hits"] + 1,
+                        "merged": old.get("merged", 0) + 1,
+                    })
+                    self.stats_counters["merges"] += 1
+                    LTM_EVENTS.inc(event="merge")
+                else:
+                    self._insert(summary, emb)
+                    self._evict_if_needed()
+
+                LTM_SIZE.set(len(self.entries))
+                # lưu state xuống đĩa
+                self._save_memory()
+
+    # ------------------------------------------------------------------ read path
     def retrieve_relevant_memory(self, query: str, top_k: int = 3) -> list:
         """
-        Với 1 query, trả về top_k summary liên quan nhất từ long-term memory.
+        Với 1 query, trả về top_k summary liên quan nhất (cosine) từ long-term memory.
         """
         # nếu chưa có memory thì trả rỗng
-        if len(self.memory_texts) == 0:
+        if not self.entries:
             return []
 
-        # tạo embedding cho query
-        q_emb = self.embedder.encode([query]).astype(np.float32)
-        # search faiss index
-        D, I = self.index.search(q_emb, top_k)
-        # map indices sang summaries (bảo đảm i < len)
-        results = []
-        for i in I[0]:
-            if i < len(self.memory_texts):
-                results.append(self.memory_texts[i]["summary"])
+        q_emb = self._embed([query])
+        with self._lock:
+            with locked(self.meta_path):
+                self._refresh()
+            if not self.entries:
+                return []
+            start = time.perf_counter()
+            scores, ids = self.index.search(q_emb, min(top_k, len(self.entries)))
+            elapsed = time.perf_counter() - start
+            LTM_SEARCH.observe(elapsed)
+            self.stats_counters["searches"] += 1
+            self.stats_counters["search_seconds"] += elapsed
+
+            results = []
+            now = time.time()
+            for mem_id in ids[0]:
+                entry = self.entries.get(int(mem_id))
+                if entry is None:
+                    continue
+                # usage cho eviction (lưu cùng lần ghi kế tiếp)
+                entry["hits"] += 1
+                entry["last_used"] = now
+                results.append(entry["summary"])
         return results
+
+    def stats(self) -> dict:
+        """Kích thước, tỉ lệ gộp, số lần evict và latency search trung bình."""
+        with self._lock:
+            c = dict(self.stats_counters)
+            size = len(self.entries)
+        return {
+            "size": size,
+            "capacity": self.capacity,
+            "adds": c["adds"],
+            "merges": c["merges"],
+            "merge_rate": round(c["merges"] / c["adds"], 4) if c["adds"] else 0.0,
+            "evictions": c["evictions"],
+            "searches": c["searches"],
+            "avg_search_ms": round(c["search_seconds"] / c["searches"] * 1000, 3) if c["searches"] else 0.0,
+        }
+
+
+_shared = None
+_shared_lock = threading.Lock()
+
+
+def get_long_term_memory() -> LongTermMemory:
+    """Instance dùng chung cho mọi agent (1 index + 1 file trên đĩa, tránh ghi đè lẫn nhau)."""
+    global _shared
+    with _shared_lock:
+        if _shared is None:
+            _shared = LongTermMemory(embedder=_shared_embedder())
+        return _shared
+
+
+def _shared_embedder():
+    """Dùng lại embedding model của VectorDB (EmbeddingBuilder có .encode) nếu cùng model (không load model thứ 2)."""
+    from src.vectordb.faiss_index import get_vector_db
+
+    db = get_vector_db()
+    if db.embedding_name.rsplit("/", 1)[-1] == "all-MiniLM-L6-v2" and hasattr(db.embeddings, "encode"):
+        return db.embeddings
+    return None
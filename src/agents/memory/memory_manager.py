@@ -1,16 +1,30 @@
 # src/agents/memory/memory_manager.py
 
-from collections import deque
+from collections import OrderedDict, deque
 from datetime import datetime
-import json
+import hashlib
+import os
+import threading
 from pathlib import Path
 
+from src.utils.config_loader import config
+from src.utils.file_store import file_version, locked, read_json, write_json
+from src.utils.metrics import timed
+from src.utils.request_context import current, current_session_id
+
+DEFAULT_MEMORY_FILE = "data/processed/conversation_history.json"
+SESSION_MEMORY_DIR = "data/processed/sessions"
+
 class MemoryManager:
     """
     Quản lý bộ nhớ hội thoại ngắn hạn (short-term).
     - Lưu các lượt chat gần nhất vào deque.
     - Lưu/ nạp từ disk để giữ phiên giữa các restart (file JSON).
     - Cung cấp API tiện lợi: add_message, get_context, get_history_list, clear, __len__.
+    - Thread-safe (agent dùng chung giữa các request). File là nguồn chung của mọi worker process:
+      đọc lại khi file đổi (worker khác đã ghi), ghi theo read-merge-write dưới file lock
+      -> không mất lượt khi 2 worker cùng ghi 1 session.
+    - memory_file=None: chỉ giữ trong RAM (request ẩn danh).
     """
 
     def __init__(self, max_memory=5, memory_file="data/processed/conversation_history.json"):
@@ -18,18 +32,31 @@ class MemoryManager:
         self.short_term = deque(maxlen=max_memory)
 
         # Path tới file lưu history (tạo folder nếu chưa có)
-        self.memory_file = Path(memory_file)
-        self.memory_file.parent.mkdir(parents=True, exist_ok=True)
+        self.memory_file = Path(memory_file) if memory_file else None
+        if self.memory_file is not None:
+            self.memory_file.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.RLock()
+        self._version = None  # file_version lúc đọc / ghi gần nhất
 
         # Nếu đã có file lưu trước đó, load vào short_term
-        if self.memory_file.exists():
-            try:
-                # đọc JSON -> gán vào deque với maxlen
-                loaded = json.load(open(self.memory_file, encoding="utf-8"))
-                self.short_term = deque(loaded, maxlen=max_memory)
-            except Exception:
-                # Nếu có lỗi đọc, bỏ qua để tránh crash
-                pass
+        self.reload()
+
+    def reload(self, force=False):
+        """
+        Nạp lại short_term từ file nếu file đã đổi từ lần đọc / ghi trước (worker khác ghi),
+        force=True: luôn đọc lại (trong file lock, trước khi ghi).
+        """
+        if self.memory_file is None:
+            return
+        with self._lock:
+            version = file_version(self.memory_file)
+            if version is None or (version == self._version and not force):
+                return
+            # Nếu có lỗi đọc, bỏ qua để tránh crash
+            loaded = read_json(self.memory_file)
+            if isinstance(loaded, list):
+                self.short_term = deque(loaded, maxlen=self.short_term.maxlen)
+            self._version = version
 
     def add_message(self, role, content):
         """
@@ -42,39 +69,105 @@ class MemoryManager:
             "content": content,
             "timestamp": datetime.now().isoformat()
         }
-        # thêm vào deque (tự động giữ maxlen)
-        self.short_term.append(entry)
-        # lưu ngay ra disk để bền vững
-        self.save()
+        with self._lock, locked(self.memory_file):
+            # gộp với bản trên đĩa (worker khác có thể vừa ghi) rồi thêm vào deque (tự động giữ maxlen)
+            self.reload(force=True)
+            self.short_term.append(entry)
+            # lưu ngay ra disk để bền vững
+            self.save()
 
     def get_context(self):
         """
         Trả về context dạng string nối các lượt chat gần nhất,
         phù hợp để chèn trực tiếp vào prompt.
         """
-        return "\n".join([f"{m['role']}: {m['content']}" for m in list(self.short_term)])
+        return "\n".join([f"{m['role']}: {m['content']}" for m in self.get_history_list()])
 
     def get_history_list(self):
         """
         Trả về danh sách các entry (list of dict) để dùng khi cần nén/tóm tắt.
         """
-        return list(self.short_term)
+        with self._lock:
+            self.reload()
+            return list(self.short_term)
 
     def clear(self):
         """
         Xóa short-term memory (thường dùng sau khi đẩy tóm tắt vào long-term).
         """
-        self.short_term.clear()
-        self.save()
+        with self._lock, locked(self.memory_file):
+            self.short_term.clear()
+            self.save()
+
+    def pop_context(self, min_messages):
+        """
+        Đủ min_messages lượt -> trả context rồi xóa, trong 1 lần khóa (2 worker không cùng đẩy
+        1 đoạn hội thoại sang long-term); chưa đủ -> None.
+        """
+        with self._lock, locked(self.memory_file):
+            self.reload(force=True)
+            if len(self.short_term) < min_messages:
+                return None
+            context = self.get_context()
+            self.short_term.clear()
+            self.save()
+            return context
 
     def __len__(self):
         """
         Số lượt hiện có trong short-term memory.
         """
+        self.reload()
         return len(self.short_term)
 
     def save(self):
         """
-        Ghi short_term vào file JSON.
+        Ghi short_term vào file JSON (atomic; gọi trong locked() khi cần read-merge-write).
         """
-        json.dump(list(self.short_term), open(self.memory_file, "w", encoding="utf-8"), ensure_ascii=False, indent=2)
+        if self.memory_file is None:
+            return
+        with self._lock, timed("memory.short_term_save"):
+            write_json(self.memory_file, list(self.short_term))
+            self._version = file_version(self.memory_file)
+
+
+_sessions = OrderedDict()
+_sessions_lock = threading.Lock()
+
+
+def session_key(session_id: str) -> str:
+    """Tên file an toàn cho session_id (do client gửi lên)."""
+    return hashlib.sha1(session_id.encode("utf-8")).hexdigest()[:16]
+
+
+def session_memory_file(session_id: str) -> str:
+    """File history của session ("default" giữ file cũ)."""
+    if session_id == "default":
+        return DEFAULT_MEMORY_FILE
+    return os.path.join(SESSION_MEMORY_DIR, f"{session_key(session_id)}.json")
+
+
+def get_short_memory(session_id: str = None) -> MemoryManager:
+    """
+    Short-term memory của session (mặc định: session của request hiện tại), LRU giới hạn CONTEXT_MAX_SESSIONS.
+    Object trong RAM chỉ là cache: file của session là nguồn chung của mọi worker (đọc lại khi file đổi).
+    Request không gửi session_id -> memory riêng của request, chỉ trong RAM (như get_conversation_context).
+    """
+    if session_id is None:
+        ctx = current()
+        if ctx is not None and ctx.session_id is None:
+            return ctx.resource(
+                "short_memory", lambda: MemoryManager(max_memory=config.SHORT_MEMORY_MAX, memory_file=None)
+            )
+        session_id = current_session_id()
+    with _sessions_lock:
+        memory = _sessions.get(session_id)
+        if memory is None:
+            memory = _sessions[session_id] = MemoryManager(
+                max_memory=config.SHORT_MEMORY_MAX, memory_file=session_memory_file(session_id)
+            )
+            while len(_sessions) > config.CONTEXT_MAX_SESSIONS:
+                _sessions.popitem(last=False)
+        else:
+            _sessions.move_to_end(session_id)
+        return memory
@@ -1,18 +1,86 @@
 # src/agents/router.py
+"""
+Router: phân loại intent rồi chuyển query cho KnowledgeAgent / ExplainAgent / CodeAgent.
+- Query đơn: classify_intent (LLM + heuristic) -> 1 agent, retrieval chạy trước song song với phân loại.
+- Query ghép ("explain attention and show me PyTorch code for it"): plan() tách thành các sub-task
+  độc lập (LLM, hết budget thì heuristic), các agent chạy song song -> latency = nhánh chậm nhất.
+  Kết quả gộp thành 1 answer + "parts" (intent, agent, query, answer, elapsed_ms của từng phần).
+"""
+import re
+import time
+
 from src.agents.base_agent import AgentBase
 from src.agents.knowledge_agent import KnowledgeAgent
 from src.agents.explain_agent import ExplainAgent
 from src.agents.code_agent import CodeAgent
-from src.agents.memory.memory_manager import MemoryManager
+from src.utils import admission, token_usage
 from src.utils.config_loader import config
+from src.utils.concurrency import submit
+from src.utils.metrics import Counter, timed
 from src.utils.llm_manager import create_langchain_llm
+from src.utils.tokens import count_tokens
+
+
+SPECULATIVE_RETRIEVAL = Counter(
+    "speculative_retrieval_total", "Retrieval started in parallel with intent classification", ["outcome"]
+)
+ROUTER_FANOUT = Counter("router_fanout_total", "Compound queries split into parallel sub-tasks", ["planner"])
+
+# từ khóa chắc chắn của từng intent (không khớp -> None, không đoán mặc định như classify_intent)
+_INTENT_CUES = {
+    "explain": ("giải thích", "explain", "why", "how does", "tại sao"),
+    "retrieve": ("paper", "research", "tóm tắt", "summarize", "thông tin", "mới nhất", "latest",
+                 "hôm nay", "tin tức", "news"),
+}
+# code phải là yêu cầu làm (động từ + code / snippet..., hoặc "implement"): chữ "code" đứng một mình
+# không đủ -> "explain how this code works" là explain, không bị tách thành explain + code
+_CODE_VERBS = ("write", "viết", "show me", "give me", "generate", "fix", "sửa", "debug", "run", "chạy")
+_CODE_NOUNS = ("code", "snippet", "script", "function", "program", "hàm", "bug", "lỗi")
+# khớp nguyên từ / cụm từ ("code" không khớp "encoder", "decoder", "unicode")
+_INTENT_PATTERNS = {
+    intent: re.compile(r"\b(?:" + "|".join(re.escape(cue) for cue in cues) + r")\b")
+    for intent, cues in _INTENT_CUES.items()
+}
+_INTENT_PATTERNS["code"] = re.compile(
+    r"(?<!how to )(?<!cách )\b(?:implement|(?:" + "|".join(_CODE_VERBS) + r")\b(?:\W+\w+){0,4}?\W+(?:"
+    + "|".join(_CODE_NOUNS) + r"))\b"
+)
+_CONNECTOR = re.compile(r"\s*(?:;|,?\s+(?:and then|and also|and|then|và|rồi|sau đó)\s+)", re.IGNORECASE)
+_PLAN_LINE = re.compile(r"^\W*(retrieve|explain|code)\s*[:\-]\s*(.+)$", re.IGNORECASE)
+
+
+def explicit_intent(text: str):
+    """Intent theo từ khóa chắc chắn, None nếu không có từ khóa nào."""
+    t = text.lower()
+    for intent in ("code", "explain", "retrieve"):
+        if _INTENT_PATTERNS[intent].search(t):
+            return intent
+    return None
+
+
+def split_compound(query: str) -> list:
+    """
+    [(intent, phần query)] nếu query ghép các yêu cầu khác loại ("explain X and write code for X"),
+    [] nếu là query đơn. "difference between RAG and fine-tuning" không bị tách (chỉ 1 intent).
+    """
+    parts = [p.strip() for p in _CONNECTOR.split(query) if p and p.strip()]
+    tagged = [(explicit_intent(p), p) for p in parts]
+    if len({intent for intent, _ in tagged if intent}) < 2:
+        return []
+    # phần không có từ khóa gộp vào phần đứng trước ("explain attention and transformers")
+    merged = []
+    for intent, part in tagged:
+        if intent is None and merged:
+            merged[-1] = (merged[-1][0], f"{merged[-1][1]} and {part}")
+        else:
+            merged.append((intent or "retrieve", part))
+    return merged
 
 
 class RouterAgent(AgentBase):
     def __init__(self):
         super().__init__("RouterAgent")
         self.llm = create_langchain_llm(model_name=config.MODEL_EXPLAIN, temperature=0.0)
-        self.short_memory = MemoryManager(max_memory=config.SHORT_MEMORY_MAX)
 
     def _extract_text_from_llm_response(self, resp) -> str:
         """Robustly extract textual content from different LLM response shapes."""
@@ -41,28 +109,58 @@ class RouterAgent(AgentBase):
         ).format(query=query)
 
         try:
-            resp = self.llm.invoke(prompt)
-            text = self._extract_text_from_llm_response(resp).strip().lower()
+            # token budget sắp hết -> bỏ LLM call, dùng heuristic bên dưới
+            if token_usage.should_degrade("classify_intent", need=count_tokens(prompt) + 10):
+                text = ""
+            else:
+                resp = self.llm.invoke(prompt)
+                text = self._extract_text_from_llm_response(resp).strip().lower()
         except Exception:
             text = ""
 
         # --- Heuristic fallback ---
         if not text:
-            t = query.lower()
-            if "code" in t or "viết" in t:
-                return "code"
-            elif "giải thích" in t or "explain" in t:
-                return "explain"
-            elif any(k in t for k in ["paper", "research", "tóm tắt", "thông tin", "mới nhất", "hôm nay", "tin tức"]):
-                return "retrieve"
-            else:
-                return "retrieve"  # fallback: default to knowledge
+            return explicit_intent(query) or "retrieve"  # fallback: default to knowledge
 
         intent_word = text.split()[0]
         if intent_word not in ["retrieve", "explain", "code", "other"]:
             return "retrieve"
         return intent_word
 
+    def plan(self, query: str) -> list:
+        """
+        [(intent, sub-query)] cho query ghép (>= 2 sub-task, tối đa ROUTER_MAX_PARTS), [] cho query đơn.
+        LLM viết lại từng sub-task cho đủ nghĩa ("code for it" -> "PyTorch code for attention");
+        LLM lỗi / hết token budget -> các phần của split_compound kèm query gốc làm ngữ cảnh.
+        """
+        if not config.ROUTER_FANOUT:
+            return []
+        parts = split_compound(query)
+        if not parts:
+            return []
+        prompt = (
+            "Split the user's request into independent sub-tasks, one per line, formatted as\n"
+            "<intent>: <self-contained sub-question>\n"
+            "where <intent> is one of: retrieve, explain, code. Return only those lines.\n\n"
+            "Request: {query}"
+        ).format(query=query)
+        tasks = []
+        try:
+            if not token_usage.should_degrade("plan_fanout", need=count_tokens(prompt) + 100):
+                text = self._extract_text_from_llm_response(self.llm.invoke(prompt))
+                for line in text.splitlines():
+                    match = _PLAN_LINE.match(line.strip())
+                    if match:
+                        tasks.append((match.group(1).lower(), match.group(2).strip()))
+        except Exception as e:
+            self.info(f"fan-out planning failed: {e}")
+        if len(tasks) >= 2:
+            ROUTER_FANOUT.inc(planner="llm")
+        else:
+            ROUTER_FANOUT.inc(planner="heuristic")
+            tasks = [(intent, f"{part}\n\n(Full request: {query})") for intent, part in parts]
+        return tasks[:max(2, config.ROUTER_MAX_PARTS)]
+
 
 class IntentRouter:
     def __init__(self):
@@ -70,31 +168,109 @@ class IntentRouter:
         self.knowledge_agent = KnowledgeAgent()
         self.explain_agent = ExplainAgent()
         self.code_agent = CodeAgent()
-        self.short_memory = MemoryManager(max_memory=config.SHORT_MEMORY_MAX)
+
+    def _prefetch_documents(self, query: str) -> list:
+        """Embed query + FAISS search (chạy song song với classify_intent)."""
+        with timed("router.speculative_retrieval"):
+            return self.knowledge_agent.vector_db.search_documents(query, k=self.knowledge_agent.retrieval_k)
+
+    def _agent_for(self, intent: str) -> AgentBase:
+        if intent == "explain":
+            return self.explain_agent
+        if intent == "code":
+            return self.code_agent
+        return self.knowledge_agent
+
+    def _run_part(self, intent: str, query: str) -> dict:
+        """1 nhánh của fan-out (chạy trong executor, cùng RequestContext với request)."""
+        agent = self._agent_for(intent)
+        start = time.perf_counter()
+        try:
+            with timed(f"router.fanout.{agent.name}"):
+                result = agent.run_admitted(query)
+            result = {"answer": result} if isinstance(result, str) else dict(result)
+        except admission.Rejected:
+            raise
+        except Exception as e:
+            print(f"[ROUTER] ⚠️ Sub-task ({intent}) failed: {e}")
+            result = {"answer": "", "error": str(e)}
+        result.setdefault("answer", "")
+        return {"intent": intent, "agent": agent.name, "query": query,
+                "elapsed_ms": round((time.perf_counter() - start) * 1000, 2), **result}
+
+    def _route_fanout(self, tasks: list) -> dict:
+        """Chạy các sub-task song song (task đầu ở thread hiện tại), gộp answer theo thứ tự của plan."""
+        print(f"[ROUTER] 🔀 Fan-out: {[intent for intent, _ in tasks]}")
+        with timed("router.fanout"):
+            futures = [submit(self._run_part, intent, query) for intent, query in tasks[1:]]
+            try:
+                first = self._run_part(*tasks[0])
+            finally:
+                # đợi mọi nhánh xong (kể cả khi 1 nhánh bị từ chối) rồi mới raise
+                rest = [f.exception() or f.result() for f in futures]
+        for outcome in rest:
+            if isinstance(outcome, BaseException):
+                raise outcome
+        outcomes = [first, *rest]
+        sections = []
+        for i, part in enumerate(outcomes, 1):
+            title = part["query"].split("\n")[0]  # bỏ phần "(Full request: ...)" của plan heuristic
+            body = part["answer"] or f"(no answer: {part.get('error', '')})"
+            sections.append(f"**{i}. {title}**\n\n{body}")
+        answer = "\n\n".join(sections)
+        return {"intent": "multi", "answer": answer, "parts": outcomes}
 
     def route(self, user_query: str) -> dict:
-        intent = self.router_agent.classify_intent(user_query)
-        self.short_memory.add_message("user", user_query)
+        # query ghép -> các agent chạy song song (không cần classify_intent)
+        with timed("router.plan"):
+            tasks = self.router_agent.plan(user_query)
+        if tasks:
+            return self._route_fanout(tasks)
+
+        # retrieve / explain / other đều dùng cùng FAISS retrieval -> chạy trước trong lúc chờ LLM phân loại
+        prefetch = None
+        if self.knowledge_agent.vector_db.vectordb:
+            prefetch = submit(self._prefetch_documents, user_query)
+
+        with timed("router.classify_intent"):
+            intent = self.router_agent.classify_intent(user_query)
 
         print(f"[ROUTER] 🚦 Intent detected: {intent}")
 
         # --- Route theo intent ---
         if intent == "retrieve":
-            result = self.knowledge_agent.run(user_query)
+            agent = self.knowledge_agent
         elif intent == "explain":
-            result = self.explain_agent.run(user_query)
+            agent = self.explain_agent
         elif intent == "code":
-            result = self.code_agent.run(user_query)
+            agent = self.code_agent
         else:
             # ✅ Sửa: fallback về KnowledgeAgent thay vì model thô
             print("[ROUTER] ℹ️ Fallback to KnowledgeAgent for 'other' intent")
-            result = self.knowledge_agent.run(user_query)
+            agent = self.knowledge_agent
+
+        run_kwargs = {}
+        if prefetch is not None:
+            if agent is self.code_agent:
+                # code agent không cần retrieval: hủy nếu chưa chạy, nếu đang chạy thì bỏ kết quả
+                prefetch.cancel()
+                SPECULATIVE_RETRIEVAL.inc(outcome="discarded")
+            else:
+                try:
+                    with timed("router.speculative_wait"):
+                        run_kwargs["prefetched_docs"] = prefetch.result()
+                    SPECULATIVE_RETRIEVAL.inc(outcome="used")
+                except Exception as e:
+                    # agent tự retrieval lại như bình thường
+                    print(f"[ROUTER] ⚠️ Speculative retrieval failed: {e}")
+                    SPECULATIVE_RETRIEVAL.inc(outcome="failed")
+
+        with timed(f"router.run.{agent.name}"):
+            result = agent.run_admitted(user_query, **run_kwargs)
 
         # --- Normalize output ---
         if isinstance(result, str):
             result = {"answer": result}
         if "answer" not in result:
             result["answer"] = ""
-
-        self.short_memory.add_message("assistant", result["answer"])
         return {"intent": intent, **result}
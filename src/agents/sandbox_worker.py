@@ -0,0 +1,143 @@
+# src/agents/sandbox_worker.py
+"""
+Process worker của code sandbox (code_sandbox.SandboxPool khởi chạy file này bằng `python -I`).
+Không import gì từ src.* (config_loader gọi load_dotenv -> sẽ nạp lại API key vào env của worker).
+
+    python -I sandbox_worker.py <fd> <memory_mb> <max_output> <uid:gid | ->
+
+Thứ tự khởi động (trước khi nhận snippet đầu tiên):
+1. import sẵn ALLOWED_MODULES (sau chroot không còn thấy thư viện trên đĩa)
+2. chạy bằng root: unshare network namespace (khi kernel / container cho phép) -> không có mạng,
+   chroot vào thư mục tạm (cwd) -> không đọc được file của app (.env, data/...), rồi bỏ quyền root
+   (setgroups / setgid / setuid sang uid:gid) và RLIMIT_NPROC = 0 -> không fork được process mới
+3. RLIMIT_AS (RAM), RLIMIT_FSIZE = 0 (không ghi file); RLIMIT_CPU đặt lại trước mỗi snippet
+"""
+import builtins
+import contextlib
+import ctypes
+import ctypes.util
+import io
+import os
+import resource
+import signal
+import sys
+from multiprocessing.connection import Connection
+
+SAFE_BUILTINS = (
+    "abs", "all", "any", "ascii", "bin", "bool", "bytearray", "bytes", "callable", "chr", "complex",
+    "dict", "dir", "divmod", "enumerate", "filter", "float", "format", "frozenset", "hash", "hex",
+    "int", "isinstance", "issubclass", "iter", "len", "list", "map", "max", "min", "next", "object",
+    "oct", "ord", "pow", "print", "range", "repr", "reversed", "round", "set", "slice", "sorted",
+    "str", "sum", "tuple", "type", "zip", "__build_class__",
+    "ArithmeticError", "AssertionError", "AttributeError", "Exception", "IndexError", "KeyError",
+    "LookupError", "MemoryError", "NameError", "NotImplementedError", "OverflowError", "RuntimeError",
+    "StopIteration", "TypeError", "ValueError", "ZeroDivisionError",
+)
+ALLOWED_MODULES = (
+    "math", "cmath", "random", "statistics", "itertools", "functools", "collections", "heapq",
+    "bisect", "json", "re", "string", "datetime", "fractions", "decimal", "dataclasses", "typing",
+)
+
+CLONE_NEWNET = 0x40000000
+
+
+class _LimitedWriter(io.StringIO):
+    """stdout bị cắt khi vượt max_chars (phần dư bị bỏ, không giữ trong RAM)."""
+
+    def __init__(self, max_chars: int):
+        super().__init__()
+        self.max_chars = max_chars
+        self.size = 0
+        self.truncated = False
+
+    def write(self, s):
+        remaining = self.max_chars - self.size
+        if remaining <= 0:
+            self.truncated = True
+            return len(s)
+        if len(s) > remaining:
+            self.truncated = True
+            s = s[:remaining]
+        self.size += len(s)
+        return super().write(s)
+
+
+def _safe_import(name, globals=None, locals=None, fromlist=(), level=0):
+    if level != 0 or name.split(".")[0] not in ALLOWED_MODULES:
+        raise ImportError(f"import of {name!r} is not allowed in the sandbox")
+    return builtins.__import__(name, globals, locals, fromlist, level)
+
+
+def _unshare_network() -> bool:
+    """Network namespace rỗng (chỉ có loopback down); cần CAP_SYS_ADMIN -> không được thì bỏ qua."""
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+        return libc.unshare(CLONE_NEWNET) == 0
+    except Exception:
+        return False
+
+
+def isolate(user: str):
+    """Bước 2 ở trên; không chạy bằng root (hoặc user = "-") -> chỉ còn env tối thiểu + cwd tạm."""
+    if os.geteuid() != 0 or user == "-":
+        return
+    _unshare_network()
+    os.chroot(".")
+    os.chdir("/")
+    uid, gid = (int(part) for part in user.split(":"))
+    os.setgroups([])
+    os.setgid(gid)
+    os.setuid(uid)
+    resource.setrlimit(resource.RLIMIT_NPROC, (0, 0))
+
+
+def main(conn, memory_mb: int, max_output: int, user: str):
+    """Vòng lặp của worker: nhận (code, cpu_seconds), trả dict kết quả."""
+    import importlib
+
+    # pre-warm: import sẵn các module hay dùng (trước khi chroot / set RLIMIT_AS)
+    for name in ALLOWED_MODULES:
+        importlib.import_module(name)
+    isolate(user)
+
+    limit = memory_mb * 1024 * 1024
+    resource.setrlimit(resource.RLIMIT_AS, (limit, limit))
+    signal.signal(signal.SIGXFSZ, signal.SIG_IGN)  # ghi file -> OSError cho snippet thay vì kill worker
+    resource.setrlimit(resource.RLIMIT_FSIZE, (0, 0))
+    _, cpu_hard = resource.getrlimit(resource.RLIMIT_CPU)
+    safe_builtins = {name: getattr(builtins, name) for name in SAFE_BUILTINS}
+    safe_builtins["__import__"] = _safe_import
+
+    while True:
+        try:
+            msg = conn.recv()
+        except EOFError:
+            break
+        if msg is None:
+            break
+        code, cpu_seconds = msg
+
+        # RLIMIT_CPU tính trên tổng CPU của process -> đặt = đã dùng + ngân sách lần này (SIGXCPU khi vượt)
+        usage = resource.getrusage(resource.RUSAGE_SELF)
+        soft = int(usage.ru_utime + usage.ru_stime) + int(cpu_seconds) + 1
+        if cpu_hard != resource.RLIM_INFINITY:
+            soft = min(soft, cpu_hard)
+        resource.setrlimit(resource.RLIMIT_CPU, (soft, cpu_hard))
+
+        out = _LimitedWriter(max_output)
+        try:
+            with contextlib.redirect_stdout(out):
+                exec(code, {"__builtins__": dict(safe_builtins), "__name__": "__sandbox__"})
+            result = {"ok": True, "output": out.getvalue(), "truncated": out.truncated}
+        except MemoryError:
+            result = {"ok": False, "error": "MemoryError: memory limit exceeded",
+                      "output": out.getvalue(), "truncated": out.truncated}
+        except BaseException as e:  # SystemExit, KeyboardInterrupt... cũng chỉ là lỗi của snippet
+            result = {"ok": False, "error": f"{type(e).__name__}: {e}",
+                      "output": out.getvalue(), "truncated": out.truncated}
+        conn.send(result)
+
+
+if __name__ == "__main__":
+    fd, memory_mb, max_output, user = sys.argv[1:5]
+    main(Connection(int(fd)), int(memory_mb), int(max_output), user)
@@ -0,0 +1,152 @@
+# src/agents/summarizer.py
+"""
+Tóm tắt web text trước khi đưa vào prompt trả lời (KnowledgeAgent, web path), theo token budget:
+- "direct"    : text <= SUMMARY_DIRECT_MAX_TOKENS -> đưa thẳng vào prompt, không tóm tắt.
+- "extractive": (mặc định cho text dài) chọn câu theo embedding: điểm = cosine với query +
+                centroid_weight x cosine với tâm (centroid) của mọi câu, bỏ câu gần trùng câu đã chọn, dừng ở
+                SUMMARY_TARGET_TOKENS; giữ thứ tự gốc và dòng nguồn "[i] title (url)" của passage.
+- "llm"       : (SUMMARY_MODE=llm) tóm tắt từng block 2000 ký tự bằng LLM (cách cũ).
+Mỗi lần không gọi LLM: đếm số call LLM tránh được và latency ước lượng tiết kiệm được
+(số call x latency trung bình đã đo của model, trừ thời gian extractive).
+"""
+import logging
+import re
+import time
+
+import numpy as np
+from langchain.text_splitter import RecursiveCharacterTextSplitter
+
+from src.ingestion.chunking import SENTENCE_BOUNDARY
+from src.utils import admission, token_usage
+from src.utils.config_loader import config
+from src.utils.metrics import LLM_LATENCY, Counter, timed
+from src.utils.tokens import count_tokens
+
+logger = logging.getLogger("Summarizer")
+
+SUMMARY_DECISIONS = Counter("web_summary_total", "Web text summarization decisions", ["mode"])
+SUMMARY_LLM_CALLS_SAVED = Counter("summary_llm_calls_saved_total",
+                                  "LLM summarization calls avoided by the token-budget policy", ["mode"])
+SUMMARY_LATENCY_SAVED = Counter("summary_latency_saved_seconds_total",
+                                "Estimated latency saved by not summarizing with the LLM", ["mode"])
+
+SOURCE_HEADER = re.compile(r"^\[\d+\] .*\)$")
+SUMMARY_PROMPT = "Summarize concisely the following text to support an answer:\n\n{chunk}"
+
+
+class WebSummarizer:
+    def __init__(self, llm=None, embeddings=None, model_name: str = None, mode: str = None,
+                 direct_max_tokens: int = None, target_tokens: int = None, centroid_weight: float = 0.5,
+                 redundancy: float = 0.95):
+        self.llm = llm
+        self._embeddings = embeddings
+        self.model_name = model_name or config.MODEL_KNOWLEDGE
+        self.mode = mode or config.SUMMARY_MODE
+        self.direct_max_tokens = direct_max_tokens or config.SUMMARY_DIRECT_MAX_TOKENS
+        self.target_tokens = target_tokens or config.SUMMARY_TARGET_TOKENS
+        self.centroid_weight = centroid_weight  # < 1: query quan trọng hơn "chủ đề chung" của trang
+        self.redundancy = redundancy            # cosine với câu đã chọn >= ngưỡng -> bỏ (gần trùng)
+
+    @property
+    def embeddings(self):
+        if self._embeddings is None:
+            from src.vectordb.faiss_index import get_vector_db
+
+            self._embeddings = get_vector_db().embeddings
+        return self._embeddings
+
+    # =========================== LLM ===========================
+    @staticmethod
+    def llm_chunks(text: str) -> list:
+        """Các block mà chế độ LLM tóm tắt (1 block = 1 LLM call)."""
+        return RecursiveCharacterTextSplitter(chunk_size=2000, chunk_overlap=200).split_text(text)
+
+    def summarize_llm(self, text: str) -> str:
+        summaries = []
+        for chunk in self.llm_chunks(text):
+            resp = self.llm.invoke(SUMMARY_PROMPT.format(chunk=chunk))
+            summaries.append(resp.content if hasattr(resp, "content") else str(resp))
+        return " ".join(summaries).strip()
+
+    # =========================== extractive ===========================
+    @staticmethod
+    def _sentences(text: str) -> tuple:
+        """(headers, sentences): headers[b] = dòng nguồn của block b; sentences = [(block, câu)]."""
+        headers, sentences = [], []
+        for block in text.split("\n\n"):
+            lines = block.strip().split("\n", 1)
+            header = lines[0] if SOURCE_HEADER.match(lines[0]) else ""
+            body = lines[1] if header and len(lines) > 1 else ("" if header else block)
+            headers.append(header)
+            sentences.extend((len(headers) - 1, s.strip()) for s in SENTENCE_BOUNDARY.split(body) if s.strip())
+        return headers, sentences
+
+    def summarize_extractive(self, query: str, text: str) -> str:
+        headers, sentences = self._sentences(text)
+        if not sentences:
+            return text
+        with admission.slot("embedding"):
+            vectors = np.asarray(self.embeddings.embed_documents([s for _, s in sentences]), dtype=np.float32)
+            q = np.asarray(self.embeddings.embed_query(query), dtype=np.float32)
+        vectors /= np.linalg.norm(vectors, axis=1, keepdims=True) + 1e-12
+        centroid = vectors.mean(axis=0)
+        centroid /= np.linalg.norm(centroid) + 1e-12
+        q /= np.linalg.norm(q) + 1e-12
+        scores = vectors @ q + self.centroid_weight * (vectors @ centroid)
+
+        chosen, used = [], 0
+        for i in np.argsort(-scores):
+            n = count_tokens(sentences[i][1])
+            if used + n > self.target_tokens:
+                continue
+            if chosen and float(np.max(vectors[chosen] @ vectors[i])) >= self.redundancy:
+                continue
+            chosen.append(int(i))
+            used += n
+        if not chosen:  # câu đầu tiên đã quá budget -> vẫn giữ câu tốt nhất
+            chosen = [int(np.argmax(scores))]
+
+        by_block = {}
+        for i in sorted(chosen):
+            block, sentence = sentences[i]
+            by_block.setdefault(block, []).append(sentence)
+        parts = []
+        for block, picked in by_block.items():
+            body = " ".join(picked)
+            parts.append(f"{headers[block]}\n{body}" if headers[block] else body)
+        return "\n\n".join(parts)
+
+    # =========================== policy ===========================
+    def _avg_llm_call_seconds(self) -> float:
+        snap = LLM_LATENCY.snapshot(model=self.model_name)
+        return snap["sum"] / snap["count"] if snap["count"] else 0.0
+
+    def _record_saved(self, mode: str, text: str, spent: float):
+        calls = len(self.llm_chunks(text))
+        SUMMARY_LLM_CALLS_SAVED.inc(calls, mode=mode)
+        SUMMARY_LATENCY_SAVED.inc(max(0.0, calls * self._avg_llm_call_seconds() - spent), mode=mode)
+
+    def summarize(self, query: str, text: str) -> tuple:
+        """Trả về (context cho prompt, mode đã dùng)."""
+        if count_tokens(text) <= self.direct_max_tokens:
+            SUMMARY_DECISIONS.inc(mode="direct")
+            self._record_saved("direct", text, 0.0)
+            return text, "direct"
+
+        # token budget không đủ cho các call tóm tắt bằng LLM -> extractive dù SUMMARY_MODE=llm
+        if self.mode == "extractive" or token_usage.should_degrade(
+                "summary_llm", need=count_tokens(text) + self.target_tokens):
+            start = time.perf_counter()
+            try:
+                with timed("summary.extractive"):
+                    summary = self.summarize_extractive(query, text)
+                SUMMARY_DECISIONS.inc(mode="extractive")
+                self._record_saved("extractive", text, time.perf_counter() - start)
+                return summary, "extractive"
+            except Exception as e:
+                logger.exception(f"[SUMMARY] extractive failed, using LLM: {e}")
+
+        with timed("summary.llm"):
+            summary = self.summarize_llm(text)
+        SUMMARY_DECISIONS.inc(mode="llm")
+        return summary, "llm"
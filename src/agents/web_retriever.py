@@ -0,0 +1,209 @@
+# src/agents/web_retriever.py
+"""
+Web retrieval cho KnowledgeAgent:
+1. Searcher: query -> top N kết quả [{"url", "title", "snippet"}] (mặc định DuckDuckGo).
+2. Fetcher: tải các trang song song (httpx async), giới hạn tổng số kết nối, số kết nối mỗi host,
+   timeout mỗi request, deadline cho cả lượt và kích thước tối đa mỗi trang.
+3. Trích main text (bs4: bỏ script/nav/footer..., ưu tiên <article>/<main>), chia passage theo câu.
+4. Rank passage theo cosine với embedding của query (embedding model local) -> chỉ top K
+   passage được đưa vào LLM.
+Searcher / Fetcher là tham số -> test dùng server HTTP local thay cho web.
+"""
+import asyncio
+import logging
+from collections import defaultdict
+from urllib.parse import urlparse
+
+import numpy as np
+
+from src.ingestion.chunking import SENTENCE_BOUNDARY
+from src.utils import admission
+from src.utils.config_loader import config
+from src.utils.metrics import Counter, timed
+
+logger = logging.getLogger("WebRetriever")
+
+WEB_FETCHES = Counter("web_fetches_total", "Web pages fetched for the web search path", ["outcome"])
+
+DROP_TAGS = ("script", "style", "noscript", "nav", "header", "footer", "aside", "form", "svg", "iframe")
+TEXT_TAGS = ("p", "li", "h1", "h2", "h3", "h4", "pre", "blockquote", "td")
+
+
+# =========================== Searchers ===========================
+class DuckDuckGoSearcher:
+    """Top N kết quả DuckDuckGo (url, title, snippet)."""
+
+    def search(self, query: str, n: int) -> list:
+        from duckduckgo_search import DDGS
+
+        results = DDGS().text(query, max_results=n) or []
+        return [{"url": r.get("href", ""), "title": r.get("title", ""), "snippet": r.get("body", "")}
+                for r in results if r.get("href")]
+
+
+# =========================== Fetchers ===========================
+class HttpxFetcher:
+    """Tải nhiều URL song song bằng httpx.AsyncClient; trả {url: html} cho các trang tải được."""
+
+    def __init__(self, concurrency: int = None, per_host: int = None, timeout: float = None,
+                 deadline: float = None, max_bytes: int = None, transport=None):
+        self.concurrency = concurrency or config.WEB_FETCH_CONCURRENCY
+        self.per_host = per_host or config.WEB_FETCH_PER_HOST
+        self.timeout = timeout or config.WEB_FETCH_TIMEOUT
+        self.deadline = deadline or config.WEB_FETCH_DEADLINE
+        self.max_bytes = max_bytes or config.WEB_FETCH_MAX_BYTES
+        self.transport = transport  # httpx transport tùy chọn (test)
+
+    async def _fetch_one(self, client, url, total_sem, host_sems):
+        host = urlparse(url).netloc
+        async with total_sem, host_sems[host]:
+            try:
+                async with client.stream("GET", url) as resp:
+                    if resp.status_code != 200:
+                        WEB_FETCHES.inc(outcome="http_error")
+                        return url, None
+                    if "html" not in resp.headers.get("content-type", "text/html"):
+                        WEB_FETCHES.inc(outcome="not_html")
+                        return url, None
+                    body = bytearray()
+                    async for part in resp.aiter_bytes():
+                        body.extend(part)
+                        if len(body) > self.max_bytes:
+                            WEB_FETCHES.inc(outcome="too_large")
+                            break
+                    WEB_FETCHES.inc(outcome="ok")
+                    return url, bytes(body[:self.max_bytes]).decode(resp.encoding or "utf-8", errors="replace")
+            except Exception as e:
+                import httpx
+
+                WEB_FETCHES.inc(outcome="timeout" if isinstance(e, httpx.TimeoutException) else "error")
+                logger.info(f"[FETCH] {url}: {type(e).__name__}: {e}")
+                return url, None
+
+    async def fetch_all(self, urls: list) -> dict:
+        import httpx
+
+        total_sem = asyncio.Semaphore(self.concurrency)
+        host_sems = defaultdict(lambda: asyncio.Semaphore(self.per_host))
+        async with httpx.AsyncClient(timeout=httpx.Timeout(self.timeout), follow_redirects=True,
+                                     transport=self.transport,
+                                     headers={"User-Agent": "Mozilla/5.0 (multi-agent-knowledge)"}) as client:
+            tasks = [asyncio.ensure_future(self._fetch_one(client, u, total_sem, host_sems)) for u in urls]
+            done, pending = await asyncio.wait(tasks, timeout=self.deadline)
+            for task in pending:  # quá deadline của cả lượt -> bỏ các trang chậm
+                task.cancel()
+                WEB_FETCHES.inc(outcome="deadline")
+            if pending:
+                await asyncio.gather(*pending, return_exceptions=True)
+        return {url: html for url, html in (t.result() for t in done) if html}
+
+    def fetch(self, urls: list) -> dict:
+        """Bản sync (agent chạy trong thread của threadpool, không có event loop đang chạy)."""
+        return asyncio.run(self.fetch_all(urls))
+
+
+# =========================== Extraction ===========================
+def extract_main_text(html: str) -> str:
+    """Text chính của trang: bỏ phần điều hướng / script, ưu tiên <article> hoặc <main>."""
+    from bs4 import BeautifulSoup
+
+    soup = BeautifulSoup(html, "lxml")
+    for tag in soup(DROP_TAGS):
+        tag.decompose()
+    root = soup.find("article") or soup.find("main") or soup.body or soup
+    blocks = [" ".join(el.get_text(" ", strip=True).split()) for el in root.find_all(TEXT_TAGS)]
+    blocks = [b for b in blocks if len(b.split()) >= 4]
+    if not blocks:
+        return " ".join(root.get_text(" ", strip=True).split())
+    return " ".join(blocks)
+
+
+def split_passages(text: str, max_words: int) -> list:
+    """Ghép các câu liên tiếp thành passage <= max_words từ (câu quá dài bị cắt theo từ)."""
+    passages, current, count = [], [], 0
+    for sentence in SENTENCE_BOUNDARY.split(text):
+        words = sentence.split()
+        while len(words) > max_words:
+            if current:
+                passages.append(" ".join(current))
+                current, count = [], 0
+            passages.append(" ".join(words[:max_words]))
+            words = words[max_words:]
+        if count + len(words) > max_words and current:
+            passages.append(" ".join(current))
+            current, count = [], 0
+        current.extend(words)
+        count += len(words)
+    if current:
+        passages.append(" ".join(current))
+    return [p for p in passages if len(p.split()) >= 5]
+
+
+# =========================== Retriever ===========================
+class WebRetriever:
+    def __init__(self, searcher=None, fetcher=None, embeddings=None, results: int = None,
+                 top_passages: int = None, passage_words: int = None, max_passages: int = None):
+        self.searcher = searcher or DuckDuckGoSearcher()
+        self.fetcher = fetcher or HttpxFetcher()
+        self._embeddings = embeddings
+        self.results = results or config.WEB_RESULTS
+        self.top_passages = top_passages or config.WEB_TOP_PASSAGES
+        self.passage_words = passage_words or config.WEB_PASSAGE_WORDS
+        self.max_passages = max_passages or config.WEB_MAX_PASSAGES
+
+    @property
+    def embeddings(self):
+        # mặc định dùng chung embedding model của VectorDB (không load model thứ 2)
+        if self._embeddings is None:
+            from src.vectordb.faiss_index import get_vector_db
+
+            self._embeddings = get_vector_db().embeddings
+        return self._embeddings
+
+    def rank(self, query: str, passages: list) -> list:
+        """[(score, passage)] theo cosine giảm dần."""
+        if not passages:
+            return []
+        with admission.slot("embedding"):
+            q = np.asarray(self.embeddings.embed_query(query), dtype=np.float32)
+            p = np.asarray(self.embeddings.embed_documents([x["text"] for x in passages]), dtype=np.float32)
+        scores = p @ q / (np.linalg.norm(p, axis=1) * np.linalg.norm(q) + 1e-12)
+        order = np.argsort(-scores)
+        return [(float(scores[i]), passages[i]) for i in order]
+
+    def retrieve(self, query: str) -> list:
+        """Top passage liên quan nhất: [{"url", "title", "text", "score"}] (rỗng nếu search không có kết quả)."""
+        # search + fetch chiếm 1 slot của backend "search" (admission control)
+        with admission.slot("search"):
+            with timed("web.search"):
+                hits = self.searcher.search(query, self.results)
+            if not hits:
+                return []
+            with timed("web.fetch"):
+                pages = self.fetcher.fetch([h["url"] for h in hits])
+
+        passages = []
+        with timed("web.extract"):
+            for hit in hits:
+                if hit.get("snippet"):
+                    passages.append({"url": hit["url"], "title": hit.get("title", ""), "text": hit["snippet"]})
+                html = pages.get(hit["url"])
+                if not html:
+                    continue
+                try:
+                    text = extract_main_text(html)
+                except Exception as e:
+                    logger.info(f"[EXTRACT] {hit['url']}: {e}")
+                    continue
+                for passage in split_passages(text, self.passage_words):
+                    passages.append({"url": hit["url"], "title": hit.get("title", ""), "text": passage})
+        passages = passages[:self.max_passages]
+
+        with timed("web.rank"):
+            ranked = self.rank(query, passages)
+        return [{**p, "score": round(score, 4)} for score, p in ranked[:self.top_passages]]
+
+
+def format_passages(passages: list) -> str:
+    """Block context cho prompt: [i] title (url) + passage."""
+    return "\n\n".join(f"[{i}] {p['title']} ({p['url']})\n{p['text']}" for i, p in enumerate(passages, 1))
@@ -1,13 +1,22 @@
 import logging
-from fastapi import FastAPI, HTTPException
+import time
+
+_IMPORT_STARTED = time.perf_counter()
+
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, HTTPException, Request
 from fastapi.middleware.cors import CORSMiddleware
-from starlette.responses import JSONResponse
+from starlette.responses import JSONResponse, PlainTextResponse
 from pydantic import BaseModel
 
-from src.api.routers.chat_router import router as chat_router, GlobalState
-from src.agents.knowledge_agent import KnowledgeAgent
-from src.agents.explain_agent import ExplainAgent
-from src.agents.code_agent import CodeAgent
+from src.api import warmup
+from src.api.routers.chat_router import router as chat_router, get_intent_router, manual_agent, select_collection
+from src.api.routers.admin_router import router as admin_router
+from src.utils import admission, profiling, request_context
+from src.utils.circuit_breaker import CircuitOpen
+from src.utils.config_loader import config
+from src.utils.metrics import LLM_CALLS_PER_REQUEST, REQUEST_LATENCY, render_prometheus
+from src.utils.token_usage import TOKENS_PER_REQUEST, usage_block
 
 # =========================== Logging setup ===========================
 logging.basicConfig(
@@ -17,12 +26,46 @@ logging.basicConfig(
 logger = logging.getLogger("multi-agent-backend")
 
 # =========================== App init ===========================
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # warmup ở background: /health trả ok ngay, /ready chỉ 200 sau khi model + FAISS đã chạy thử
+    if config.WARMUP_ON_STARTUP:
+        warmup.start_background()
+    # build_index publish version mới -> đổi index không cần restart (request đang chạy giữ bản cũ)
+    from src.vectordb.collection_manager import start_watcher
+
+    watcher = start_watcher()
+    yield
+    if watcher is not None:
+        watcher.set()
+
+
 app = FastAPI(
     title="Multi-Agent Knowledge API",
     description="Backend API for multi-agent knowledge & code assistant",
-    version="1.2.0"
+    version="1.2.0",
+    lifespan=lifespan,
 )
 
+# =========================== Admission control ===========================
+@app.exception_handler(admission.Rejected)
+async def admission_rejected(request: Request, exc: admission.Rejected):
+    """Pool (agent / backend) quá tải: hàng đợi đầy hoặc chờ quá ADMISSION_MAX_WAIT."""
+    return JSONResponse(
+        {"detail": str(exc), "pool": exc.pool, "reason": exc.reason, "retry_after": exc.retry_after},
+        status_code=429,
+        headers={"Retry-After": str(exc.retry_after)},
+    )
+
+@app.exception_handler(CircuitOpen)
+async def circuit_open(request: Request, exc: CircuitOpen):
+    """Dependency (search / LLM) đang bị ngắt mạch và không có đường fallback."""
+    return JSONResponse(
+        {"detail": str(exc), "breaker": exc.breaker, "retry_after": exc.retry_after},
+        status_code=503,
+        headers={"Retry-After": str(exc.retry_after)},
+    )
+
 # =========================== CORS ===========================
 app.add_middleware(
     CORSMiddleware,
@@ -32,15 +75,53 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# =========================== Metrics middleware ===========================
+@app.middleware("http")
+async def request_metrics(request: Request, call_next):
+    """Mở RequestContext cho mỗi request, ghi latency + số LLM call khi xong."""
+    ctx, token = request_context.begin_request()
+    start = time.perf_counter()
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+        return response
+    finally:
+        route = request.scope.get("route")
+        endpoint = getattr(route, "path", "unmatched")
+        REQUEST_LATENCY.observe(time.perf_counter() - start, endpoint=endpoint, status=str(status))
+        # response stream (/chat/batch): LLM call chưa chạy -> stream_jsonl tự ghi khi kết thúc
+        if endpoint != "/metrics" and not ctx.streaming:
+            LLM_CALLS_PER_REQUEST.observe(ctx.llm_calls)
+            TOKENS_PER_REQUEST.observe(ctx.total_tokens())
+        request_context.end_request(token)
+
+# =========================== Profiling middleware ===========================
+@app.middleware("http")
+async def request_profiling(request: Request, call_next):
+    """Debug mode: profile request được đánh dấu bằng header hoặc được lấy mẫu ngẫu nhiên."""
+    if not profiling.should_profile(request.headers):
+        return await call_next(request)
+    trigger = "header" if "x-profile" in request.headers else "sampled"
+    with profiling.profile_request(f"{request.method} {request.url.path}", trigger) as profile_id:
+        response = await call_next(request)
+    if profile_id:
+        response.headers["X-Profile-Id"] = profile_id
+    return response
+
 # =========================== Routers ===========================
 app.include_router(chat_router, prefix="")
+app.include_router(admin_router)
 
 # =========================== Models ===========================
 class QueryRequest(BaseModel):
     query: str
     agent: str = "auto"       # 'auto' or ['knowledge', 'explain', 'code']
-    web_search: bool = True   # toggle web search
+    web_search: bool = True   # toggle web search (chỉ cho request này)
     mode: str = "auto"        # 'auto' | 'manual'
+    timings: bool = False     # trả thêm block "timings" (thời gian từng stage)
+    session_id: str | None = None  # id phiên chat -> context hội thoại riêng cho từng phiên
+    collection: str | None = None  # collection (corpus) dùng cho retrieval; None = "default"
 
 # =========================== Endpoints ===========================
 @app.get("/")
@@ -49,34 +130,56 @@ def root():
 
 @app.get("/health")
 def health():
+    """Liveness: process đang chạy (model có thể chưa load xong, xem /ready)."""
     return JSONResponse({"status": "ok"}, status_code=200)
 
+@app.get("/ready")
+def ready():
+    """Readiness: 200 chỉ sau khi warmup (load model, 1 embedding, 1 FAISS search) xong."""
+    state = warmup.status()
+    if state["ready"]:
+        return JSONResponse({"status": "ready", **state}, status_code=200)
+    return JSONResponse({"status": "failed" if state["error"] else "warming_up", **state}, status_code=503)
+
+@app.get("/metrics")
+def metrics():
+    """Prometheus exposition format."""
+    return PlainTextResponse(render_prometheus(), media_type="text/plain; version=0.0.4")
+
 @app.post("/route")
 def route_query(request: QueryRequest):
     """
     Route query to the selected agent (manual mode).
     Auto mode default = KnowledgeAgent.
     """
+    select_collection(request.collection)
     try:
-        # Cập nhật trạng thái web search toàn cục
-        GlobalState.web_search_enabled = request.web_search
-        KnowledgeAgent.enable_web_search = request.web_search
+        ctx = request_context.current()
+        ctx.web_search = request.web_search
+        if request.session_id:
+            ctx.session_id = request.session_id
 
-        # Manual mode: gọi agent được chọn
+        # Manual mode: gọi agent được chọn (instance dùng chung)
         if request.mode.lower() == "manual" and request.agent in ["knowledge", "explain", "code"]:
-            agent_map = {
-                "knowledge": KnowledgeAgent(),
-                "explain": ExplainAgent(),
-                "code": CodeAgent(),
-            }
-            result = agent_map[request.agent].run(request.query)
-            return {"intent": request.agent, "answer": result}
-
-        # Auto mode (không còn auto detect intent nữa)
-        # => mặc định gọi KnowledgeAgent
-        result = KnowledgeAgent().run(request.query)
-        return {"intent": "knowledge", "answer": result}
+            result = manual_agent(request.agent).run_admitted(request.query)
+            response = {"intent": request.agent, "answer": result}
+        else:
+            # Auto mode (không còn auto detect intent nữa)
+            # => mặc định gọi KnowledgeAgent
+            result = get_intent_router().knowledge_agent.run_admitted(request.query)
+            response = {"intent": "knowledge", "answer": result}
+        admission.raise_if_rejected(result.get("answer") if isinstance(result, dict) else result)
+
+        response["usage"] = usage_block(ctx)
+        if request.timings:
+            response["timings"] = ctx.timings_block()
+        return response
 
+    except (admission.Rejected, CircuitOpen):
+        raise
     except Exception as e:
         logger.exception(f"[ERROR] /route failed: {e}")
         raise HTTPException(status_code=500, detail=str(e))
+
+# thời gian import app (không tính model: model load trong warmup)
+warmup.record_phase("import", time.perf_counter() - _IMPORT_STARTED)
@@ -0,0 +1,73 @@
+# src/api/routers/admin_router.py
+import hmac
+
+from fastapi import APIRouter, Header, HTTPException
+from fastapi.responses import FileResponse
+
+from src.utils.config_loader import config
+from src.utils.profiling import list_profiles, profile_file
+
+router = APIRouter(prefix="/admin")
+
+
+def _check_admin(token: str | None):
+    """Admin endpoint chỉ tồn tại khi bật debug mode; nếu có PROFILING_TOKEN thì bắt buộc header."""
+    if not config.PROFILING_ENABLED:
+        raise HTTPException(status_code=404, detail="Not Found")
+    if config.PROFILING_TOKEN and not hmac.compare_digest((token or "").encode(), config.PROFILING_TOKEN.encode()):
+        raise HTTPException(status_code=403, detail="Invalid admin token")
+
+
+def _check_ops(token: str | None, mutating: bool = False):
+    """
+    Endpoint vận hành (ADMIN_ENABLED, độc lập với PROFILING_ENABLED); có ADMIN_TOKEN thì bắt buộc header.
+    Endpoint thay đổi state (mutating) luôn cần ADMIN_TOKEN: chưa cấu hình token -> 403.
+    """
+    if not config.ADMIN_ENABLED:
+        raise HTTPException(status_code=404, detail="Not Found")
+    if mutating and not config.ADMIN_TOKEN:
+        raise HTTPException(status_code=403, detail="ADMIN_TOKEN is not configured")
+    # so sánh bytes: compare_digest với str không phải ASCII raise TypeError (-> 500 thay vì 403)
+    if config.ADMIN_TOKEN and not hmac.compare_digest((token or "").encode(), config.ADMIN_TOKEN.encode()):
+        raise HTTPException(status_code=403, detail="Invalid admin token")
+
+
+@router.get("/profiles")
+def get_profiles(x_admin_token: str | None = Header(default=None)):
+    """Danh sách profile đã ghi (mới nhất trước)."""
+    _check_admin(x_admin_token)
+    return {"profiles": list_profiles()}
+
+
+@router.get("/profiles/{name}")
+def download_profile(name: str, x_admin_token: str | None = Header(default=None)):
+    """Tải 1 file profile (<id>.collapsed | <id>.alloc.txt | <id>.json)."""
+    _check_admin(x_admin_token)
+    path = profile_file(name)
+    if path is None:
+        raise HTTPException(status_code=404, detail="Profile not found")
+    return FileResponse(path, media_type="text/plain")
+
+
+@router.post("/reload_index")
+def reload_index(collection: str = "default", x_admin_token: str | None = Header(default=None)):
+    """
+    Đổi collection sang version CURRENT ngay (không chờ watcher): load bản mới bên cạnh bản cũ rồi đổi
+    atomically; request đang chạy dùng nốt bản cũ.
+    """
+    _check_ops(x_admin_token, mutating=True)
+    from src.vectordb.collection_manager import get_collection_manager
+
+    manager = get_collection_manager()
+    if not manager.exists(collection):
+        raise HTTPException(status_code=404, detail=f"collection {collection!r} not found")
+    return manager.reload(collection)
+
+
+@router.get("/breakers")
+def get_breakers(x_admin_token: str | None = Header(default=None)):
+    """Trạng thái circuit breaker của từng dependency (closed / half_open / open)."""
+    _check_ops(x_admin_token)
+    from src.utils import circuit_breaker
+
+    return {"breakers": circuit_breaker.snapshot()}
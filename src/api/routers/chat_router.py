@@ -1,70 +1,148 @@
 # src/api/routers/chat_router.py
+import threading
+
 from fastapi import APIRouter, HTTPException
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, StreamingResponse
 from pydantic import BaseModel
 
-from src.agents.router import IntentRouter
-from src.agents.knowledge_agent import KnowledgeAgent
-from src.agents.code_agent import CodeAgent
-from src.agents.explain_agent import ExplainAgent
+from src.utils import admission, request_context
+from src.utils.circuit_breaker import CircuitOpen
+from src.utils.config_loader import config
+from src.utils.token_usage import usage_block
 
 router = APIRouter()
-intent_router = IntentRouter()
 
-# --- Lưu trạng thái toggle web search ---
-class GlobalState:
-    web_search_enabled = True
+# agent dùng chung cho mọi request (model, FAISS index load 1 lần; với gunicorn preload thì load trước khi fork).
+# Tạo lazy (warmup hoặc request đầu tiên) -> import module này không kéo theo torch / langchain_community.
+_intent_router = None
+_intent_router_lock = threading.Lock()
+
+
+def get_intent_router():
+    global _intent_router
+    with _intent_router_lock:
+        if _intent_router is None:
+            from src.agents.router import IntentRouter
+
+            _intent_router = IntentRouter()
+        return _intent_router
 
 
 class ChatRequest(BaseModel):
     query: str
     agent: str = "auto"  # "auto", "knowledge", "code", "explain"
-    web_search: bool | None = None  # None = giữ nguyên trạng toggle hiện tại
+    web_search: bool | None = None  # None = WEB_SEARCH_DEFAULT; chỉ áp dụng cho request này
+    timings: bool = False  # trả thêm block "timings" (thời gian từng stage)
+    session_id: str | None = None  # id phiên chat -> context hội thoại riêng cho từng phiên
+    collection: str | None = None  # collection (corpus) dùng cho retrieval; None = "default"
+
+
+class BatchRequest(BaseModel):
+    queries: list[str]
+    concurrency: int | None = None   # số LLM call đồng thời (None = BATCH_CONCURRENCY)
+    k: int | None = None             # số chunk retrieval mỗi query
+    session_id: str | None = None
+    collection: str | None = None
+
+
+def manual_agent(name: str):
+    """Agent dùng chung theo tên ("knowledge" | "code" | "explain")."""
+    intent_router = get_intent_router()
+    return {
+        "knowledge": intent_router.knowledge_agent,
+        "code": intent_router.code_agent,
+        "explain": intent_router.explain_agent,
+    }[name]
+
 
+def select_collection(name: str | None):
+    """Gắn collection vào request hiện tại; collection không tồn tại -> 404 (trước khi gọi agent)."""
+    if not name:
+        return
+    from src.vectordb.collection_manager import get_collection_manager
 
+    if not get_collection_manager().exists(name):
+        raise HTTPException(status_code=404, detail=f"collection {name!r} not found")
+    request_context.current().collection = name
+
+
+# def (không async): agent.run là blocking -> Starlette chạy trong threadpool, không chặn event loop
 @router.post("/chat")
-async def chat(request: ChatRequest):
+def chat(request: ChatRequest):
+    select_collection(request.collection)
     try:
-        # Cập nhật toggle nếu user gửi web_search
-        if request.web_search is not None:
-            GlobalState.web_search_enabled = request.web_search
+        # toggle web search gắn với request hiện tại (không sửa state dùng chung)
+        ctx = request_context.current()
+        ctx.web_search = request.web_search
+        if request.session_id:
+            ctx.session_id = request.session_id
 
         query = request.query.strip()
 
         # --- Manual chọn agent ---
         if request.agent in ["knowledge", "code", "explain"]:
-            if request.agent == "knowledge":
-                KnowledgeAgent.enable_web_search = GlobalState.web_search_enabled
-                agent = KnowledgeAgent()
-            elif request.agent == "code":
-                agent = CodeAgent()
-            else:
-                agent = ExplainAgent()
-
-            result = agent.run(query)
-            return JSONResponse(
-                content={
-                    "answer": result.get("answer", ""),
-                    "intent": request.agent,
-                    "source": result.get("source", "manual"),
-                }
-            )
+            result = manual_agent(request.agent).run_admitted(query)
+            content = {
+                "answer": result.get("answer", ""),
+                "intent": request.agent,
+                "source": result.get("source", "manual"),
+            }
 
         # --- Auto detect intent ---
         else:
-            result = intent_router.route(query)
+            result = get_intent_router().route(query)
             # đảm bảo trả JSON đúng chuẩn
-            if isinstance(result, dict):
-                return JSONResponse(content=result)
-            return JSONResponse(content={"answer": str(result)})
+            content = result if isinstance(result, dict) else {"answer": str(result)}
+
+        # agent / backend nào đó quá tải trong lúc chạy: agent đã fallback ra answer -> degraded, không thì 429
+        admission.raise_if_rejected(content.get("answer"))
+        content["usage"] = usage_block(ctx)
+        if request.timings:
+            content["timings"] = ctx.timings_block()
+        return JSONResponse(content=content)
 
+    except (admission.Rejected, CircuitOpen):
+        raise  # -> 429 / 503 + Retry-After (exception handler trong main.py)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 
+@router.post("/chat/batch")
+def chat_batch(request: BatchRequest):
+    """
+    Nhiều query 1 lượt (FAISS path của KnowledgeAgent): embed theo batch, 1 FAISS search,
+    LLM đồng thời tới `concurrency`. Trả JSONL theo thứ tự hoàn thành, dòng cuối {"done": true, ...}.
+    Quá tải / ngắt mạch -> dòng lỗi của từng query (status 429 / 503 + retry_after), không phải 429 cả batch.
+    """
+    from src.agents.batch import answer_batch, stream_jsonl
+
+    queries = [q.strip() for q in request.queries]
+    if not queries:
+        raise HTTPException(status_code=422, detail="queries must not be empty")
+    if len(queries) > config.BATCH_MAX_QUERIES:
+        raise HTTPException(status_code=413, detail=f"at most {config.BATCH_MAX_QUERIES} queries per batch")
+    select_collection(request.collection)
+    ctx = request_context.current()
+    if request.session_id:
+        ctx.session_id = request.session_id
+    concurrency = min(request.concurrency or config.BATCH_CONCURRENCY, config.BATCH_CONCURRENCY)
+    items = answer_batch(queries, agent=manual_agent("knowledge"), concurrency=concurrency, k=request.k)
+    ctx.streaming = True
+    return StreamingResponse(stream_jsonl(items, ctx), media_type="application/x-ndjson")
+
+
+@router.get("/collections")
+def list_collections():
+    """Collection trên đĩa + trạng thái load (resident bytes, số request đang dùng) và ngân sách RAM."""
+    from src.vectordb.collection_manager import get_collection_manager
+
+    return get_collection_manager().stats()
+
+
 @router.post("/toggle_websearch")
 def toggle_websearch(enable: bool):
-    """API riêng cho frontend toggle websearch."""
-    GlobalState.web_search_enabled = enable
-    KnowledgeAgent.enable_web_search = enable
-    return {"status": "ok", "enabled": enable}
+    """
+    Deprecated: web search giờ là tham số của từng request (`web_search` trong /chat, /route).
+    Giữ endpoint để client cũ không lỗi; không thay đổi state của server.
+    """
+    return {"status": "ok", "enabled": enable, "deprecated": True}
@@ -0,0 +1,127 @@
+# src/api/warmup.py
+"""
+Warmup backend trước khi nhận traffic:
+- load(): nạp tokenizer đếm token (tiktoken) + import agent modules + tạo IntentRouter
+  (embedding model, FAISS index, long-term memory).
+  Với gunicorn preload_app, master gọi load() trước khi fork -> worker dùng chung model (copy-on-write).
+- probe(): 1 embedding + 1 FAISS search + khởi động worker của code sandbox (sau fork, mỗi process
+  1 pool) để lần gọi đầu tiên của user không phải trả chi phí khởi tạo.
+- run(): load() + probe() rồi bật cờ ready (/ready trả 200). Mỗi process chỉ chạy 1 lần.
+- Thời gian từng phase (import, load_tokenizer, import_agents, load_models, probe_embedding, probe_faiss,
+  probe_sandbox, warmup_total) có trong status() và metric startup_phase_seconds.
+"""
+import logging
+import threading
+import time
+from contextlib import contextmanager
+
+from src.utils.metrics import Gauge
+
+logger = logging.getLogger("warmup")
+
+STARTUP_SECONDS = Gauge("startup_phase_seconds", "Time spent in each startup phase", ["phase"])
+APP_READY = Gauge("app_ready", "1 once warmup finished and the process can serve traffic")
+
+_state = {"ready": False, "error": None, "phases": {}}
+_state_lock = threading.Lock()
+_run_lock = threading.Lock()
+_ready_callbacks = []
+
+
+def record_phase(phase: str, seconds: float):
+    with _state_lock:
+        _state["phases"][phase] = round(seconds, 3)
+    STARTUP_SECONDS.set(seconds, phase=phase)
+
+
+@contextmanager
+def _phase(name: str):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_phase(name, time.perf_counter() - start)
+
+
+def load():
+    """Import + khởi tạo agent dùng chung (idempotent)."""
+    with _state_lock:
+        if "load_models" in _state["phases"]:
+            return
+    from src.utils import tokens
+
+    with _phase("load_tokenizer"):
+        if not tokens.warm():
+            logger.warning("[WARMUP] tiktoken unavailable, token counts fall back to ~4 chars / token")
+    with _phase("import_agents"):
+        import src.agents.router  # noqa: F401  (torch, sentence-transformers, langchain_community...)
+    from src.api.routers.chat_router import get_intent_router
+
+    with _phase("load_models"):
+        get_intent_router()
+
+
+def probe():
+    """1 embedding + 1 FAISS search (bỏ qua search nếu chưa build index) + spawn worker sandbox."""
+    from src.agents.code_sandbox import get_sandbox_pool
+    from src.vectordb.faiss_index import get_vector_db
+
+    db = get_vector_db()
+    with _phase("probe_embedding"):
+        db.embeddings.embed_query("warmup")
+    if db.vectordb:
+        with _phase("probe_faiss"):
+            db.search_documents("warmup", k=1)
+    with _phase("probe_sandbox"):
+        get_sandbox_pool()
+
+
+def run():
+    """load + probe rồi đánh dấu ready; lỗi được giữ trong status() (process vẫn sống, /ready trả 503)."""
+    with _run_lock:
+        if is_ready():
+            return
+        start = time.perf_counter()
+        try:
+            load()
+            probe()
+        except Exception as e:
+            logger.exception(f"[WARMUP] failed: {e}")
+            with _state_lock:
+                _state["error"] = f"{type(e).__name__}: {e}"
+            return
+        record_phase("warmup_total", time.perf_counter() - start)
+        with _state_lock:
+            _state["ready"] = True
+            _state["error"] = None
+            callbacks = list(_ready_callbacks)
+        APP_READY.set(1)
+        logger.info(f"[WARMUP] ready: {status()['phases']}")
+    for callback in callbacks:
+        callback()
+
+
+def start_background() -> threading.Thread:
+    """Chạy run() ở thread riêng để server vẫn trả /health trong lúc warmup."""
+    thread = threading.Thread(target=run, name="warmup", daemon=True)
+    thread.start()
+    return thread
+
+
+def on_ready(callback):
+    """Gọi callback() khi warmup xong (ngay lập tức nếu đã ready)."""
+    with _state_lock:
+        if not _state["ready"]:
+            _ready_callbacks.append(callback)
+            return
+    callback()
+
+
+def is_ready() -> bool:
+    with _state_lock:
+        return _state["ready"]
+
+
+def status() -> dict:
+    with _state_lock:
+        return {"ready": _state["ready"], "error": _state["error"], "phases": dict(_state["phases"])}
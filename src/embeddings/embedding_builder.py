@@ -1,7 +1,167 @@
+# src/embeddings/embedding_builder.py
+"""
+EmbeddingBuilder: embedding model local với backend thay được (config.EMBEDDING_BACKEND).
+- "torch": sentence-transformers (PyTorch) - như trước.
+- "onnx" : ONNX Runtime CPU, model export 1 lần từ HF model + dynamic quantization int8
+           (weight Linear -> int8). Mean pooling + L2 normalize như pipeline của all-MiniLM-L6-v2
+           -> cùng số chiều, vector gần như trùng với torch (xem Scripts/bench_embeddings.py).
+           Lúc chạy chỉ cần onnxruntime + tokenizer (không import torch).
+- API theo batch: embed_texts(texts) -> np.ndarray float32 (n, dim); thêm embed_documents /
+  embed_query (LangChain) và encode (SentenceTransformer) để VectorDB / LongTermMemory dùng trực tiếp.
+Backend mới: register_backend("name", cls) với cls(model_name, **kwargs) có .dimension và .embed_texts().
+"""
+from pathlib import Path
+
 import numpy as np
 
+from src.utils.config_loader import config
+
+ONNX_INPUTS = ("input_ids", "attention_mask", "token_type_ids")
+
+
+def mean_pool(hidden: np.ndarray, attention_mask: np.ndarray, normalize: bool = True) -> np.ndarray:
+    """Trung bình token embedding (bỏ padding) -> (batch, dim); normalize=True: chia theo chuẩn L2."""
+    mask = attention_mask[..., None].astype(np.float32)
+    pooled = (hidden * mask).sum(axis=1) / np.clip(mask.sum(axis=1), 1e-9, None)
+    if normalize:
+        pooled /= np.clip(np.linalg.norm(pooled, axis=1, keepdims=True), 1e-12, None)
+    return pooled.astype(np.float32)
+
+
+class TorchBackend:
+    name = "torch"
+
+    def __init__(self, model_name: str, device: str = "cpu", **kwargs):
+        from sentence_transformers import SentenceTransformer
+
+        self.model = SentenceTransformer(model_name, device=device)
+        self.dimension = self.model.get_sentence_embedding_dimension()
+
+    def embed_texts(self, texts: list, batch_size: int) -> np.ndarray:
+        return np.asarray(self.model.encode(list(texts), batch_size=batch_size, convert_to_numpy=True,
+                                            show_progress_bar=False), dtype=np.float32)
+
+
+def onnx_model_dir(model_name: str) -> Path:
+    return Path(config.EMBEDDING_ONNX_DIR) / model_name.rsplit("/", 1)[-1]
+
+
+def export_onnx(model, out_dir, quantize: bool = True, tokenizer=None) -> Path:
+    """
+    Export HF encoder (tên model hoặc nn.Module) sang out_dir/model.onnx (+ model.int8.onnx nếu quantize),
+    lưu kèm tokenizer. Cần torch + onnx (bước build, không cần lúc chạy).
+    """
+    import torch
+    from transformers import AutoModel, AutoTokenizer
+
+    out_dir = Path(out_dir)
+    out_dir.mkdir(parents=True, exist_ok=True)
+    if isinstance(model, str):
+        tokenizer = tokenizer or AutoTokenizer.from_pretrained(model, use_fast=True)
+        model = AutoModel.from_pretrained(model)
+    model.eval()
+    tokenizer.save_pretrained(out_dir)
+
+    class LastHiddenState(torch.nn.Module):
+        def __init__(self, encoder):
+            super().__init__()
+            self.encoder = encoder
+
+        def forward(self, input_ids, attention_mask, token_type_ids=None):
+            return self.encoder(input_ids=input_ids, attention_mask=attention_mask,
+                                token_type_ids=token_type_ids, return_dict=False)[0]
+
+    dummy = tokenizer(["an example sentence", "another one"], padding=True, return_tensors="pt")
+    names = [k for k in ONNX_INPUTS if k in dummy]
+    axes = {k: {0: "batch", 1: "sequence"} for k in names}
+    axes["last_hidden_state"] = {0: "batch", 1: "sequence"}
+    fp32_path = out_dir / "model.onnx"
+    with torch.no_grad():
+        torch.onnx.export(LastHiddenState(model), tuple(dummy[k] for k in names), str(fp32_path),
+                          input_names=names, output_names=["last_hidden_state"], dynamic_axes=axes,
+                          opset_version=17, dynamo=False)
+    if not quantize:
+        return fp32_path
+
+    from onnxruntime.quantization import QuantType, quantize_dynamic
+
+    int8_path = out_dir / "model.int8.onnx"
+    quantize_dynamic(str(fp32_path), str(int8_path), weight_type=QuantType.QInt8)
+    return int8_path
+
+
+class OnnxBackend:
+    name = "onnx"
+
+    def __init__(self, model_name: str, model_dir: str = None, quantize: bool = None, max_length: int = None,
+                 threads: int = None, **kwargs):
+        import onnxruntime as ort
+        from transformers import AutoTokenizer
+
+        self.model_dir = Path(model_dir) if model_dir else onnx_model_dir(model_name)
+        quantize = config.EMBEDDING_ONNX_QUANTIZE if quantize is None else quantize
+        self.model_path = self.model_dir / ("model.int8.onnx" if quantize else "model.onnx")
+        if not self.model_path.exists():
+            export_onnx(model_name, self.model_dir, quantize=quantize)
+        self.tokenizer = AutoTokenizer.from_pretrained(str(self.model_dir), use_fast=True)
+        self.max_length = max_length or config.EMBEDDING_MAX_TOKENS
+
+        options = ort.SessionOptions()
+        if threads:
+            options.intra_op_num_threads = threads
+        self.session = ort.InferenceSession(str(self.model_path), options, providers=["CPUExecutionProvider"])
+        self.input_names = {i.name for i in self.session.get_inputs()}
+        self.dimension = int(self.embed_texts(["dimension probe"], 1).shape[1])
+
+    def embed_texts(self, texts: list, batch_size: int) -> np.ndarray:
+        out = []
+        for start in range(0, len(texts), batch_size):
+            enc = self.tokenizer(list(texts[start:start + batch_size]), padding=True, truncation=True,
+                                 max_length=self.max_length, return_tensors="np")
+            feeds = {k: enc[k].astype(np.int64) for k in ONNX_INPUTS if k in self.input_names and k in enc}
+            hidden = self.session.run(None, feeds)[0]
+            out.append(mean_pool(hidden, enc["attention_mask"]))
+        return np.vstack(out) if out else np.zeros((0, self.dimension), dtype=np.float32)
+
+
+BACKENDS = {"torch": TorchBackend, "onnx": OnnxBackend}
+
+
+def register_backend(name: str, cls):
+    BACKENDS[name] = cls
+
+
 class EmbeddingBuilder:
-    def embed_text(self, text: str):
-        # Giả lập vector embedding bằng cách hash chuỗi
-        np.random.seed(abs(hash(text)) % (2**32))
-        return np.random.rand(768)
+    def __init__(self, model_name: str = None, backend: str = None, batch_size: int = None, **backend_kwargs):
+        self.model_name = model_name or config.EMBEDDING_MODEL
+        self.backend_name = backend or config.EMBEDDING_BACKEND
+        if self.backend_name not in BACKENDS:
+            raise ValueError(f"Unknown embedding backend: {self.backend_name!r} (expected one of {sorted(BACKENDS)})")
+        self.batch_size = batch_size or config.EMBEDDING_BATCH_SIZE
+        self.backend = BACKENDS[self.backend_name](self.model_name, **backend_kwargs)
+
+    @property
+    def dimension(self) -> int:
+        return self.backend.dimension
+
+    def embed_texts(self, texts: list) -> np.ndarray:
+        """Embed cả danh sách theo batch -> (len(texts), dimension) float32."""
+        if not texts:
+            return np.zeros((0, self.dimension), dtype=np.float32)
+        return self.backend.embed_texts(list(texts), self.batch_size)
+
+    def embed_text(self, text: str) -> np.ndarray:
+        return self.embed_texts([text])[0]
+
+    # LangChain Embeddings (VectorDB)
+    def embed_documents(self, texts: list) -> list:
+        return self.embed_texts(texts).tolist()
+
+    def embed_query(self, text: str) -> list:
+        return self.embed_text(text).tolist()
+
+    # SentenceTransformer.encode (LongTermMemory)
+    def encode(self, texts, **kwargs) -> np.ndarray:
+        if isinstance(texts, str):
+            return self.embed_text(texts)
+        return self.embed_texts(texts)
@@ -1,14 +1,44 @@
 import re
 from pathlib import Path
 
+from src.utils.config_loader import config
+
+# ranh giới câu: sau . ! ? (có thể kèm ngoặc / nháy đóng) và khoảng trắng
+SENTENCE_BOUNDARY = re.compile(r'(?<=[.!?])["\')\]]*\s+')
+
+
 class TextChunker:
     """
     Chia text thành các đoạn nhỏ, giúp truy vấn chính xác hơn trong RAG.
+    - mode="words": cửa sổ chunk_size từ, overlap từ (cách cũ).
+    - mode="tokens": đếm token bằng fast tokenizer của embedding model (theo batch), ghép các câu
+      sao cho mỗi chunk <= max_tokens (kể cả special tokens) -> không phần nào bị model cắt bỏ khi embed;
+      câu dài hơn giới hạn được cắt theo offset của token. Overlap tính bằng token (theo câu).
     """
 
-    def __init__(self, chunk_size=500, overlap=100):
+    def __init__(self, chunk_size=500, overlap=100, mode=None, max_tokens=None, overlap_tokens=None,
+                 tokenizer=None, batch_size=1000):
         self.chunk_size = chunk_size
         self.overlap = overlap
+        self.mode = mode or config.CHUNK_MODE
+        self.max_tokens = max_tokens or config.EMBEDDING_MAX_TOKENS
+        self.overlap_tokens = config.CHUNK_OVERLAP_TOKENS if overlap_tokens is None else overlap_tokens
+        self.batch_size = batch_size
+        self._tokenizer = tokenizer
+
+    @property
+    def tokenizer(self):
+        """Fast tokenizer của config.EMBEDDING_MODEL (load lần đầu cần dùng)."""
+        if self._tokenizer is None:
+            from transformers import AutoTokenizer
+
+            self._tokenizer = AutoTokenizer.from_pretrained(config.EMBEDDING_MODEL, use_fast=True)
+        return self._tokenizer
+
+    @property
+    def token_budget(self) -> int:
+        """Số token nội dung tối đa mỗi chunk (trừ [CLS]/[SEP]... mà model tự thêm)."""
+        return self.max_tokens - self.tokenizer.num_special_tokens_to_add()
 
     def clean_text(self, text):
         # Loại bỏ các ký tự lạ, xuống dòng thừa
@@ -19,6 +49,8 @@ class TextChunker:
         """
         Chia text thành nhiều đoạn có độ dài tương đối đồng đều.
         """
+        if self.mode == "tokens":
+            return self.chunk_text_tokens(text)
         words = text.split()
         chunks = []
         for i in range(0, len(words), self.chunk_size - self.overlap):
@@ -26,13 +58,100 @@ class TextChunker:
             chunks.append(chunk)
         return chunks
 
-    def chunk_folder(self, input_dir="data/processed", output_path="data/processed/chunks.json"):
+    # =========================== token mode ===========================
+    def _encode(self, texts: list, offsets: bool = False) -> dict:
+        """Tokenize theo batch (fast tokenizer xử lý cả batch trong Rust)."""
+        ids, spans = [], []
+        for start in range(0, len(texts), self.batch_size):
+            enc = self.tokenizer(texts[start:start + self.batch_size], add_special_tokens=False,
+                                 return_offsets_mapping=offsets)
+            ids.extend(enc["input_ids"])
+            if offsets:
+                spans.extend(enc["offset_mapping"])
+        return {"input_ids": ids, "offset_mapping": spans}
+
+    def split_sentences(self, text: str) -> list:
+        return [s for s in SENTENCE_BOUNDARY.split(text) if s.strip()]
+
+    def _sentence_pieces(self, text: str) -> list:
+        """[(sentence_text, n_tokens)]; câu vượt budget bị cắt thành nhiều mảnh theo offset token."""
+        sentences = self.split_sentences(text)
+        if not sentences:
+            return []
+        budget = self.token_budget
+        enc = self._encode(sentences, offsets=True)
+        pieces = []
+        for sentence, ids, spans in zip(sentences, enc["input_ids"], enc["offset_mapping"]):
+            if len(ids) <= budget:
+                pieces.append((sentence, len(ids)))
+                continue
+            start = 0
+            while start < len(ids):
+                end = min(start + budget, len(ids))
+                # lùi điểm cắt về ranh giới từ (token sau cách token trước 1 khoảng trắng)
+                cut = end
+                while end < len(ids) and cut > start + 1 and spans[cut][0] == spans[cut - 1][1]:
+                    cut -= 1
+                if cut > start + 1:
+                    end = cut
+                window = spans[start:end]
+                pieces.append((sentence[window[0][0]:window[-1][1]].strip(), len(window)))
+                start = end
+        return pieces
+
+    def chunk_text_tokens(self, text: str) -> list:
+        budget = self.token_budget
+        chunks = []
+        current, current_tokens = [], 0
+        for piece, n_tokens in self._sentence_pieces(text):
+            if current and current_tokens + n_tokens > budget:
+                chunks.append(" ".join(p for p, _ in current))
+                # overlap: giữ lại các câu cuối (tổng <= overlap_tokens) làm đầu chunk mới
+                carry, carry_tokens = [], 0
+                for p, n in reversed(current):
+                    if carry_tokens + n > self.overlap_tokens or carry_tokens + n + n_tokens > budget:
+                        break
+                    carry.insert(0, (p, n))
+                    carry_tokens += n
+                current, current_tokens = carry, carry_tokens
+            current.append((piece, n_tokens))
+            current_tokens += n_tokens
+        if current:
+            chunks.append(" ".join(p for p, _ in current))
+        return chunks
+
+    def token_stats(self, chunks: list) -> dict:
+        """
+        Bao nhiêu text bị embedding model cắt bỏ (token vượt max_tokens) với danh sách chunk này.
+        Dùng để so sánh chunk theo từ (cũ) và theo token.
+        """
+        budget = self.token_budget
+        lengths = [len(ids) for ids in self._encode(chunks)["input_ids"]]
+        total = sum(lengths)
+        dropped = sum(max(0, n - budget) for n in lengths)
+        return {
+            "chunks": len(chunks),
+            "max_tokens": self.max_tokens,
+            "truncated_chunks": sum(1 for n in lengths if n > budget),
+            "tokens_total": total,
+            "tokens_dropped": dropped,
+            "dropped_ratio": round(dropped / total, 4) if total else 0.0,
+            "avg_tokens": round(total / len(lengths), 1) if lengths else 0.0,
+        }
+
+    def chunk_folder(self, input_dir="data/processed", output_path="data/processed/chunks.json", report=True):
+        """
+        Chunk mọi file .txt trong input_dir, lưu JSON. report=True: in (và giữ ở self.stats) thống kê token;
+        ở mode "tokens" kèm thống kê của chunker theo từ cũ trên cùng dữ liệu để thấy phần text bị cắt.
+        """
         import json
 
         all_chunks = []
+        texts = []
         for txt_file in Path(input_dir).glob("*.txt"):
             print(f"Chunking {txt_file.name} ...")
             text = self.clean_text(txt_file.read_text(encoding="utf-8"))
+            texts.append(text)
             chunks = self.chunk_text(text)
             all_chunks.extend(chunks)
 
@@ -40,4 +159,13 @@ class TextChunker:
             json.dump(all_chunks, f, ensure_ascii=False, indent=2)
 
         print(f" Saved {len(all_chunks)} chunks to {output_path}")
+        if report:
+            self.stats = {self.mode: self.token_stats(all_chunks)}
+            if self.mode == "tokens":
+                words = TextChunker(self.chunk_size, self.overlap, mode="words", max_tokens=self.max_tokens,
+                                    tokenizer=self.tokenizer, batch_size=self.batch_size)
+                self.stats["words"] = words.token_stats([c for t in texts for c in words.chunk_text(t)])
+            for mode, stats in self.stats.items():
+                print(f" [{mode}] {stats['chunks']} chunks, {stats['truncated_chunks']} over {stats['max_tokens']} tokens, "
+                      f"{stats['tokens_dropped']}/{stats['tokens_total']} tokens not embedded ({stats['dropped_ratio']:.1%})")
         return all_chunks
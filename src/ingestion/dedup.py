@@ -0,0 +1,121 @@
+# src/ingestion/dedup.py
+"""
+Loại chunk gần trùng trước khi embed (giữa TextChunker và VectorDB.build_index).
+- Mỗi chunk -> tập shingle (k từ liên tiếp) -> MinHash signature (num_perm giá trị, numpy).
+- LSH banding: signature chia thành `bands` dải, chunk trùng ít nhất 1 dải thành ứng viên
+  -> chỉ so các cặp ứng viên, không so mọi cặp (≈ tuyến tính theo số chunk).
+- Cặp ứng viên có Jaccard ước lượng >= threshold được gộp cụm (union-find); mỗi cụm giữ chunk
+  xuất hiện đầu tiên, các chunk còn lại bị bỏ.
+"""
+import re
+import time
+import zlib
+from collections import defaultdict
+
+import numpy as np
+
+from src.utils.config_loader import config
+
+_WORD = re.compile(r"\w+")
+
+
+def shingles(text: str, k: int) -> np.ndarray:
+    """Hash (crc32) của các shingle k từ (chữ thường); text ngắn hơn k từ -> 1 shingle."""
+    words = _WORD.findall(text.lower())
+    if len(words) <= k:
+        grams = {" ".join(words)}
+    else:
+        grams = {" ".join(words[i:i + k]) for i in range(len(words) - k + 1)}
+    return np.fromiter((zlib.crc32(g.encode("utf-8")) for g in grams), dtype=np.uint64, count=len(grams))
+
+
+def choose_bands(num_perm: int, threshold: float) -> int:
+    """
+    Số band b (b * r = num_perm) để ngưỡng LSH (1/b)^(1/r) hơi thấp hơn threshold:
+    ưu tiên recall, false positive bị loại ở bước kiểm tra Jaccard.
+    """
+    target = threshold * 0.85
+    candidates = [b for b in range(1, num_perm + 1) if num_perm % b == 0]
+    return min(candidates, key=lambda b: abs((1.0 / b) ** (b / num_perm) - target))
+
+
+class MinHashDeduplicator:
+    def __init__(self, threshold: float = None, num_perm: int = 128, shingle_size: int = 5, seed: int = 1):
+        self.threshold = threshold if threshold is not None else config.DEDUP_THRESHOLD
+        self.num_perm = num_perm
+        self.shingle_size = shingle_size
+        self.bands = choose_bands(num_perm, self.threshold)
+        self.rows = num_perm // self.bands
+        rng = np.random.default_rng(seed)
+        # multiply-shift hashing: h_i(x) = (a_i * x + b_i) >> 32 (mod 2^64), a_i lẻ
+        self._a = rng.integers(1, 2 ** 63, size=num_perm, dtype=np.uint64) | np.uint64(1)
+        self._b = rng.integers(0, 2 ** 63, size=num_perm, dtype=np.uint64)
+
+    def signature(self, text: str) -> np.ndarray:
+        h = shingles(text, self.shingle_size)
+        if h.size == 0:
+            return np.full(self.num_perm, np.iinfo(np.uint32).max, dtype=np.uint32)
+        with np.errstate(over="ignore"):
+            permuted = (self._a[:, None] * h[None, :] + self._b[:, None]) >> np.uint64(32)
+        return permuted.min(axis=1).astype(np.uint32)
+
+    def signatures(self, texts: list) -> np.ndarray:
+        sig = np.empty((len(texts), self.num_perm), dtype=np.uint32)
+        for i, text in enumerate(texts):
+            sig[i] = self.signature(text)
+        return sig
+
+    def find_duplicates(self, texts: list) -> dict:
+        """{index bị bỏ: index được giữ} cho các chunk gần trùng."""
+        sig = self.signatures(texts)
+        candidates = set()
+        for band in range(self.bands):
+            buckets = defaultdict(list)
+            cols = sig[:, band * self.rows:(band + 1) * self.rows]
+            for i in range(len(texts)):
+                buckets[cols[i].tobytes()].append(i)
+            for members in buckets.values():
+                if len(members) > 1:
+                    first = members[0]
+                    candidates.update((first, j) for j in members[1:])
+                    candidates.update((members[j], members[j + 1]) for j in range(1, len(members) - 1))
+
+        parent = list(range(len(texts)))
+
+        def find(x):
+            while parent[x] != x:
+                parent[x] = parent[parent[x]]
+                x = parent[x]
+            return x
+
+        for i, j in candidates:
+            if np.mean(sig[i] == sig[j]) >= self.threshold:
+                ri, rj = find(i), find(j)
+                if ri != rj:
+                    parent[max(ri, rj)] = min(ri, rj)  # giữ chunk xuất hiện trước
+        return {i: find(i) for i in range(len(texts)) if find(i) != i}
+
+    def dedup(self, texts: list, embedding_dim: int = 384) -> tuple:
+        """Trả về (chunks còn lại, report)."""
+        start = time.perf_counter()
+        duplicates = self.find_duplicates(texts)
+        kept = [t for i, t in enumerate(texts) if i not in duplicates]
+        bytes_in = sum(len(t.encode("utf-8")) for t in texts)
+        bytes_out = sum(len(t.encode("utf-8")) for t in kept)
+        report = {
+            "chunks_in": len(texts),
+            "chunks_out": len(kept),
+            "removed": len(duplicates),
+            "removed_ratio": round(len(duplicates) / len(texts), 4) if texts else 0.0,
+            "clusters": len(set(duplicates.values())),
+            "threshold": self.threshold,
+            "bands": self.bands,
+            "rows": self.rows,
+            "text_bytes_in": bytes_in,
+            "text_bytes_out": bytes_out,
+            # FAISS flat index: 4 byte / chiều / vector
+            "index_bytes_in": len(texts) * embedding_dim * 4,
+            "index_bytes_out": len(kept) * embedding_dim * 4,
+            "seconds": round(time.perf_counter() - start, 3),
+        }
+        return kept, report
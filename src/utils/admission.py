@@ -0,0 +1,204 @@
+# src/utils/admission.py
+"""
+Admission control: giới hạn số việc đang chạy cho mỗi agent / backend, có hàng đợi phía trước.
+- FairLimiter(name, concurrency, max_queue, max_wait): tối đa `concurrency` slot; request đến khi
+  hết slot thì xếp hàng. Hàng đợi đầy (max_queue) hoặc chờ quá max_wait giây -> Rejected
+  (API trả 429 + Retry-After).
+- Công bằng theo session: mỗi session 1 hàng FIFO riêng, slot trống được chia round-robin giữa
+  các session đang chờ -> 1 người gửi 20 request không chặn được request của người khác.
+- Pool: agent ("knowledge", "code", "explain") và backend ("llm:<model>", "search", "embedding");
+  giới hạn cấu hình trong ADMISSION_LIMITS ("knowledge=8,code=4,llm=8,llm:gemini-2.5-pro=2,...").
+- Rejected được ghi vào RequestContext; endpoint gọi raise_if_rejected(answer) sau khi agent chạy xong:
+  agent đã fallback và vẫn có answer (search đầy -> FAISS, classify -> heuristic...) -> trả answer,
+  degraded ghi "overloaded:<pool>"; không có answer -> 429. Call LLM trả lời cuối bị từ chối thì
+  agent raise luôn (không trả câu xin lỗi như một answer).
+"""
+import math
+import os
+import threading
+import time
+from collections import OrderedDict, deque
+from contextlib import contextmanager
+
+from src.utils.config_loader import config
+from src.utils.metrics import Counter, Gauge, Histogram
+from src.utils.request_context import current, current_session_id
+
+ADMISSION_QUEUE_DEPTH = Gauge("admission_queue_depth", "Requests waiting for a slot", ["pool"])
+ADMISSION_IN_FLIGHT = Gauge("admission_in_flight", "Requests holding a slot", ["pool"])
+ADMISSION_WAIT = Histogram("admission_wait_seconds", "Time spent queued before getting a slot", ["pool"])
+ADMISSION_REJECTED = Counter("admission_rejected_total", "Requests rejected by admission control", ["pool", "reason"])
+
+
+class Rejected(Exception):
+    """Pool quá tải: reason = "queue_full" | "timeout"; retry_after = số giây gợi ý cho client."""
+
+    def __init__(self, pool: str, reason: str, retry_after: int):
+        super().__init__(f"{pool} overloaded ({reason}), retry after {retry_after}s")
+        self.pool = pool
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class _Waiter:
+    __slots__ = ("event", "granted")
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.granted = False
+
+
+class FairLimiter:
+    def __init__(self, name: str, concurrency: int, max_queue: int = None, max_wait: float = None):
+        self.name = name
+        self.concurrency = max(1, int(concurrency))
+        self.max_queue = config.ADMISSION_MAX_QUEUE if max_queue is None else max_queue
+        self.max_wait = config.ADMISSION_MAX_WAIT if max_wait is None else max_wait
+        self.active = 0
+        self.waiting = 0
+        self._queues = OrderedDict()    # session -> deque[_Waiter]; thứ tự = lượt round-robin
+        self._avg_hold = 0.0            # EWMA thời gian giữ slot (ước lượng Retry-After)
+        self._lock = threading.Lock()
+
+    def _retry_after(self) -> int:
+        per_slot = self._avg_hold or 1.0
+        return max(1, math.ceil(per_slot * (self.waiting + 1) / self.concurrency))
+
+    def _publish(self):
+        ADMISSION_QUEUE_DEPTH.set(self.waiting, pool=self.name)
+        ADMISSION_IN_FLIGHT.set(self.active, pool=self.name)
+
+    def _reject(self, reason: str) -> Rejected:
+        ADMISSION_REJECTED.inc(pool=self.name, reason=reason)
+        exc = Rejected(self.name, reason, self._retry_after())
+        ctx = current()
+        if ctx is not None and ctx.rejected is None:
+            ctx.rejected = exc
+        return exc
+
+    def acquire(self, session: str = None):
+        session = session or current_session_id()
+        start = time.perf_counter()
+        with self._lock:
+            if self.active < self.concurrency and not self.waiting:
+                self.active += 1
+                self._publish()
+                ADMISSION_WAIT.observe(0.0, pool=self.name)
+                return
+            if self.waiting >= self.max_queue:
+                raise self._reject("queue_full")
+            waiter = _Waiter()
+            self._queues.setdefault(session, deque()).append(waiter)
+            self.waiting += 1
+            self._publish()
+
+        waiter.event.wait(self.max_wait)
+        with self._lock:
+            if not waiter.granted:
+                queue = self._queues.get(session)
+                if queue is not None:
+                    queue.remove(waiter)
+                    if not queue:
+                        del self._queues[session]
+                self.waiting -= 1
+                self._publish()
+                raise self._reject("timeout")
+        ADMISSION_WAIT.observe(time.perf_counter() - start, pool=self.name)
+
+    def try_acquire(self, reserve: int = 0) -> bool:
+        """
+        Lấy slot chỉ khi còn trống ngay (không xếp hàng, không Rejected), vd cho request hedge;
+        reserve: số slot phải còn trống sau khi lấy (dành cho request thật).
+        """
+        with self._lock:
+            if self.active + reserve < self.concurrency and not self.waiting:
+                self.active += 1
+                self._publish()
+                return True
+            return False
+
+    def release(self, held: float = None):
+        with self._lock:
+            if held is not None:
+                self._avg_hold = held if not self._avg_hold else 0.8 * self._avg_hold + 0.2 * held
+            if self._queues:
+                # session đầu lượt lấy slot, rồi xuống cuối lượt nếu còn request chờ
+                session, queue = next(iter(self._queues.items()))
+                waiter = queue.popleft()
+                del self._queues[session]
+                if queue:
+                    self._queues[session] = queue
+                self.waiting -= 1
+                waiter.granted = True  # slot chuyển thẳng cho waiter, active không đổi
+                waiter.event.set()
+            else:
+                self.active -= 1
+            self._publish()
+
+    @contextmanager
+    def slot(self, session: str = None):
+        self.acquire(session)
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.release(time.perf_counter() - start)
+
+
+def parse_limits(spec: str) -> dict:
+    """"knowledge=8,code=4" -> {"knowledge": 8, "code": 4}."""
+    limits = {}
+    for part in (spec or "").split(","):
+        name, _, value = part.partition("=")
+        if name.strip() and value.strip():
+            limits[name.strip()] = int(value)
+    return limits
+
+
+def pool_limit(pool: str) -> int:
+    """Số slot của pool theo ADMISSION_LIMITS ("llm:<model>" không có riêng -> giới hạn của "llm")."""
+    limits = parse_limits(config.ADMISSION_LIMITS)
+    return limits.get(pool, limits.get(pool.split(":", 1)[0], config.ADMISSION_DEFAULT_LIMIT))
+
+
+_limiters = {}
+_limiters_lock = threading.Lock()
+
+
+def get_limiter(pool: str, concurrency: int = None) -> FairLimiter:
+    """Limiter dùng chung theo tên pool; concurrency mặc định = pool_limit(pool)."""
+    with _limiters_lock:
+        limiter = _limiters.get(pool)
+        if limiter is None:
+            if concurrency is None:
+                concurrency = pool_limit(pool)
+            limiter = _limiters[pool] = FairLimiter(pool, concurrency)
+        return limiter
+
+
+def slot(pool: str):
+    """with admission.slot("search"): ... -> chờ slot của pool (theo session của request hiện tại)."""
+    return get_limiter(pool).slot()
+
+
+def raise_if_rejected(answer=None):
+    """
+    Gọi sau khi agent chạy, khi request bị từ chối ở pool nào đó (agent đã nuốt lỗi):
+    có answer -> ghi "overloaded:<pool>" vào degraded của request; không có answer -> raise (429).
+    """
+    ctx = current()
+    if ctx is None or ctx.rejected is None:
+        return
+    if answer:
+        ctx.add_degraded(f"overloaded:{ctx.rejected.pool}")
+        return
+    raise ctx.rejected
+
+
+def _after_fork_in_child():
+    global _limiters_lock
+    _limiters_lock = threading.Lock()
+    _limiters.clear()
+
+
+os.register_at_fork(after_in_child=_after_fork_in_child)
@@ -0,0 +1,178 @@
+# src/utils/circuit_breaker.py
+"""
+Circuit breaker cho từng dependency ("search" = web retriever + DuckDuckGo, "llm:<model>").
+- closed: call chạy bình thường; BREAKER_WINDOW call gần nhất được ghi lại, call lỗi hoặc chậm hơn
+  ngưỡng BREAKER_SLOW_SECONDS ("search=6,llm=30") tính là hỏng. Tỉ lệ hỏng >= BREAKER_FAILURE_RATE
+  (khi có ít nhất BREAKER_MIN_CALLS call) -> open.
+- open: call bị từ chối ngay (CircuitOpen) trong BREAKER_OPEN_SECONDS, không ai phải chờ timeout.
+- half-open: hết thời gian open -> cho đúng 1 call thử; thành công -> closed, hỏng -> open lại.
+- admission.Rejected không tính là lỗi của dependency (là quá tải phía mình).
+- Metrics: circuit_state{breaker} (0 closed, 1 half-open, 2 open),
+  circuit_transitions_total{breaker,state}, circuit_rejected_total{breaker}.
+"""
+import math
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+from src.utils import admission
+from src.utils.config_loader import config
+from src.utils.metrics import Counter, Gauge
+
+CLOSED, HALF_OPEN, OPEN = "closed", "half_open", "open"
+_STATE_VALUE = {CLOSED: 0, HALF_OPEN: 1, OPEN: 2}
+
+CIRCUIT_STATE = Gauge("circuit_state", "Circuit breaker state (0 closed, 1 half-open, 2 open)", ["breaker"])
+CIRCUIT_TRANSITIONS = Counter("circuit_transitions_total", "Circuit breaker state changes", ["breaker", "state"])
+CIRCUIT_REJECTED = Counter("circuit_rejected_total", "Calls failed fast by an open circuit breaker", ["breaker"])
+
+
+class CircuitOpen(Exception):
+    """Dependency đang bị ngắt: retry_after = số giây tới lượt thử tiếp theo."""
+
+    def __init__(self, breaker: str, retry_after: int):
+        super().__init__(f"{breaker} unavailable (circuit open), retry after {retry_after}s")
+        self.breaker = breaker
+        self.retry_after = retry_after
+
+
+class CircuitBreaker:
+    def __init__(self, name: str, slow_seconds: float = None, failure_rate: float = None,
+                 min_calls: int = None, window: int = None, open_seconds: float = None):
+        self.name = name
+        self.slow_seconds = slow_seconds
+        self.failure_rate = config.BREAKER_FAILURE_RATE if failure_rate is None else failure_rate
+        self.min_calls = config.BREAKER_MIN_CALLS if min_calls is None else min_calls
+        self.open_seconds = config.BREAKER_OPEN_SECONDS if open_seconds is None else open_seconds
+        self.state = CLOSED
+        self._results = deque(maxlen=config.BREAKER_WINDOW if window is None else window)  # True = hỏng
+        self._opened_at = 0.0
+        self._probing = False
+        self._lock = threading.Lock()
+        CIRCUIT_STATE.set(0, breaker=name)
+
+    def _set_state(self, state: str):
+        if state == self.state:
+            return
+        self.state = state
+        CIRCUIT_STATE.set(_STATE_VALUE[state], breaker=self.name)
+        CIRCUIT_TRANSITIONS.inc(breaker=self.name, state=state)
+        if state == OPEN:
+            self._opened_at = time.monotonic()
+        elif state == CLOSED:
+            self._results.clear()
+
+    def _retry_after(self) -> int:
+        return max(1, math.ceil(self._opened_at + self.open_seconds - time.monotonic()))
+
+    def is_open(self) -> bool:
+        """True khi đang open và chưa tới lượt thử (không chiếm lượt thử của half-open)."""
+        with self._lock:
+            return self.state == OPEN and time.monotonic() < self._opened_at + self.open_seconds
+
+    def check(self):
+        """Từ chối sớm (trước khi xếp hàng chờ slot): đang open, chưa tới lượt thử -> CircuitOpen."""
+        with self._lock:
+            if not (self.state == OPEN and time.monotonic() < self._opened_at + self.open_seconds):
+                return
+            retry_after = self._retry_after()
+        CIRCUIT_REJECTED.inc(breaker=self.name)
+        raise CircuitOpen(self.name, retry_after)
+
+    def allow(self):
+        """Xin phép gọi dependency; bị ngắt -> CircuitOpen. Mỗi allow() phải kèm 1 record()/cancel()."""
+        with self._lock:
+            if self.state == OPEN and time.monotonic() >= self._opened_at + self.open_seconds:
+                self._set_state(HALF_OPEN)
+            if self.state == CLOSED:
+                return
+            if self.state == HALF_OPEN and not self._probing:
+                self._probing = True  # call này là call thử
+                return
+            retry_after = self._retry_after() if self.state == OPEN else 1
+        CIRCUIT_REJECTED.inc(breaker=self.name)
+        raise CircuitOpen(self.name, retry_after)
+
+    def record(self, ok: bool, seconds: float = 0.0):
+        failed = not ok or (self.slow_seconds is not None and seconds > self.slow_seconds)
+        with self._lock:
+            if self.state == HALF_OPEN:
+                self._probing = False
+                self._set_state(OPEN if failed else CLOSED)
+                return
+            if self.state == OPEN:
+                return  # call bắt đầu trước khi mạch mở
+            self._results.append(failed)
+            if len(self._results) >= self.min_calls and \
+                    sum(self._results) / len(self._results) >= self.failure_rate:
+                self._set_state(OPEN)
+
+    def cancel(self):
+        """Call đã allow() nhưng không đo được (vd bị admission từ chối): trả lại lượt thử."""
+        with self._lock:
+            self._probing = False
+
+    @contextmanager
+    def guard(self):
+        """with breaker.guard(): <call dependency> -> ghi lỗi / latency, bị ngắt -> CircuitOpen."""
+        self.allow()
+        start = time.perf_counter()
+        try:
+            yield
+        except admission.Rejected:
+            self.cancel()
+            raise
+        except BaseException:
+            self.record(False, time.perf_counter() - start)
+            raise
+        self.record(True, time.perf_counter() - start)
+
+    def call(self, fn, *args, **kwargs):
+        with self.guard():
+            return fn(*args, **kwargs)
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {"state": self.state, "window": len(self._results), "failures": sum(self._results),
+                    "retry_after": self._retry_after() if self.state == OPEN else 0}
+
+
+def parse_seconds(spec: str) -> dict:
+    """"search=6,llm=30" -> {"search": 6.0, "llm": 30.0}."""
+    values = {}
+    for part in (spec or "").split(","):
+        name, _, value = part.partition("=")
+        if name.strip() and value.strip():
+            values[name.strip()] = float(value)
+    return values
+
+
+_breakers = {}
+_breakers_lock = threading.Lock()
+
+
+def get_breaker(name: str) -> CircuitBreaker:
+    """Breaker dùng chung theo tên ("llm:<model>" dùng ngưỡng chậm của "llm")."""
+    with _breakers_lock:
+        breaker = _breakers.get(name)
+        if breaker is None:
+            slow = parse_seconds(config.BREAKER_SLOW_SECONDS)
+            breaker = _breakers[name] = CircuitBreaker(name, slow.get(name, slow.get(name.split(":", 1)[0])))
+        return breaker
+
+
+def snapshot() -> dict:
+    with _breakers_lock:
+        breakers = dict(_breakers)
+    return {name: breaker.snapshot() for name, breaker in sorted(breakers.items())}
+
+
+def _after_fork_in_child():
+    global _breakers_lock
+    _breakers_lock = threading.Lock()
+    _breakers.clear()
+
+
+os.register_at_fork(after_in_child=_after_fork_in_child)
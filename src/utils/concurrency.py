@@ -0,0 +1,39 @@
+# src/utils/concurrency.py
+"""
+Thread pool dùng chung cho các việc chạy song song trong 1 request
+(speculative retrieval, fan-out...).
+- submit() chạy fn trong bản copy contextvars hiện tại -> RequestContext / timings vẫn đúng request.
+- Sau fork (gunicorn preload_app), thread của executor không tồn tại trong process con
+  -> executor được tạo lại.
+"""
+import contextvars
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_executor() -> ThreadPoolExecutor:
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            workers = int(os.getenv("BACKGROUND_WORKERS", "16"))
+            _executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="agent-bg")
+        return _executor
+
+
+def submit(fn, *args, **kwargs):
+    """executor.submit nhưng giữ contextvars của thread gọi."""
+    ctx = contextvars.copy_context()
+    return get_executor().submit(ctx.run, fn, *args, **kwargs)
+
+
+def _after_fork_in_child():
+    global _executor, _executor_lock
+    _executor = None
+    _executor_lock = threading.Lock()
+
+
+os.register_at_fork(after_in_child=_after_fork_in_child)
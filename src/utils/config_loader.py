@@ -15,13 +15,118 @@ class Config:
     MODEL_CODE = os.getenv("MODEL_CODE", "gemini-2.5-flash")    # recommended code-tuned model
     MODEL_EXPLAIN = os.getenv("MODEL_EXPLAIN", "gemini-2.5-flash") # explain / general reasoning
     MODEL_KNOWLEDGE = os.getenv("MODEL_KNOWLEDGE", "gemini-2.5-flash")# retrieval / long answers
+    MODEL_MEMORY = os.getenv("MODEL_MEMORY", "gemini-2.5-flash")      # tóm tắt long-term memory
+
+    # LLM client pool: retry 429/5xx (exponential backoff có jitter); số call đồng thời mỗi model
+    # là "llm" (hoặc "llm:<model>") trong ADMISSION_LIMITS
+    LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "4"))
+    LLM_BACKOFF_BASE = float(os.getenv("LLM_BACKOFF_BASE", "0.5"))   # giây
+    LLM_BACKOFF_MAX = float(os.getenv("LLM_BACKOFF_MAX", "20"))      # giây
+    # Hedge: call chưa xong sau p<QUANTILE> latency của model -> gửi thêm 1 bản, lấy kết quả về trước
+    LLM_HEDGE = os.getenv("LLM_HEDGE", "false").lower() in ("1", "true", "yes")
+    LLM_HEDGE_QUANTILE = float(os.getenv("LLM_HEDGE_QUANTILE", "0.9"))
+    LLM_HEDGE_MIN_DELAY = float(os.getenv("LLM_HEDGE_MIN_DELAY", "0.05"))     # giây, sàn của ngưỡng hedge
+    LLM_HEDGE_MAX_RATE = float(os.getenv("LLM_HEDGE_MAX_RATE", "0.05"))       # tối đa 5% call được hedge
+    LLM_HEDGE_MIN_SAMPLES = int(os.getenv("LLM_HEDGE_MIN_SAMPLES", "20"))     # chưa đủ mẫu latency -> không hedge
+    # Token / chi phí: giá USD cho 1M token "model=input/output,..."; budget 0 = không giới hạn
+    LLM_PRICES = os.getenv("LLM_PRICES", "gemini-2.5-flash=0.30/2.50")
+    REQUEST_TOKEN_BUDGET = int(os.getenv("REQUEST_TOKEN_BUDGET", "0"))
+    SESSION_TOKEN_BUDGET = int(os.getenv("SESSION_TOKEN_BUDGET", "0"))     # cộng dồn cả phiên chat
 
     # FAISS / embeddings
     FAISS_INDEX_PATH = os.getenv("FAISS_INDEX_PATH", "data/processed/faiss_index")
     EMBEDDING_MODEL = os.getenv("EMBEDDING_MODEL", "sentence-transformers/all-MiniLM-L6-v2")
+    EMBEDDING_BACKEND = os.getenv("EMBEDDING_BACKEND", "torch")            # "torch" | "onnx" (int8, CPU)
+    EMBEDDING_BATCH_SIZE = int(os.getenv("EMBEDDING_BATCH_SIZE", "32"))
+    EMBEDDING_ONNX_DIR = os.getenv("EMBEDDING_ONNX_DIR", "data/models/onnx")  # model ONNX export 1 lần vào đây
+    EMBEDDING_ONNX_QUANTIZE = os.getenv("EMBEDDING_ONNX_QUANTIZE", "true").lower() in ("1", "true", "yes")
+    EMBEDDING_MAX_TOKENS = int(os.getenv("EMBEDDING_MAX_TOKENS", "256"))   # max_seq_length của model (kể cả special tokens)
+    TIKTOKEN_CACHE_DIR = os.getenv("TIKTOKEN_CACHE_DIR", "data/models/tiktoken")  # BPE của tiktoken tải 1 lần vào đây
+    CHUNK_MODE = os.getenv("CHUNK_MODE", "tokens")                         # "tokens" | "words"
+    CHUNK_OVERLAP_TOKENS = int(os.getenv("CHUNK_OVERLAP_TOKENS", "32"))
+    DEDUP_THRESHOLD = float(os.getenv("DEDUP_THRESHOLD", "0.8"))           # Jaccard (MinHash) để coi 2 chunk là trùng
+
+    # Collections: mỗi collection 1 thư mục COLLECTIONS_DIR/<name> ("default" = FAISS_INDEX_PATH)
+    COLLECTIONS_DIR = os.getenv("COLLECTIONS_DIR", "data/collections")
+    COLLECTIONS_MEMORY_BUDGET_MB = float(os.getenv("COLLECTIONS_MEMORY_BUDGET_MB", "1024"))  # vượt -> evict LRU
+    # Index có phiên bản (<dir>/versions/<v> + CURRENT): watcher đổi sang version mới không cần restart
+    INDEX_WATCH_INTERVAL = float(os.getenv("INDEX_WATCH_INTERVAL", "10"))  # giây, 0 = tắt (chỉ /admin/reload_index)
+    INDEX_KEEP_VERSIONS = int(os.getenv("INDEX_KEEP_VERSIONS", "3"))       # số version giữ lại khi build
+
+    # Startup: warmup (load model + 1 embedding + 1 FAISS search) ở background, /ready bật sau khi xong
+    WARMUP_ON_STARTUP = os.getenv("WARMUP_ON_STARTUP", "true").lower() in ("1", "true", "yes")
+
+    # Web search (KnowledgeAgent) khi request không gửi web_search
+    WEB_SEARCH_DEFAULT = os.getenv("WEB_SEARCH_DEFAULT", "false").lower() in ("1", "true", "yes")
+    # Web retriever: top N trang -> fetch song song -> top K passage (theo embedding) vào prompt
+    WEB_RESULTS = int(os.getenv("WEB_RESULTS", "5"))
+    WEB_TOP_PASSAGES = int(os.getenv("WEB_TOP_PASSAGES", "5"))
+    WEB_PASSAGE_WORDS = int(os.getenv("WEB_PASSAGE_WORDS", "120"))
+    WEB_MAX_PASSAGES = int(os.getenv("WEB_MAX_PASSAGES", "200"))           # trần số passage được embed mỗi lượt
+    WEB_FETCH_CONCURRENCY = int(os.getenv("WEB_FETCH_CONCURRENCY", "8"))   # kết nối đồng thời (tổng)
+    WEB_FETCH_PER_HOST = int(os.getenv("WEB_FETCH_PER_HOST", "2"))         # kết nối đồng thời mỗi host
+    WEB_FETCH_TIMEOUT = float(os.getenv("WEB_FETCH_TIMEOUT", "5"))         # giây, mỗi request
+    WEB_FETCH_DEADLINE = float(os.getenv("WEB_FETCH_DEADLINE", "8"))       # giây, cả lượt fetch
+    WEB_FETCH_MAX_BYTES = int(os.getenv("WEB_FETCH_MAX_BYTES", "2000000"))
+    # Tóm tắt web text: <= SUMMARY_DIRECT_MAX_TOKENS đưa thẳng vào prompt, dài hơn -> SUMMARY_MODE
+    SUMMARY_MODE = os.getenv("SUMMARY_MODE", "extractive")                  # "extractive" | "llm"
+    SUMMARY_DIRECT_MAX_TOKENS = int(os.getenv("SUMMARY_DIRECT_MAX_TOKENS", "1500"))
+    SUMMARY_TARGET_TOKENS = int(os.getenv("SUMMARY_TARGET_TOKENS", "600"))  # độ dài bản tóm tắt extractive
+
+    # Admission control: số việc chạy đồng thời mỗi pool (agent / backend), hàng đợi công bằng theo session
+    ADMISSION_LIMITS = os.getenv("ADMISSION_LIMITS", "knowledge=8,explain=4,code=4,search=4,embedding=4,llm=8")
+    ADMISSION_DEFAULT_LIMIT = int(os.getenv("ADMISSION_DEFAULT_LIMIT", "8"))
+    ADMISSION_MAX_QUEUE = int(os.getenv("ADMISSION_MAX_QUEUE", "32"))      # request chờ tối đa mỗi pool
+    ADMISSION_MAX_WAIT = float(os.getenv("ADMISSION_MAX_WAIT", "10"))      # giây chờ tối đa -> 429
+
+    # Router: query ghép nhiều yêu cầu (explain + code...) -> các agent chạy song song, tối đa N phần
+    ROUTER_FANOUT = os.getenv("ROUTER_FANOUT", "true").lower() in ("1", "true", "yes")
+    ROUTER_MAX_PARTS = int(os.getenv("ROUTER_MAX_PARTS", "3"))
+
+    # Circuit breaker mỗi dependency ("search", "llm:<model>"): lỗi / call chậm nhiều -> fail nhanh một lúc
+    BREAKER_FAILURE_RATE = float(os.getenv("BREAKER_FAILURE_RATE", "0.5"))  # tỉ lệ call hỏng để mở mạch
+    BREAKER_MIN_CALLS = int(os.getenv("BREAKER_MIN_CALLS", "5"))           # cần ít nhất N call trong cửa sổ
+    BREAKER_WINDOW = int(os.getenv("BREAKER_WINDOW", "20"))                # số call gần nhất được xét
+    BREAKER_OPEN_SECONDS = float(os.getenv("BREAKER_OPEN_SECONDS", "30"))  # mở bao lâu rồi mới cho 1 call thử
+    BREAKER_SLOW_SECONDS = os.getenv("BREAKER_SLOW_SECONDS", "search=6,llm=30")  # chậm hơn -> tính là hỏng
+
+    # /chat/batch: số query chạy LLM đồng thời trong 1 batch, số query tối đa mỗi batch
+    BATCH_CONCURRENCY = int(os.getenv("BATCH_CONCURRENCY", "8"))
+    BATCH_MAX_QUERIES = int(os.getenv("BATCH_MAX_QUERIES", "1000"))
 
     # Memory thresholds
     SHORT_MEMORY_MAX = int(os.getenv("SHORT_MEMORY_MAX", "5"))
     LONG_MEMORY_PUSH_THRESHOLD = int(os.getenv("LONG_MEM_THRESHOLD", "8"))
+    LONG_MEMORY_CAPACITY = int(os.getenv("LONG_MEMORY_CAPACITY", "500"))                  # số entry tối đa
+    LONG_MEMORY_MERGE_THRESHOLD = float(os.getenv("LONG_MEMORY_MERGE_THRESHOLD", "0.9"))  # cosine để gộp
+    LONG_MEMORY_HIT_BONUS_SECONDS = float(os.getenv("LONG_MEMORY_HIT_BONUS_SECONDS", "86400"))  # mỗi lần dùng ~ 1 ngày recency
+    LONG_MEMORY_SUMMARY_MAX_TOKENS = int(os.getenv("LONG_MEMORY_SUMMARY_MAX_TOKENS", "400"))  # trần summary sau khi gộp
+
+    # Context hội thoại trong prompt: rolling summary + vài lượt gần nhất, có trần token
+    CONTEXT_RECENT_TURNS = int(os.getenv("CONTEXT_RECENT_TURNS", "4"))          # số message giữ nguyên văn
+    CONTEXT_MAX_TOKENS = int(os.getenv("CONTEXT_MAX_TOKENS", "1200"))           # trần cho cả block history
+    CONTEXT_SUMMARY_MAX_TOKENS = int(os.getenv("CONTEXT_SUMMARY_MAX_TOKENS", "400"))
+    CONTEXT_MAX_SESSIONS = int(os.getenv("CONTEXT_MAX_SESSIONS", "1000"))       # số session cache trong RAM
+
+    # Code sandbox (CodeAgent): pool worker subprocess
+    SANDBOX_WORKERS = int(os.getenv("SANDBOX_WORKERS", "2"))
+    SANDBOX_WALL_TIMEOUT = float(os.getenv("SANDBOX_WALL_TIMEOUT", "5"))   # giây
+    SANDBOX_CPU_SECONDS = int(os.getenv("SANDBOX_CPU_SECONDS", "3"))
+    SANDBOX_MEMORY_MB = int(os.getenv("SANDBOX_MEMORY_MB", "256"))
+    SANDBOX_MAX_OUTPUT = int(os.getenv("SANDBOX_MAX_OUTPUT", "10000"))     # ký tự stdout
+    SANDBOX_MAX_RUNS = int(os.getenv("SANDBOX_MAX_RUNS", "50"))            # recycle worker sau N lần
+    SANDBOX_CACHE_SIZE = int(os.getenv("SANDBOX_CACHE_SIZE", "256"))
+    SANDBOX_USER = os.getenv("SANDBOX_USER", "nobody")  # worker đổi sang user này khi server chạy bằng root
+
+    # Profiling on-demand (debug mode, tắt mặc định)
+    PROFILING_ENABLED = os.getenv("PROFILING_ENABLED", "false").lower() in ("1", "true", "yes")
+    PROFILING_TOKEN = os.getenv("PROFILING_TOKEN", "")            # bắt buộc header nếu đặt
+    PROFILING_SAMPLE_RATE = float(os.getenv("PROFILING_SAMPLE_RATE", "0"))  # 0..1, tỉ lệ request tự profile
+    PROFILING_DIR = os.getenv("PROFILING_DIR", "data/profiles")
+    PROFILING_INTERVAL_MS = float(os.getenv("PROFILING_INTERVAL_MS", "5"))
+
+    # Endpoint vận hành (/admin/breakers, /admin/reload_index): tách khỏi debug profiling
+    ADMIN_ENABLED = os.getenv("ADMIN_ENABLED", "false").lower() in ("1", "true", "yes")
+    ADMIN_TOKEN = os.getenv("ADMIN_TOKEN", "")                    # bắt buộc cho endpoint thay đổi state
 
 config = Config()
@@ -0,0 +1,71 @@
+# src/utils/file_store.py
+"""
+State dùng chung giữa các worker process (gunicorn) qua file trên đĩa:
+- locked(path): khóa độc quyền theo file (fcntl.flock trên <path>.lock) cho đoạn read-merge-write
+  -> 2 worker ghi cùng file không ghi đè bản cũ của nhau. flock theo từng lần open nên cũng loại
+  trừ giữa các thread. Không có fcntl (Windows: chỉ chạy 1 process) -> khóa trong process.
+- file_version(path): (mtime_ns, size, inode); khác lần đọc / ghi trước -> process khác đã ghi lại.
+- read_json / write_json: ghi atomic (tmp + os.replace), không bao giờ đọc phải file ghi dở.
+"""
+import json
+import os
+import threading
+from contextlib import contextmanager, nullcontext
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+_local_locks = {}
+_local_locks_guard = threading.Lock()
+
+
+@contextmanager
+def _flock(lock_path: str):
+    os.makedirs(os.path.dirname(lock_path) or ".", exist_ok=True)
+    with open(lock_path, "a") as f:
+        fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+
+
+def locked(path):
+    """Context manager khóa ghi của file `path` (None -> không khóa: state chỉ trong RAM)."""
+    if path is None:
+        return nullcontext()
+    lock_path = f"{os.fspath(path)}.lock"
+    if fcntl is not None:
+        return _flock(lock_path)
+    with _local_locks_guard:
+        return _local_locks.setdefault(lock_path, threading.Lock())
+
+
+def file_version(path):
+    """(mtime_ns, size, inode) của file, None nếu chưa có file."""
+    try:
+        st = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return st.st_mtime_ns, st.st_size, st.st_ino
+
+
+def read_json(path, default=None):
+    """Nội dung JSON của file; không có file / lỗi đọc -> default."""
+    try:
+        with open(path, encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return default
+
+
+def write_json(path, data):
+    """Ghi atomic: file tạm (theo pid + thread) rồi os.replace."""
+    path = os.fspath(path)
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(data, f, ensure_ascii=False, indent=2)
+    os.replace(tmp, path)
@@ -2,29 +2,367 @@
 """
 LLM Manager: tạo wrapper LLM (LangChain ChatGoogleGenerativeAI) theo model name.
 Sử dụng langchain-google-genai connector.
+- Client được dùng chung (memoize theo (model, temperature)), không tạo mới mỗi agent.
+- Mỗi model có 1 FairLimiter (pool "llm:<model>") giới hạn số call đồng thời ("llm=" hoặc "llm:<model>="
+  trong ADMISSION_LIMITS), hàng đợi công bằng theo session, đầy / chờ quá lâu -> admission.Rejected (429).
+- Lỗi 429 / 5xx được retry với exponential backoff + full jitter (không giữ slot khi đang chờ).
+- Hedge (LLM_HEDGE): call chưa xong sau ngưỡng thích nghi (p90 latency gần đây của model) -> gửi
+  thêm 1 bản, lấy kết quả về trước, bản còn lại bị hủy (chưa chạy) hoặc bỏ kết quả (đang chạy).
+  Số hedge <= LLM_HEDGE_MAX_RATE * số call; hedge chỉ chạy khi pool của model còn slot trống ngoài
+  slot nó lấy (không ai chờ) và token budget của request / session còn đủ cho thêm 1 prompt.
+  Bản thua vẫn tốn token -> khi xong được ghi vào token_usage (request / session / stage như call gốc).
+- Circuit breaker "llm:<model>" quanh từng lần gọi provider (trong slot; mỗi lần retry / hedge tính riêng):
+  thời gian chờ slot và backoff không tính là chậm -> quá tải phía mình không bị coi là provider hỏng.
+  Model lỗi liên tục hoặc quá chậm -> circuit_breaker.CircuitOpen ngay (trước khi xếp hàng),
+  agent trả lời fallback thay vì chờ timeout. llm_call_duration_seconds đo cùng chỗ.
+- Token + chi phí của mọi call được ghi theo request / session / stage (token_usage.TokenUsageCallback).
+- Fork-safe: client (gRPC) tạo ở master trước khi fork (gunicorn preload_app) được tạo lại
+  trong process con ở lần gọi đầu tiên.
 """
+import contextvars
 import os
+import random
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Any, List, Optional
+
 from dotenv import load_dotenv
 load_dotenv()
 
-from langchain_google_genai import ChatGoogleGenerativeAI
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import BaseMessage
+from langchain_core.outputs import ChatResult
+from pydantic import PrivateAttr
+from src.utils import admission, circuit_breaker, token_usage
 from src.utils.config_loader import config
+from src.utils.metrics import LLM_LATENCY, Counter, Gauge, Histogram, LLMMetricsCallback
+from src.utils.token_usage import TokenUsageCallback
+from src.utils.tokens import count_tokens
 
+LLM_RETRIES = Counter("llm_retries_total", "LLM calls retried after a retryable error", ["model", "reason"])
+LLM_QUEUE_WAIT = Histogram("llm_queue_wait_seconds", "Time spent waiting for a per-model LLM slot", ["model"])
+LLM_IN_FLIGHT = Gauge("llm_in_flight", "LLM calls currently in flight", ["model"])
+LLM_HEDGES = Counter("llm_hedges_total", "Duplicate LLM requests sent after the hedge delay", ["model", "winner"])
+LLM_HEDGE_DELAY = Gauge("llm_hedge_delay_seconds", "Current hedge threshold (latency quantile) per model", ["model"])
 
-def create_langchain_llm(model_name: str = None, temperature: float = 0.0):
+RETRYABLE_STATUS = {429, 500, 502, 503, 504}
+RETRYABLE_NAMES = {"ResourceExhausted", "TooManyRequests", "ServiceUnavailable",
+                   "InternalServerError", "DeadlineExceeded", "BadGateway", "GatewayTimeout"}
+
+# Factory thay thế (stub LLM cho load-test / test offline), None = dùng Gemini thật
+_llm_override = None
+
+# (model, temperature) -> client dùng chung
+_clients = {}
+_clients_lock = threading.Lock()
+
+# model -> _HedgeState; executor riêng cho call có hedge (không tranh thread với fan-out / prefetch)
+_hedge_states = {}
+_hedge_executor = None
+_hedge_lock = threading.Lock()
+HEDGE_WINDOW = 200   # số latency gần nhất mỗi model dùng để tính quantile
+HEDGE_BURST = 5.0    # số hedge tối đa tích lũy được khi lâu không hedge
+
+
+def set_llm_override(factory):
     """
-    Trả về LangChain LLM wrapper cho Gemini model.
+    Thay factory tạo LLM: factory(model_name, temperature) -> LangChain chat model.
+    Truyền None để quay lại Gemini. Xóa cache client để lần gọi sau dùng factory mới.
     """
-    m = model_name or config.MODEL_EXPLAIN
+    global _llm_override
+    _llm_override = factory
+    with _clients_lock:
+        _clients.clear()
+
+
+def _model_limiter(model: str) -> admission.FairLimiter:
+    return admission.get_limiter(f"llm:{model}")
+
+
+def retry_reason(exc: Exception) -> Optional[str]:
+    """Trả về lý do retry ("429", "503", "ServiceUnavailable"...) hoặc None nếu lỗi không nên retry."""
+    for attr in ("code", "status_code"):
+        code = getattr(exc, attr, None)
+        if callable(code):
+            try:
+                code = code()
+            except Exception:
+                code = None
+        if isinstance(code, int) and code in RETRYABLE_STATUS:
+            return str(code)
+    name = type(exc).__name__
+    if name in RETRYABLE_NAMES:
+        return name
+    return None
+
+
+def backoff_delay(attempt: int) -> float:
+    """Full jitter: uniform(0, min(max, base * 2^attempt))."""
+    return random.uniform(0, min(config.LLM_BACKOFF_MAX, config.LLM_BACKOFF_BASE * (2 ** attempt)))
+
+
+def call_with_limits(model: str, fn):
+    """
+    Gọi fn() trong slot của model; retry lỗi 429/5xx với backoff có jitter.
+    Slot được trả lại trong lúc chờ backoff để các request khác vẫn chạy.
+    """
+    limiter = _model_limiter(model)
+    attempt = 0
+    while True:
+        wait_start = time.perf_counter()
+        limiter.acquire()
+        LLM_QUEUE_WAIT.observe(time.perf_counter() - wait_start, model=model)
+        LLM_IN_FLIGHT.inc(1, model=model)
+        call_start = time.perf_counter()
+        try:
+            return fn()
+        except Exception as e:
+            reason = retry_reason(e)
+            if reason is None or attempt >= config.LLM_MAX_RETRIES:
+                raise
+        finally:
+            LLM_IN_FLIGHT.inc(-1, model=model)
+            limiter.release(time.perf_counter() - call_start)
+        LLM_RETRIES.inc(model=model, reason=reason)
+        time.sleep(backoff_delay(attempt))
+        attempt += 1
+
+
+class _HedgeState:
+    """Latency gần đây của 1 model (-> ngưỡng hedge) + token bucket giới hạn tỉ lệ hedge."""
+
+    def __init__(self, model: str):
+        self.model = model
+        self.samples = deque(maxlen=HEDGE_WINDOW)
+        self.tokens = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, seconds: float):
+        with self._lock:
+            self.samples.append(seconds)
+
+    def delay(self) -> Optional[float]:
+        """Ngưỡng hedge (giây), None khi chưa đủ LLM_HEDGE_MIN_SAMPLES mẫu."""
+        with self._lock:
+            if len(self.samples) < max(1, config.LLM_HEDGE_MIN_SAMPLES):
+                return None
+            ordered = sorted(self.samples)
+        index = min(len(ordered) - 1, int(config.LLM_HEDGE_QUANTILE * len(ordered)))
+        delay = max(config.LLM_HEDGE_MIN_DELAY, ordered[index])
+        LLM_HEDGE_DELAY.set(delay, model=self.model)
+        return delay
+
+    def add_call(self):
+        with self._lock:
+            self.tokens = min(HEDGE_BURST, self.tokens + config.LLM_HEDGE_MAX_RATE)
+
+    def take_hedge(self) -> bool:
+        with self._lock:
+            if self.tokens < 1.0 - 1e-9:  # 10 x 0.1 != 1.0 với float
+                return False
+            self.tokens -= 1.0
+            return True
+
+
+def _hedge_state(model: str) -> _HedgeState:
+    with _hedge_lock:
+        state = _hedge_states.get(model)
+        if state is None:
+            state = _hedge_states[model] = _HedgeState(model)
+        return state
+
+
+def _submit_hedged(fn, *args):
+    """Chạy fn trong executor của hedge, giữ contextvars (RequestContext, session cho admission)."""
+    global _hedge_executor
+    with _hedge_lock:
+        if _hedge_executor is None:
+            _hedge_executor = ThreadPoolExecutor(max_workers=max(32, 4 * admission.pool_limit("llm")),
+                                                 thread_name_prefix="llm-hedge")
+        executor = _hedge_executor
+    return executor.submit(contextvars.copy_context().run, fn, *args)
+
+
+def _hedge_attempt(model: str, fn):
+    """Bản hedge: 1 lần gọi, không retry, slot đã lấy sẵn bằng try_acquire."""
+    LLM_IN_FLIGHT.inc(1, model=model)
+    start = time.perf_counter()
+    try:
+        return fn()
+    finally:
+        LLM_IN_FLIGHT.inc(-1, model=model)
+        _model_limiter(model).release(time.perf_counter() - start)
+
+
+class _HedgeRace:
+    """Bản gốc + bản hedge: bản thành công xong trước thắng; bản xong sau gọi on_discard(result)."""
+
+    def __init__(self, on_discard=None):
+        self.winner = None
+        self.on_discard = on_discard
+        self._lock = threading.Lock()
+
+    def run(self, name: str, fn, *args):
+        result = fn(*args)
+        with self._lock:
+            if self.winner is None:
+                self.winner = name
+                return result
+        if self.on_discard is not None:
+            self.on_discard(result)
+        return result
+
+
+def hedged_call(model: str, fn, on_discard=None, hedge_tokens: int = 0):
+    """
+    call_with_limits(model, fn), có hedge khi LLM_HEDGE bật: sau ngưỡng delay() mà call chưa xong,
+    còn budget hedge, pool còn slot trống (chừa 1 slot) và token budget còn >= hedge_tokens
+    -> gửi bản thứ 2, trả kết quả thành công về trước. Bản thua (đang chạy, không hủy được) gọi
+    on_discard(result) khi xong (ghi token). Chỉ ghi latency của bản gốc (phân phối không bị hedge kéo lệch).
+    """
+    if not config.LLM_HEDGE:
+        return call_with_limits(model, fn)
+    state = _hedge_state(model)
+    state.add_call()
+
+    def measured():
+        start = time.perf_counter()
+        result = fn()
+        state.observe(time.perf_counter() - start)
+        return result
+
+    delay = state.delay()
+    if delay is None:
+        return call_with_limits(model, measured)
+
+    race = _HedgeRace(on_discard)
+    primary = _submit_hedged(race.run, "primary", call_with_limits, model, measured)
+    done, _ = wait([primary], timeout=delay)
+    if done:
+        return primary.result()
+    if token_usage.should_degrade("llm_hedge", need=hedge_tokens):
+        return primary.result()
+    limiter = _model_limiter(model)
+    if not limiter.try_acquire(reserve=1):
+        return primary.result()
+    if not state.take_hedge():
+        limiter.release()
+        return primary.result()
+
+    hedge = _submit_hedged(race.run, "hedge", _hedge_attempt, model, fn)
+    futures = {"primary": primary, "hedge": hedge}
+    pending = {primary, hedge}
+    while pending:
+        done, pending = wait(pending, return_when=FIRST_COMPLETED)
+        if any(future.exception() is None for future in done):
+            LLM_HEDGES.inc(model=model, winner=race.winner)
+            for other in pending:
+                other.cancel()  # đang chạy thì không dừng được: kết quả bị bỏ, token ghi qua on_discard
+            return futures[race.winner].result()
+    # cả 2 bản đều lỗi -> lỗi của bản gốc (đã qua retry)
+    LLM_HEDGES.inc(model=model, winner="none")
+    return primary.result()
+
+
+class PooledChatModel(BaseChatModel):
+    """
+    Wrapper quanh 1 chat model (Gemini hoặc stub): mọi call đi qua hedged_call / call_with_limits.
+    Dùng được trong chain như LLM bình thường (prompt | llm, create_stuff_documents_chain...).
+    """
+
+    inner: BaseChatModel
+    pool_key: str
+    pool_temperature: float = 0.0
+    _pid: int = PrivateAttr(default_factory=os.getpid)
+
+    def _client(self) -> BaseChatModel:
+        """Client của process hiện tại (tạo lại sau fork, không dùng chung kết nối với master)."""
+        if self._pid != os.getpid():
+            with _clients_lock:
+                if self._pid != os.getpid():
+                    self.inner = _build_client(self.pool_key, self.pool_temperature)
+                    self._pid = os.getpid()
+        return self.inner
+
+    @property
+    def _llm_type(self) -> str:
+        return f"pooled-{self.inner._llm_type}"
+
+    def _generate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                  run_manager=None, **kwargs: Any) -> ChatResult:
+        inner = self._client()
+        breaker = circuit_breaker.get_breaker(f"llm:{self.pool_key}")
+        breaker.check()  # mạch đang mở -> không xếp hàng chờ slot
+
+        def attempt():
+            # 1 lần gọi provider, chạy trong slot: breaker + latency không tính thời gian chờ slot / backoff
+            with breaker.guard():
+                start = time.perf_counter()
+                try:
+                    return inner._generate(messages, stop=stop, **kwargs)
+                finally:
+                    LLM_LATENCY.observe(time.perf_counter() - start, model=self.pool_key)
+
+        prompt_text = "\n".join(str(m.content) for m in messages)
+        return hedged_call(
+            self.pool_key, attempt,
+            # bản hedge thua vẫn bị tính token; budget phải đủ cho thêm 1 prompt mới được hedge
+            on_discard=lambda result: token_usage.record_result(self.pool_key, result, prompt_text),
+            hedge_tokens=count_tokens(prompt_text) if config.LLM_HEDGE else 0,
+        )
+
+
+def _build_client(m: str, temperature: float) -> BaseChatModel:
+    if _llm_override is not None:
+        return _llm_override(m, temperature)
 
     # Lấy API key từ .env hoặc config
     api_key = os.getenv("GOOGLE_API_KEY") or config.GEMINI_API_KEY
     if not api_key:
         raise ValueError("⚠️ Missing GOOGLE_API_KEY or GEMINI_API_KEY in environment/config.")
 
-    # Truyền trực tiếp API key vào model (bắt buộc để tránh ADC mode)
+    # import chậm (google.generativeai, grpc) -> chỉ khi thật sự tạo client Gemini
+    from langchain_google_genai import ChatGoogleGenerativeAI
+
+    # Truyền trực tiếp API key vào model (bắt buộc để tránh ADC mode).
+    # max_retries=1: client không tự retry; retry + backoff chỉ ở call_with_limits (không giữ slot khi chờ,
+    # latency mà hedge / circuit breaker đo không bị cộng thêm thời gian retry bên trong)
     return ChatGoogleGenerativeAI(
         model=m,
         temperature=temperature,
-        api_key=api_key
+        api_key=api_key,
+        max_retries=1,
     )
+
+
+def create_langchain_llm(model_name: str = None, temperature: float = 0.0):
+    """
+    Trả về LangChain LLM wrapper cho Gemini model (dùng chung theo (model, temperature)).
+    """
+    m = model_name or config.MODEL_EXPLAIN
+    key = (m, float(temperature))
+
+    with _clients_lock:
+        llm = _clients.get(key)
+        if llm is None:
+            llm = PooledChatModel(
+                inner=_build_client(m, temperature),
+                pool_key=m,
+                pool_temperature=float(temperature),
+                callbacks=[LLMMetricsCallback(m), TokenUsageCallback(m)],
+            )
+            _clients[key] = llm
+        return llm
+
+
+def _after_fork_in_child():
+    # lock có thể bị copy ở trạng thái đang giữ -> tạo mới trong process con (limiter: xem admission)
+    global _clients_lock, _hedge_lock, _hedge_executor
+    _clients_lock = threading.Lock()
+    _hedge_lock = threading.Lock()
+    _hedge_executor = None
+
+
+os.register_at_fork(after_in_child=_after_fork_in_child)
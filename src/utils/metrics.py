@@ -0,0 +1,204 @@
+# src/utils/metrics.py
+"""
+Metrics in-process + export dạng Prometheus text (GET /metrics).
+- Counter / Gauge / Histogram tối giản, thread-safe, có labels.
+- timed(stage): đo thời gian 1 stage -> histogram stage_latency_seconds + timings của request.
+- LLMMetricsCallback: LangChain callback đếm số LLM call theo model; latency (llm_call_duration_seconds)
+  do llm_manager đo quanh từng lần gọi provider (không tính thời gian xếp hàng / backoff).
+"""
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from langchain_core.callbacks import BaseCallbackHandler
+
+from src.utils.request_context import current
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+_REGISTRY = []
+_registry_lock = threading.Lock()
+
+
+def _fmt_labels(labelnames, values, extra=None) -> str:
+    pairs = list(zip(labelnames, values))
+    if extra:
+        pairs.append(extra)
+    if not pairs:
+        return ""
+    inner = ",".join('{}="{}"'.format(k, str(v).replace("\\", "\\\\").replace('"', '\\"')) for k, v in pairs)
+    return "{" + inner + "}"
+
+
+def _fmt_value(v) -> str:
+    if v == float("inf"):
+        return "+Inf"
+    return repr(float(v)) if isinstance(v, float) else str(v)
+
+
+class _Metric:
+    kind = "untyped"
+
+    def __init__(self, name: str, documentation: str, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        with _registry_lock:
+            _REGISTRY.append(self)
+
+    def _key(self, labels: dict) -> tuple:
+        return tuple(str(labels.get(n, "")) for n in self.labelnames)
+
+    def render(self) -> list:
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, name, documentation, labelnames=()):
+        super().__init__(name, documentation, labelnames)
+        self._values = {}
+
+    def inc(self, amount: float = 1.0, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def value(self, **labels) -> float:
+        with self._lock:
+            return self._values.get(self._key(labels), 0.0)
+
+    def render(self) -> list:
+        lines = super().render()
+        with self._lock:
+            for key, v in sorted(self._values.items()):
+                lines.append(f"{self.name}{_fmt_labels(self.labelnames, key)} {_fmt_value(v)}")
+        return lines
+
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def set(self, value: float, **labels):
+        with self._lock:
+            self._values[self._key(labels)] = float(value)
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets)) + (float("inf"),)
+        self._series = {}  # key -> [bucket_counts, sum, count]
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [[0] * len(self.buckets), 0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[0][i] += 1
+            series[1] += value
+            series[2] += 1
+
+    def snapshot(self, **labels) -> dict:
+        """{"count": n, "sum": s} cho 1 series (dùng trong stats / test)."""
+        with self._lock:
+            series = self._series.get(self._key(labels))
+            if series is None:
+                return {"count": 0, "sum": 0.0}
+            return {"count": series[2], "sum": series[1]}
+
+    def render(self) -> list:
+        lines = super().render()
+        with self._lock:
+            for key, (counts, total, count) in sorted(self._series.items()):
+                for bound, c in zip(self.buckets, counts):
+                    le = ("le", _fmt_value(bound))
+                    lines.append(f"{self.name}_bucket{_fmt_labels(self.labelnames, key, le)} {c}")
+                lines.append(f"{self.name}_sum{_fmt_labels(self.labelnames, key)} {_fmt_value(total)}")
+                lines.append(f"{self.name}_count{_fmt_labels(self.labelnames, key)} {count}")
+        return lines
+
+
+def render_prometheus() -> str:
+    with _registry_lock:
+        metrics = list(_REGISTRY)
+    lines = []
+    for m in metrics:
+        lines.extend(m.render())
+    return "\n".join(lines) + "\n"
+
+
+# =========================== Metrics của hệ thống ===========================
+REQUEST_LATENCY = Histogram("http_request_duration_seconds", "HTTP request latency", ["endpoint", "status"])
+STAGE_LATENCY = Histogram("stage_latency_seconds", "Latency of pipeline stages (router, agents, memory)", ["stage"])
+LLM_CALLS = Counter("llm_calls_total", "LLM calls", ["model", "status"])
+LLM_LATENCY = Histogram("llm_call_duration_seconds", "LLM call latency", ["model"])
+LLM_CALLS_PER_REQUEST = Histogram(
+    "llm_calls_per_request", "Number of LLM calls made while serving one request",
+    buckets=(0, 1, 2, 3, 4, 5, 6, 8, 10, 15, 20),
+)
+FAISS_SEARCH_LATENCY = Histogram("faiss_search_duration_seconds", "FAISS similarity search latency")
+CACHE_HITS = Counter("cache_hits_total", "Cache hits", ["cache"])
+CACHE_MISSES = Counter("cache_misses_total", "Cache misses", ["cache"])
+
+
+_stage: ContextVar = ContextVar("stage", default=None)
+
+
+def current_stage():
+    """Stage timed() trong cùng đang chạy ở thread / context hiện tại (None nếu không có)."""
+    return _stage.get()
+
+
+@contextmanager
+def timed(stage: str):
+    """Đo 1 stage: ghi histogram stage_latency_seconds và timings của request hiện tại."""
+    start = time.perf_counter()
+    token = _stage.set(stage)
+    try:
+        yield
+    finally:
+        _stage.reset(token)
+        elapsed = time.perf_counter() - start
+        STAGE_LATENCY.observe(elapsed, stage=stage)
+        ctx = current()
+        if ctx is not None:
+            ctx.add_timing(stage, elapsed)
+
+
+def record_cache(cache: str, hit: bool):
+    (CACHE_HITS if hit else CACHE_MISSES).inc(cache=cache)
+
+
+def record_llm_call(model: str, seconds: float = None, ok: bool = True):
+    """Ghi 1 LLM call (dùng cho callback và cho client gọi API trực tiếp); seconds=None: latency đã đo ở chỗ khác."""
+    LLM_CALLS.inc(model=model, status="ok" if ok else "error")
+    if seconds is not None:
+        LLM_LATENCY.observe(seconds, model=model)
+    ctx = current()
+    if ctx is not None:
+        ctx.add_llm_call()
+
+
+class LLMMetricsCallback(BaseCallbackHandler):
+    """
+    Callback gắn vào LLM (create_langchain_llm) -> đếm mọi call, kể cả bên trong chain.
+    Không đo latency: callback bao cả thời gian chờ slot + retry; latency đo trong llm_manager.
+    """
+
+    def __init__(self, model: str):
+        self.model = model
+
+    def on_llm_end(self, response, *, run_id, **kwargs):
+        record_llm_call(self.model, ok=True)
+
+    def on_llm_error(self, error, *, run_id, **kwargs):
+        record_llm_call(self.model, ok=False)
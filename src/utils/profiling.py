@@ -0,0 +1,164 @@
+# src/utils/profiling.py
+"""
+Profiling on-demand cho request thật (debug mode, bật bằng PROFILING_ENABLED).
+- CPU: sampling profiler (sys._current_frames) -> collapsed stacks (flamegraph.pl / speedscope).
+- Allocation: tracemalloc snapshot trước/sau request -> top dòng code cấp phát nhiều nhất.
+- Mỗi profile ghi ra PROFILING_DIR: <id>.collapsed, <id>.alloc.txt, <id>.json (metadata).
+- Chỉ profile 1 request tại một thời điểm (tracemalloc là global), request khác chạy bình thường.
+"""
+import hmac
+import json
+import random
+import sys
+import threading
+import time
+import tracemalloc
+import uuid
+from collections import Counter
+from contextlib import contextmanager
+from datetime import datetime
+from pathlib import Path
+
+from src.utils.config_loader import config
+
+# Stack có leaf nằm trong các file này = thread đang rảnh (chờ lock / queue / IO loop)
+_IDLE_FILES = ("threading.py", "selectors.py", "queue.py", "concurrent/futures/thread.py", "asyncio/base_events.py")
+
+_active_lock = threading.Lock()
+
+
+class SamplingProfiler:
+    """Lấy mẫu stack của mọi thread (trừ thread profiler) mỗi `interval` giây."""
+
+    def __init__(self, interval: float = 0.005):
+        self.interval = interval
+        self.stacks = Counter()
+        self.samples = 0
+        self._stop = threading.Event()
+        self._thread = None
+
+    def _sample_once(self, own_ident: int):
+        for ident, frame in sys._current_frames().items():
+            if ident == own_ident:
+                continue
+            leaf = frame.f_code.co_filename.replace("\\", "/")
+            if leaf.endswith(_IDLE_FILES):
+                continue
+            names = []
+            while frame is not None:
+                code = frame.f_code
+                names.append(f"{code.co_name} ({Path(code.co_filename).name}:{frame.f_lineno})")
+                frame = frame.f_back
+            self.stacks[";".join(reversed(names))] += 1
+        self.samples += 1
+
+    def _loop(self):
+        own = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            self._sample_once(own)
+
+    def start(self):
+        self._thread = threading.Thread(target=self._loop, name="sampling-profiler", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> Counter:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+        return self.stacks
+
+
+def should_profile(headers) -> bool:
+    """
+    Quyết định có profile request này không:
+    - header "X-Profile: 1" (kèm "X-Profile-Token" nếu PROFILING_TOKEN được đặt), hoặc
+    - lấy mẫu ngẫu nhiên theo PROFILING_SAMPLE_RATE.
+    """
+    if not config.PROFILING_ENABLED:
+        return False
+    if headers.get("x-profile", "").lower() in ("1", "true", "yes"):
+        if not config.PROFILING_TOKEN:
+            return True
+        return hmac.compare_digest(headers.get("x-profile-token", "").encode(), config.PROFILING_TOKEN.encode())
+    return config.PROFILING_SAMPLE_RATE > 0 and random.random() < config.PROFILING_SAMPLE_RATE
+
+
+@contextmanager
+def profile_request(label: str, trigger: str):
+    """
+    Profile khối code bên trong, yield profile_id (None nếu đang có profile khác chạy).
+    """
+    if not _active_lock.acquire(blocking=False):
+        yield None
+        return
+
+    profile_id = datetime.now().strftime("%Y%m%d-%H%M%S-") + uuid.uuid4().hex[:6]
+    started_tracing = not tracemalloc.is_tracing()
+    if started_tracing:
+        tracemalloc.start(25)
+    before = tracemalloc.take_snapshot()
+    sampler = SamplingProfiler(interval=config.PROFILING_INTERVAL_MS / 1000.0)
+    start = time.perf_counter()
+    sampler.start()
+    try:
+        yield profile_id
+    finally:
+        stacks = sampler.stop()
+        duration = time.perf_counter() - start
+        after = tracemalloc.take_snapshot()
+        if started_tracing:
+            tracemalloc.stop()
+        try:
+            _write_profile(profile_id, label, trigger, duration, sampler.samples, stacks, before, after)
+        finally:
+            _active_lock.release()
+
+
+def _write_profile(profile_id, label, trigger, duration, samples, stacks, before, after):
+    out_dir = Path(config.PROFILING_DIR)
+    out_dir.mkdir(parents=True, exist_ok=True)
+
+    with open(out_dir / f"{profile_id}.collapsed", "w", encoding="utf-8") as f:
+        for stack, count in stacks.most_common():
+            f.write(f"{stack} {count}\n")
+
+    alloc_stats = after.compare_to(before, "lineno")
+    with open(out_dir / f"{profile_id}.alloc.txt", "w", encoding="utf-8") as f:
+        f.write(f"# tracemalloc diff for {label} ({duration:.3f}s)\n")
+        for stat in alloc_stats[:50]:
+            f.write(f"{stat}\n")
+
+    meta = {
+        "id": profile_id,
+        "label": label,
+        "trigger": trigger,
+        "created_at": datetime.now().isoformat(),
+        "duration_s": round(duration, 4),
+        "cpu_samples": samples,
+        "alloc_net_bytes": sum(s.size_diff for s in alloc_stats),
+        "files": [f"{profile_id}.collapsed", f"{profile_id}.alloc.txt"],
+    }
+    with open(out_dir / f"{profile_id}.json", "w", encoding="utf-8") as f:
+        json.dump(meta, f, ensure_ascii=False, indent=2)
+
+
+def list_profiles() -> list:
+    """Metadata của các profile đã ghi (mới nhất trước)."""
+    out_dir = Path(config.PROFILING_DIR)
+    if not out_dir.exists():
+        return []
+    profiles = []
+    for meta_file in sorted(out_dir.glob("*.json"), reverse=True):
+        try:
+            profiles.append(json.loads(meta_file.read_text(encoding="utf-8")))
+        except Exception:
+            continue
+    return profiles
+
+
+def profile_file(name: str):
+    """Path tới 1 file profile (None nếu không tồn tại / tên không hợp lệ)."""
+    if "/" in name or "\\" in name or name.startswith("."):
+        return None
+    path = Path(config.PROFILING_DIR) / name
+    return path if path.is_file() else None
@@ -0,0 +1,142 @@
+# src/utils/request_context.py
+"""
+Request context: trạng thái gắn với MỘT request (contextvars).
+- Middleware gọi begin_request() / end_request().
+- Code bên dưới (router, agent, memory, LLM callback) đọc current() để ghi timing, số LLM call...
+- contextvars tự copy sang threadpool của Starlette; khi tự submit vào executor
+  thì phải chạy trong contextvars.copy_context().
+"""
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from typing import Optional
+
+from src.utils.config_loader import config
+
+
+@dataclass
+class RequestContext:
+    request_id: str = field(default_factory=lambda: uuid.uuid4().hex[:12])
+    session_id: Optional[str] = None              # phiên chat (frontend gửi lên); None = request ẩn danh
+    web_search: Optional[bool] = None             # toggle web search của request này (None = WEB_SEARCH_DEFAULT)
+    started: float = field(default_factory=time.perf_counter)
+    timings: dict = field(default_factory=dict)   # stage -> tổng số giây
+    llm_calls: int = 0
+    tokens: dict = field(default_factory=dict)    # stage -> [prompt_tokens, completion_tokens, cost_usd]
+    degraded: list = field(default_factory=list)  # bước bị bỏ / thu nhỏ vì token budget
+    rejected: Optional[Exception] = None          # admission.Rejected đầu tiên của request (-> 429)
+    collection: Optional[str] = None              # collection (corpus) request chọn (None = "default")
+    streaming: bool = False                       # response stream: metrics LLM / token ghi khi stream xong
+    _lock: threading.Lock = field(default_factory=threading.Lock, repr=False)
+    _resources: dict = field(default_factory=dict, repr=False)  # key -> (value, cleanup)
+    _resources_lock: threading.Lock = field(default_factory=threading.Lock, repr=False)
+
+    def add_timing(self, stage: str, seconds: float):
+        with self._lock:
+            self.timings[stage] = self.timings.get(stage, 0.0) + seconds
+
+    def add_llm_call(self):
+        with self._lock:
+            self.llm_calls += 1
+
+    def add_tokens(self, stage: str, prompt: int, completion: int, cost: float):
+        with self._lock:
+            entry = self.tokens.setdefault(stage, [0, 0, 0.0])
+            entry[0] += prompt
+            entry[1] += completion
+            entry[2] += cost
+
+    def total_tokens(self) -> int:
+        with self._lock:
+            return sum(p + c for p, c, _ in self.tokens.values())
+
+    def add_degraded(self, feature: str):
+        with self._lock:
+            if feature not in self.degraded:
+                self.degraded.append(feature)
+
+    def usage_snapshot(self) -> tuple:
+        """(stage -> [prompt, completion, cost], degraded) - bản copy cho token_usage.usage_block()."""
+        with self._lock:
+            return {k: list(v) for k, v in self.tokens.items()}, list(self.degraded)
+
+    def resource(self, key, factory, cleanup=None):
+        """
+        Tài nguyên giữ trong suốt request (vd lease của collection): factory() chạy 1 lần cho mỗi key,
+        cleanup(value) chạy ở end_request. Lock riêng: factory được phép ghi timing.
+        """
+        with self._resources_lock:
+            if key not in self._resources:
+                self._resources[key] = (factory(), cleanup)
+            return self._resources[key][0]
+
+    def close(self):
+        """Trả tài nguyên của request (end_request gọi)."""
+        with self._resources_lock:
+            resources, self._resources = self._resources, {}
+        for value, cleanup in resources.values():
+            if cleanup is not None:
+                try:
+                    cleanup(value)
+                except Exception:
+                    pass
+
+    def timings_block(self) -> dict:
+        """Block "timings" trả trong JSON response (ms, làm tròn)."""
+        with self._lock:
+            stages = {k: round(v * 1000, 2) for k, v in self.timings.items()}
+            llm_calls = self.llm_calls
+        return {
+            "total_ms": round((time.perf_counter() - self.started) * 1000, 2),
+            "stages_ms": stages,
+            "llm_calls": llm_calls,
+        }
+
+
+_current: ContextVar[Optional[RequestContext]] = ContextVar("request_context", default=None)
+
+
+def begin_request(**kwargs):
+    """Tạo RequestContext mới cho request hiện tại, trả về (ctx, token) để reset."""
+    ctx = RequestContext(**kwargs)
+    token = _current.set(ctx)
+    return ctx, token
+
+
+def end_request(token):
+    ctx = _current.get()
+    _current.reset(token)
+    if ctx is not None:
+        ctx.close()
+
+
+@contextmanager
+def bind(ctx: Optional[RequestContext]):
+    """Gắn ctx làm request hiện tại trong thread đang chạy (worker tự quản lý, vd batch)."""
+    token = _current.set(ctx)
+    try:
+        yield ctx
+    finally:
+        _current.reset(token)
+
+
+def current() -> Optional[RequestContext]:
+    """RequestContext hiện tại, None nếu đang chạy ngoài request (script, test)."""
+    return _current.get()
+
+
+def current_session_id() -> str:
+    """Session của request hiện tại; request ẩn danh / ngoài request -> "default"."""
+    ctx = _current.get()
+    return (ctx.session_id if ctx is not None else None) or "default"
+
+
+def web_search_enabled() -> bool:
+    """Toggle web search của request hiện tại (không còn state class-level dùng chung giữa các request)."""
+    ctx = _current.get()
+    if ctx is not None and ctx.web_search is not None:
+        return ctx.web_search
+    return config.WEB_SEARCH_DEFAULT
@@ -0,0 +1,163 @@
+# src/utils/stubs.py
+"""
+Stub LLM / web search dùng cho load-test và test offline.
+- StubChatModel: LangChain chat model giả, trả lời sau một độ trễ ngẫu nhiên.
+- StubSearchRun: thay cho DuckDuckGoSearchRun (có .invoke(query) -> str).
+- StubSearcher / StubFetcher: searcher + fetcher giả cho WebRetriever (HTML tổng hợp, không ra mạng).
+- LatencyModel: phân phối độ trễ cấu hình bằng chuỗi, vd "fixed:0.2",
+  "uniform:0.1,0.5", "lognormal:-1.0,0.5", "exp:0.3".
+- install_stubs(): thay create_langchain_llm + DuckDuckGoSearchRun + searcher/fetcher của WebRetriever.
+"""
+import random
+import threading
+import time
+from typing import Any, List, Optional
+
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, BaseMessage
+from langchain_core.outputs import ChatGeneration, ChatResult
+
+
+class LatencyModel:
+    """Sinh độ trễ (giây) theo phân phối đơn giản, an toàn khi gọi từ nhiều thread."""
+
+    KINDS = ("fixed", "uniform", "lognormal", "exp")
+
+    def __init__(self, kind: str = "fixed", params=(0.0,), error_rate: float = 0.0, seed: int = None):
+        if kind not in self.KINDS:
+            raise ValueError(f"Unknown latency distribution: {kind!r} (expected one of {self.KINDS})")
+        self.kind = kind
+        self.params = tuple(float(p) for p in params)
+        self.error_rate = float(error_rate)
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+
+    @classmethod
+    def parse(cls, spec: str, error_rate: float = 0.0, seed: int = None) -> "LatencyModel":
+        """Parse chuỗi dạng "kind:p1,p2" (vd "uniform:0.1,0.5")."""
+        kind, _, raw = (spec or "fixed:0").partition(":")
+        params = [p for p in raw.split(",") if p.strip()] or ["0"]
+        return cls(kind.strip(), params, error_rate=error_rate, seed=seed)
+
+    def sample(self) -> float:
+        with self._lock:
+            if self.kind == "fixed":
+                value = self.params[0]
+            elif self.kind == "uniform":
+                value = self._rng.uniform(self.params[0], self.params[1])
+            elif self.kind == "lognormal":
+                value = self._rng.lognormvariate(self.params[0], self.params[1])
+            else:
+                value = self._rng.expovariate(1.0 / self.params[0]) if self.params[0] > 0 else 0.0
+        return max(0.0, value)
+
+    def should_fail(self) -> bool:
+        if self.error_rate <= 0:
+            return False
+        with self._lock:
+            return self._rng.random() < self.error_rate
+
+    def __repr__(self):
+        return f"LatencyModel({self.kind}:{','.join(str(p) for p in self.params)}, error_rate={self.error_rate})"
+
+
+class StubChatModel(BaseChatModel):
+    """
+    Chat model giả: ngủ theo LatencyModel rồi trả về câu trả lời cố định.
+    Tương thích với chain của LangChain (invoke / prompt | llm).
+    """
+
+    model: str = "stub"
+    temperature: float = 0.0
+    latency: Any = None
+    reply: str = "retrieve"
+
+    @property
+    def _llm_type(self) -> str:
+        return "stub-chat"
+
+    def _generate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                  run_manager=None, **kwargs) -> ChatResult:
+        latency = self.latency or LatencyModel()
+        time.sleep(latency.sample())
+        if latency.should_fail():
+            raise RuntimeError("stub LLM injected failure")
+        prompt_chars = sum(len(str(m.content)) for m in messages)
+        message = AIMessage(
+            content=self.reply,
+            usage_metadata={
+                "input_tokens": max(1, prompt_chars // 4),
+                "output_tokens": max(1, len(self.reply) // 4),
+                "total_tokens": max(1, prompt_chars // 4) + max(1, len(self.reply) // 4),
+            },
+        )
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+
+class StubSearchRun:
+    """Thay cho DuckDuckGoSearchRun: .invoke(query) -> chuỗi kết quả giả."""
+
+    def __init__(self, latency: LatencyModel = None, result_chars: int = 3000):
+        self.latency = latency or LatencyModel()
+        self.result_chars = result_chars
+
+    def invoke(self, query, *args, **kwargs) -> str:
+        time.sleep(self.latency.sample())
+        if self.latency.should_fail():
+            raise RuntimeError("stub search injected failure")
+        sentence = f"Stub web result about {query}. "
+        return (sentence * (self.result_chars // len(sentence) + 1))[:self.result_chars]
+
+
+class StubSearcher:
+    """Searcher giả: n URL stub://... kèm snippet."""
+
+    def __init__(self, latency: LatencyModel = None):
+        self.latency = latency or LatencyModel()
+
+    def search(self, query: str, n: int) -> list:
+        time.sleep(self.latency.sample())
+        if self.latency.should_fail():
+            raise RuntimeError("stub search injected failure")
+        return [{"url": f"stub://page/{i}", "title": f"Stub page {i}", "snippet": f"Stub snippet {i} about {query}."}
+                for i in range(n)]
+
+
+class StubFetcher:
+    """Fetcher giả: các trang "tải song song" -> ngủ 1 lần theo LatencyModel, trả HTML tổng hợp."""
+
+    def __init__(self, latency: LatencyModel = None, paragraphs: int = 6):
+        self.latency = latency or LatencyModel()
+        self.paragraphs = paragraphs
+
+    def fetch(self, urls: list) -> dict:
+        time.sleep(self.latency.sample())
+        if self.latency.should_fail():
+            return {}
+        body = "".join(f"<p>Paragraph {i} of a synthetic page used for offline load tests.</p>"
+                       for i in range(self.paragraphs))
+        return {url: f"<html><body><article><h1>{url}</h1>{body}</article></body></html>" for url in urls}
+
+
+def install_stubs(llm_latency: LatencyModel = None, search_latency: LatencyModel = None, reply: str = "retrieve"):
+    """
+    Thay toàn bộ dependency mạng bằng stub (gọi TRƯỚC warmup / request đầu tiên,
+    vì agent giữ tham chiếu tới LLM client khi IntentRouter được tạo).
+    - create_langchain_llm -> StubChatModel (vẫn đi qua pool / semaphore / retry của llm_manager)
+    - make_web_tool (DuckDuckGoSearchRun trong knowledge_agent) -> StubSearchRun
+    - make_web_retriever -> WebRetriever với StubSearcher + StubFetcher (rank vẫn dùng embedding model thật)
+    """
+    from src.utils import llm_manager
+    import src.agents.knowledge_agent as knowledge_agent
+    from src.agents.web_retriever import WebRetriever
+
+    llm_latency = llm_latency or LatencyModel()
+    search_latency = search_latency or LatencyModel()
+
+    llm_manager.set_llm_override(
+        lambda model_name, temperature: StubChatModel(
+            model=model_name, temperature=temperature, latency=llm_latency, reply=reply
+        )
+    )
+    knowledge_agent.make_web_tool = lambda: StubSearchRun(search_latency)
+    knowledge_agent.make_web_retriever = lambda: WebRetriever(StubSearcher(search_latency), StubFetcher(search_latency))
@@ -0,0 +1,228 @@
+# src/utils/token_usage.py
+"""
+Token + chi phí của mọi LLM call, gộp theo request / session / agent / stage, và token budget.
+- TokenUsageCallback (gắn vào LLM trong create_langchain_llm): lấy usage_metadata của response
+  (Gemini, stub); thiếu thì ước lượng bằng tokens.count_tokens (prompt + câu trả lời).
+- stage = stage timed() đang chạy lúc gọi LLM ("KnowledgeAgent.llm_answer", "router.classify_intent",
+  "memory.summarize"...); agent = phần trước dấu "." của stage.
+- Chi phí theo LLM_PRICES ("model=input/output", USD cho 1M token).
+- Budget: REQUEST_TOKEN_BUDGET, SESSION_TOKEN_BUDGET (0 = không giới hạn). Không chặn request:
+  should_degrade(feature, need) -> True khi phần còn lại < need, nơi gọi bỏ bước tốn token
+  (LLM summary, phân loại intent bằng LLM, tóm tắt memory); history_budget() thu nhỏ history.
+- Response: block "usage" (usage_block); metrics: llm_tokens_total{model,kind,agent,stage},
+  llm_cost_usd_total{model,agent}, llm_tokens_per_request, token_budget_degradations_total{feature}.
+"""
+import threading
+from collections import OrderedDict
+from typing import Optional
+
+from langchain_core.callbacks import BaseCallbackHandler
+
+from src.utils.config_loader import config
+from src.utils.metrics import Counter, Histogram, current_stage
+from src.utils.request_context import current, current_session_id
+from src.utils.tokens import count_tokens
+
+LLM_TOKENS = Counter("llm_tokens_total", "LLM tokens", ["model", "kind", "agent", "stage"])
+LLM_COST = Counter("llm_cost_usd_total", "Estimated LLM spend in USD", ["model", "agent"])
+TOKENS_PER_REQUEST = Histogram(
+    "llm_tokens_per_request", "LLM tokens (prompt + completion) used while serving one request",
+    buckets=(0, 100, 250, 500, 1000, 2000, 4000, 8000, 16000, 32000, 64000),
+)
+BUDGET_DEGRADATIONS = Counter("token_budget_degradations_total", "Steps skipped or shrunk by token budget",
+                              ["feature"])
+
+UNKNOWN_STAGE = "unknown"
+
+_sessions = OrderedDict()  # session_id -> [prompt, completion, cost], LRU giới hạn CONTEXT_MAX_SESSIONS
+_sessions_lock = threading.Lock()
+_prices = None
+
+
+def parse_prices(spec: str) -> dict:
+    """"gemini-2.5-flash=0.30/2.50" -> {"gemini-2.5-flash": (0.30, 2.50)} (USD / 1M token)."""
+    prices = {}
+    for part in (spec or "").split(","):
+        model, _, value = part.partition("=")
+        price_in, _, price_out = value.partition("/")
+        if model.strip() and price_in.strip():
+            prices[model.strip()] = (float(price_in), float(price_out or price_in))
+    return prices
+
+
+def cost_usd(model: str, prompt: int, completion: int) -> float:
+    global _prices
+    if _prices is None:
+        _prices = parse_prices(config.LLM_PRICES)
+    price_in, price_out = _prices.get(model, (0.0, 0.0))
+    return (prompt * price_in + completion * price_out) / 1_000_000
+
+
+def agent_of(stage: str) -> str:
+    return stage.split(".", 1)[0] if stage else UNKNOWN_STAGE
+
+
+def record(model: str, prompt: int, completion: int, stage: str = None):
+    """Ghi token của 1 LLM call vào metrics + request hiện tại + session hiện tại."""
+    stage = stage or current_stage() or UNKNOWN_STAGE
+    agent = agent_of(stage)
+    cost = cost_usd(model, prompt, completion)
+    LLM_TOKENS.inc(prompt, model=model, kind="prompt", agent=agent, stage=stage)
+    LLM_TOKENS.inc(completion, model=model, kind="completion", agent=agent, stage=stage)
+    LLM_COST.inc(cost, model=model, agent=agent)
+    ctx = current()
+    if ctx is not None:
+        ctx.add_tokens(stage, prompt, completion, cost)
+    session_id = current_session_id()
+    with _sessions_lock:
+        totals = _sessions.get(session_id)
+        if totals is None:
+            totals = _sessions[session_id] = [0, 0, 0.0]
+            while len(_sessions) > config.CONTEXT_MAX_SESSIONS:
+                _sessions.popitem(last=False)
+        else:
+            _sessions.move_to_end(session_id)
+        totals[0] += prompt
+        totals[1] += completion
+        totals[2] += cost
+
+
+def record_result(model: str, result, prompt_text: str = ""):
+    """
+    Ghi token của 1 ChatResult không đi qua callback (bản hedge bị bỏ kết quả: provider vẫn tính tiền);
+    thiếu usage_metadata thì ước lượng như callback.
+    """
+    generations = getattr(result, "generations", None) or []
+    usage = getattr(getattr(generations[0], "message", None), "usage_metadata", None) if generations else None
+    if usage:
+        prompt, completion = int(usage.get("input_tokens", 0)), int(usage.get("output_tokens", 0))
+    else:
+        prompt = count_tokens(prompt_text)
+        completion = count_tokens("".join(getattr(g, "text", "") for g in generations))
+    record(model, prompt, completion)
+
+
+def session_usage(session_id: str = None) -> dict:
+    with _sessions_lock:
+        prompt, completion, cost = _sessions.get(session_id or current_session_id(), (0, 0, 0.0))
+    return {"prompt_tokens": prompt, "completion_tokens": completion, "total_tokens": prompt + completion,
+            "cost_usd": round(cost, 6)}
+
+
+# =========================== Budget ===========================
+def remaining_tokens() -> Optional[int]:
+    """Token còn lại của request / session hiện tại (nhỏ hơn của 2 budget), None nếu không giới hạn."""
+    limits = []
+    ctx = current()
+    if config.REQUEST_TOKEN_BUDGET > 0 and ctx is not None:
+        limits.append(config.REQUEST_TOKEN_BUDGET - ctx.total_tokens())
+    if config.SESSION_TOKEN_BUDGET > 0:
+        limits.append(config.SESSION_TOKEN_BUDGET - session_usage()["total_tokens"])
+    return max(0, min(limits)) if limits else None
+
+
+def _degrade(feature: str):
+    BUDGET_DEGRADATIONS.inc(feature=feature)
+    ctx = current()
+    if ctx is not None:
+        ctx.add_degraded(feature)
+
+
+def should_degrade(feature: str, need: int) -> bool:
+    """True (và ghi lại) khi budget còn ít hơn `need` token -> bỏ bước `feature`."""
+    remaining = remaining_tokens()
+    if remaining is None or remaining >= need:
+        return False
+    _degrade(feature)
+    return True
+
+
+def history_budget(default: int) -> int:
+    """
+    Trần token cho block history: bình thường = default; budget còn ít -> tối đa 1/4 phần còn lại
+    (phần lớn dành cho context retrieval + câu trả lời).
+    """
+    remaining = remaining_tokens()
+    if remaining is None or remaining // 4 >= default:
+        return default
+    _degrade("history")
+    return remaining // 4
+
+
+# =========================== Response ===========================
+def usage_block(ctx=None) -> dict:
+    """Block "usage" trả trong JSON response: token + chi phí của request theo agent / stage, tổng của session."""
+    ctx = ctx or current()
+    by_stage, by_agent = {}, {}
+    prompt = completion = 0
+    cost = 0.0
+    tokens, degraded = ctx.usage_snapshot() if ctx is not None else ({}, [])
+    for stage, (p, c, usd) in tokens.items():
+        by_stage[stage] = {"prompt_tokens": p, "completion_tokens": c}
+        by_agent[agent_of(stage)] = by_agent.get(agent_of(stage), 0) + p + c
+        prompt, completion, cost = prompt + p, completion + c, cost + usd
+    return {
+        "prompt_tokens": prompt,
+        "completion_tokens": completion,
+        "total_tokens": prompt + completion,
+        "cost_usd": round(cost, 6),
+        "by_agent": by_agent,
+        "by_stage": by_stage,
+        "session": session_usage(ctx.session_id if ctx is not None else None),
+        "degraded": degraded,
+    }
+
+
+# =========================== LangChain callback ===========================
+def _usage_from_result(response):
+    """(prompt, completion) từ usage_metadata của generation đầu tiên / llm_output, None nếu không có."""
+    try:
+        message = response.generations[0][0].message
+        usage = getattr(message, "usage_metadata", None)
+        if usage:
+            return int(usage.get("input_tokens", 0)), int(usage.get("output_tokens", 0))
+    except (AttributeError, IndexError):
+        pass
+    usage = (response.llm_output or {}).get("token_usage") or (response.llm_output or {}).get("usage_metadata")
+    if usage:
+        prompt = usage.get("prompt_tokens", usage.get("input_tokens", 0))
+        completion = usage.get("completion_tokens", usage.get("output_tokens", 0))
+        return int(prompt), int(completion)
+    return None
+
+
+def _generated_text(response) -> str:
+    try:
+        return "".join(g.text for gens in response.generations for g in gens)
+    except AttributeError:
+        return ""
+
+
+class TokenUsageCallback(BaseCallbackHandler):
+    """Callback gắn vào LLM -> ghi token của mọi call (kể cả bên trong chain) theo stage đang chạy."""
+
+    def __init__(self, model: str):
+        self.model = model
+        self._prompts = {}  # run_id -> (prompt text, stage) để ước lượng khi response không có usage
+        self._lock = threading.Lock()
+
+    def on_chat_model_start(self, serialized, messages, *, run_id, **kwargs):
+        text = "\n".join(str(m.content) for batch in messages for m in batch)
+        with self._lock:
+            self._prompts[run_id] = (text, current_stage())
+
+    def on_llm_start(self, serialized, prompts, *, run_id, **kwargs):
+        with self._lock:
+            self._prompts[run_id] = ("\n".join(prompts), current_stage())
+
+    def on_llm_end(self, response, *, run_id, **kwargs):
+        with self._lock:
+            prompt_text, stage = self._prompts.pop(run_id, ("", None))
+        usage = _usage_from_result(response)
+        if usage is None:
+            usage = (count_tokens(prompt_text), count_tokens(_generated_text(response)))
+        record(self.model, usage[0], usage[1], stage=stage)
+
+    def on_llm_error(self, error, *, run_id, **kwargs):
+        with self._lock:
+            self._prompts.pop(run_id, None)
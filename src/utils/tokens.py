@@ -0,0 +1,62 @@
+# src/utils/tokens.py
+"""
+Đếm token cục bộ (ước lượng) cho prompt budget.
+- Dùng tiktoken (cl100k_base) nếu có; Gemini tokenizer khác nhưng đủ gần để làm budget.
+  File BPE được tải 1 lần vào TIKTOKEN_CACHE_DIR (warmup / lúc build Docker image), sau đó không cần mạng.
+- Fallback (không có tiktoken / không tải được BPE): ~4 ký tự / token.
+"""
+import os
+import threading
+
+from src.utils.config_loader import config
+
+_encoding = None
+_encoding_lock = threading.Lock()
+_encoding_failed = False
+
+
+def _get_encoding():
+    global _encoding, _encoding_failed
+    if _encoding is not None or _encoding_failed:
+        return _encoding
+    with _encoding_lock:
+        if _encoding is None and not _encoding_failed:
+            try:
+                import tiktoken
+                # tiktoken đọc cache dir từ env (mặc định /tmp, mất khi restart container)
+                os.environ.setdefault("TIKTOKEN_CACHE_DIR", os.path.abspath(config.TIKTOKEN_CACHE_DIR))
+                _encoding = tiktoken.get_encoding("cl100k_base")
+            except Exception:
+                _encoding_failed = True
+    return _encoding
+
+
+def warm() -> bool:
+    """Nạp encoding trước (warmup), False nếu đang dùng fallback ~4 ký tự / token."""
+    return _get_encoding() is not None
+
+
+def count_tokens(text: str) -> int:
+    if not text:
+        return 0
+    enc = _get_encoding()
+    if enc is None:
+        return max(1, len(text) // 4)
+    return len(enc.encode(text, disallowed_special=()))
+
+
+def truncate_to_tokens(text: str, max_tokens: int, keep: str = "head") -> str:
+    """Cắt text còn tối đa max_tokens (keep="head" giữ phần đầu, "tail" giữ phần cuối)."""
+    if max_tokens <= 0 or not text:
+        return ""
+    enc = _get_encoding()
+    if enc is None:
+        limit = max_tokens * 4
+        if len(text) <= limit:
+            return text
+        return text[:limit] if keep == "head" else text[-limit:]
+    ids = enc.encode(text, disallowed_special=())
+    if len(ids) <= max_tokens:
+        return text
+    ids = ids[:max_tokens] if keep == "head" else ids[-max_tokens:]
+    return enc.decode(ids)
@@ -0,0 +1,77 @@
+# src/vectordb/chunk_store.py
+"""
+Chunk store: text của các chunk, đánh địa chỉ theo vector id của FAISS.
+- chunks.bin  : tất cả chunk (UTF-8) nối liền nhau
+- offsets.npy : int64[n + 1], chunk i = chunks.bin[offsets[i]:offsets[i + 1]]
+Cả 2 file được mmap khi mở -> thời gian load và RSS không phụ thuộc kích thước corpus;
+chỉ page của chunk được đọc mới vào RAM (OS page cache, dùng chung giữa các worker).
+"""
+import mmap
+import os
+from pathlib import Path
+
+import numpy as np
+
+BLOB_FILE = "chunks.bin"
+OFFSETS_FILE = "offsets.npy"
+
+
+class ChunkStore:
+    def __init__(self, directory: str):
+        self.directory = Path(directory)
+        self.offsets = np.load(self.directory / OFFSETS_FILE, mmap_mode="r")
+        self._file = open(self.directory / BLOB_FILE, "rb")
+        size = os.fstat(self._file.fileno()).st_size
+        # mmap không nhận file rỗng -> corpus rỗng dùng bytes rỗng
+        self._mmap = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ) if size else None
+        self._view = memoryview(self._mmap) if self._mmap is not None else memoryview(b"")
+
+    @staticmethod
+    def exists(directory: str) -> bool:
+        d = Path(directory)
+        return (d / BLOB_FILE).exists() and (d / OFFSETS_FILE).exists()
+
+    @staticmethod
+    def write(directory: str, texts) -> int:
+        """Ghi danh sách text (thứ tự = vector id). Ghi file tạm rồi rename -> reader không thấy file ghi dở."""
+        d = Path(directory)
+        d.mkdir(parents=True, exist_ok=True)
+        offsets = [0]
+        tmp_blob = d / f"{BLOB_FILE}.tmp"
+        with open(tmp_blob, "wb") as f:
+            for text in texts:
+                data = text.encode("utf-8")
+                f.write(data)
+                offsets.append(offsets[-1] + len(data))
+        tmp_offsets = d / f"{OFFSETS_FILE}.tmp"
+        with open(tmp_offsets, "wb") as f:
+            np.save(f, np.asarray(offsets, dtype=np.int64))
+        os.replace(tmp_offsets, d / OFFSETS_FILE)
+        os.replace(tmp_blob, d / BLOB_FILE)
+        return len(offsets) - 1
+
+    def __len__(self) -> int:
+        return len(self.offsets) - 1
+
+    @property
+    def nbytes(self) -> int:
+        return int(self.offsets[-1]) if len(self.offsets) else 0
+
+    def get_bytes(self, i: int) -> memoryview:
+        """Slice UTF-8 của chunk i (zero-copy, trỏ thẳng vào vùng mmap)."""
+        if not 0 <= i < len(self):
+            raise IndexError(f"chunk id {i} out of range (0..{len(self) - 1})")
+        return self._view[int(self.offsets[i]):int(self.offsets[i + 1])]
+
+    def get(self, i: int) -> str:
+        """Text của chunk i (decode chỉ đúng chunk được hỏi)."""
+        return str(self.get_bytes(i), "utf-8")
+
+    def get_many(self, ids) -> list:
+        return [self.get(int(i)) for i in ids]
+
+    def close(self):
+        self._view.release()
+        if self._mmap is not None:
+            self._mmap.close()
+        self._file.close()
@@ -0,0 +1,315 @@
+# src/vectordb/collection_manager.py
+"""
+Collection: 1 corpus có tên với index riêng (index.faiss + chunks.bin + offsets.npy + manifest.json).
+- "default" = FAISS_INDEX_PATH (index cũ, get_vector_db()): load cùng warmup, không bao giờ bị evict.
+- Collection khác nằm ở COLLECTIONS_DIR/<name>, chỉ load ở lần dùng đầu tiên (lazy). Tổng RAM của
+  các collection đang load (resident_bytes) vượt COLLECTIONS_MEMORY_BUDGET_MB -> evict collection
+  dùng lâu nhất (LRU) cho tới khi dưới ngân sách.
+- Mọi collection dùng chung embedding model của "default": manifest khác model -> lỗi khi load.
+- Request chọn collection qua field "collection" (/chat, /route, /chat/batch); agent lấy VectorDB bằng
+  collection_db(). Mỗi request giữ 1 lease -> collection bị evict giữa chừng vẫn search được,
+  mmap chỉ đóng khi lease cuối cùng được trả.
+- Hot-swap: index có phiên bản (index_versions: <base>/versions/<v> + CURRENT). reload() load version
+  CURRENT bên cạnh version đang phục vụ, chạy thử 1 search rồi đổi entry atomically: request mới dùng
+  version mới, request đang chạy giữ version cũ tới khi xong (lease) rồi version cũ mới được đóng.
+  start_watcher(): thread nền gọi check_for_updates() mỗi INDEX_WATCH_INTERVAL giây.
+- Metrics: collection_events_total{collection,event="load"|"evict"|"swap"},
+  collection_resident_bytes{collection}, stage_latency_seconds{stage="collections.load"}.
+"""
+import logging
+import re
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+from dataclasses import dataclass
+from pathlib import Path
+
+from src.utils import request_context
+from src.utils.config_loader import config
+from src.utils.metrics import Counter, Gauge, timed
+from src.vectordb import faiss_index, index_versions
+
+logger = logging.getLogger("collections")
+
+DEFAULT_COLLECTION = "default"
+_NAME_RE = re.compile(r"^[A-Za-z0-9][A-Za-z0-9_.-]{0,63}$")
+
+COLLECTION_EVENTS = Counter("collection_events_total", "Collection loads and evictions", ["collection", "event"])
+COLLECTION_RESIDENT_BYTES = Gauge("collection_resident_bytes", "In-memory size of loaded collection indexes",
+                                  ["collection"])
+
+
+class CollectionNotFound(KeyError):
+    def __init__(self, name: str):
+        super().__init__(name)
+        self.name = name
+
+    def __str__(self):
+        return f"collection {self.name!r} not found"
+
+
+@dataclass
+class _Entry:
+    name: str
+    db: object               # VectorDB
+    nbytes: int = 0
+    leases: int = 0
+    retired: bool = False    # đã evict / thay bằng version mới: đóng khi lease cuối cùng được trả
+
+
+class CollectionManager:
+    def __init__(self, root: str = None, memory_budget_mb: float = None):
+        self.root = Path(root or config.COLLECTIONS_DIR)
+        budget_mb = config.COLLECTIONS_MEMORY_BUDGET_MB if memory_budget_mb is None else memory_budget_mb
+        self.memory_budget = int(budget_mb * 1024 * 1024)
+        self._entries = OrderedDict()  # name -> _Entry, thứ tự LRU (cuối = dùng gần nhất)
+        self._default = None           # _Entry của "default": ngoài LRU, không evict, không tính vào ngân sách
+        self._lock = threading.Lock()
+        self._load_locks = {}          # name -> Lock: 2 request cùng collection chỉ load 1 lần
+
+    # =========================== Lookup ===========================
+    def path(self, name: str) -> Path:
+        """Thư mục gốc của collection (chứa CURRENT + versions/, hoặc index phẳng kiểu cũ)."""
+        if name == DEFAULT_COLLECTION:
+            return Path(config.FAISS_INDEX_PATH)
+        if not _NAME_RE.match(name or ""):
+            raise CollectionNotFound(name)
+        return self.root / name
+
+    def exists(self, name: str) -> bool:
+        try:
+            return (name == DEFAULT_COLLECTION
+                    or (index_versions.resolve(self.path(name)) / faiss_index.INDEX_FILE).exists())
+        except CollectionNotFound:
+            return False
+
+    def names(self) -> list:
+        names = [DEFAULT_COLLECTION]
+        if self.root.is_dir():
+            names += sorted(p.name for p in self.root.iterdir()
+                            if p.name != DEFAULT_COLLECTION and self.exists(p.name))
+        return names
+
+    # =========================== Lease ===========================
+    def acquire(self, name: str = None) -> _Entry:
+        """Lease collection `name` (load nếu chưa load); trả lại bằng release(entry)."""
+        name = name or DEFAULT_COLLECTION
+        if name == DEFAULT_COLLECTION:
+            db = faiss_index.get_vector_db()
+            with self._lock:
+                if self._default is None or self._default.db is not db:
+                    self._default = _Entry(DEFAULT_COLLECTION, db, nbytes=db.resident_bytes)
+                self._default.leases += 1
+                return self._default
+        with self._lock:
+            entry = self._lease_locked(name)
+            if entry is not None:
+                return entry
+            load_lock = self._load_locks.setdefault(name, threading.Lock())
+        with load_lock:
+            with self._lock:
+                entry = self._lease_locked(name)
+                if entry is not None:
+                    return entry
+            entry = self._load(name)
+            with self._lock:
+                entry.leases += 1
+                self._entries[name] = entry
+                to_close = self._evict_locked(keep=name)
+        for victim in to_close:
+            victim.db.close()
+        return entry
+
+    def release(self, entry: _Entry):
+        with self._lock:
+            entry.leases -= 1
+            close = entry.retired and entry.leases == 0
+        if close:
+            entry.db.close()
+
+    @contextmanager
+    def lease(self, name: str = None):
+        """with manager.lease("papers") as db: ... -> VectorDB, không bị đóng trong khối with."""
+        entry = self.acquire(name)
+        try:
+            yield entry.db
+        finally:
+            self.release(entry)
+
+    def _lease_locked(self, name: str):
+        entry = self._entries.get(name)
+        if entry is not None:
+            entry.leases += 1
+            self._entries.move_to_end(name)
+        return entry
+
+    # =========================== Load / evict ===========================
+    def _load(self, name: str) -> _Entry:
+        path = index_versions.resolve(self.path(name))
+        if not (path / faiss_index.INDEX_FILE).exists():
+            raise CollectionNotFound(name)
+        shared = faiss_index.get_vector_db()
+        model = faiss_index.read_manifest(path).get("embedding_model", shared.embedding_name)
+        if model != shared.embedding_name:
+            raise ValueError(f"collection {name!r} was built with {model}, server embeds with {shared.embedding_name}")
+        with timed("collections.load"):
+            db = faiss_index.VectorDB(index_path=str(path), embedding_name=model, embeddings=shared.embeddings)
+        if db.vectordb is None:
+            raise ValueError(f"collection {name!r} could not be loaded from {path}")
+        entry = _Entry(name, db, nbytes=db.resident_bytes)
+        COLLECTION_EVENTS.inc(collection=name, event="load")
+        COLLECTION_RESIDENT_BYTES.set(entry.nbytes, collection=name)
+        return entry
+
+    def _evict_locked(self, keep: str) -> list:
+        """Evict LRU tới khi tổng resident <= ngân sách (trừ `keep`); trả entry đóng được ngay."""
+        total = sum(e.nbytes for e in self._entries.values())
+        to_close = []
+        for name in list(self._entries):
+            if total <= self.memory_budget:
+                break
+            if name == keep:
+                continue
+            entry = self._entries.pop(name)
+            entry.retired = True
+            total -= entry.nbytes
+            COLLECTION_EVENTS.inc(collection=name, event="evict")
+            COLLECTION_RESIDENT_BYTES.set(0, collection=name)
+            if entry.leases == 0:
+                to_close.append(entry)
+        return to_close
+
+    def evict(self, name: str) -> bool:
+        """Evict 1 collection ngay (request đang dùng vẫn giữ tới khi xong)."""
+        with self._lock:
+            entry = self._entries.pop(name, None)
+            if entry is None:
+                return False
+            entry.retired = True
+            close = entry.leases == 0
+        COLLECTION_EVENTS.inc(collection=name, event="evict")
+        COLLECTION_RESIDENT_BYTES.set(0, collection=name)
+        if close:
+            entry.db.close()
+        return True
+
+    # =========================== Hot-swap ===========================
+    def reload(self, name: str = None) -> dict:
+        """
+        Đổi collection đang load sang version CURRENT: load version mới bên cạnh bản cũ, 1 search thử,
+        rồi đổi atomically. Collection chưa load -> không làm gì (lần load sau tự dùng CURRENT).
+        """
+        name = name or DEFAULT_COLLECTION
+        if name == DEFAULT_COLLECTION:
+            self.release(self.acquire(name))  # "default" luôn được phục vụ -> bảo đảm đã có entry
+        with self._lock:
+            load_lock = self._load_locks.setdefault(name, threading.Lock())
+        with load_lock:
+            with self._lock:
+                old = self._default if name == DEFAULT_COLLECTION else self._entries.get(name)
+            version = index_versions.current_version(self.path(name))
+            target = index_versions.resolve(self.path(name))
+            if old is None or Path(old.db.index_path) == target:
+                return {"collection": name, "version": version, "swapped": False}
+            new = self._load(name)
+            with timed("collections.probe"):
+                new.db.search_documents("warmup", k=1)  # page index + chunk store vào RAM trước khi nhận traffic
+            with self._lock:
+                if name == DEFAULT_COLLECTION:
+                    self._default = new
+                    faiss_index.set_vector_db(new.db)
+                elif self._entries.get(name) is old:
+                    self._entries[name] = new  # giữ vị trí LRU
+                old.retired = True
+                close = old.leases == 0
+        COLLECTION_EVENTS.inc(collection=name, event="swap")
+        if close:
+            old.db.close()
+        logger.info(f"[COLLECTIONS] {name}: swapped to version {version} ({old.leases} requests still on the old one)")
+        return {"collection": name, "version": version, "swapped": True}
+
+    def check_for_updates(self) -> list:
+        """reload() mọi collection đang load mà CURRENT đã trỏ sang version khác; trả tên collection đã đổi."""
+        with self._lock:
+            loaded = list(self._entries.items())
+            if self._default is not None:
+                loaded.append((DEFAULT_COLLECTION, self._default))
+        swapped = []
+        for name, entry in loaded:
+            if Path(entry.db.index_path) != index_versions.resolve(self.path(name)):
+                if self.reload(name)["swapped"]:
+                    swapped.append(name)
+        return swapped
+
+    def stats(self) -> dict:
+        with self._lock:
+            loaded = {name: (e.nbytes, e.leases) for name, e in self._entries.items()}
+            resident = sum(nbytes for nbytes, _ in loaded.values())
+            if self._default is not None:
+                loaded[DEFAULT_COLLECTION] = (self._default.nbytes, self._default.leases)
+        collections = []
+        for name in self.names():
+            manifest = faiss_index.read_manifest(index_versions.resolve(self.path(name)))
+            nbytes, leases = loaded.get(name, (0, 0))
+            collections.append({
+                "name": name,
+                "loaded": name in loaded or (name == DEFAULT_COLLECTION and faiss_index._shared is not None),
+                "resident_bytes": nbytes,
+                "in_use": leases,
+                "version": index_versions.current_version(self.path(name)),
+                "chunks": manifest.get("chunks"),
+                "built_at": manifest.get("built_at"),
+            })
+        return {"memory_budget_bytes": self.memory_budget, "resident_bytes": resident, "collections": collections}
+
+
+_manager = None
+_manager_lock = threading.Lock()
+
+
+def get_collection_manager() -> CollectionManager:
+    global _manager
+    with _manager_lock:
+        if _manager is None:
+            _manager = CollectionManager()
+        return _manager
+
+
+def current_collection() -> str:
+    ctx = request_context.current()
+    return (ctx.collection if ctx is not None else None) or DEFAULT_COLLECTION
+
+
+def collection_db(name: str = None):
+    """
+    VectorDB của collection `name` (mặc định: collection request hiện tại chọn).
+    Trong request: lease giữ tới end_request (mọi thread của request dùng chung 1 lease).
+    Ngoài request (script, test): không giữ lease.
+    """
+    name = name or current_collection()
+    manager = get_collection_manager()
+    ctx = request_context.current()
+    if ctx is None:
+        entry = manager.acquire(name)
+        manager.release(entry)
+        return entry.db
+    entry = ctx.resource(("collection", name), lambda: manager.acquire(name), manager.release)
+    return entry.db
+
+
+def start_watcher(interval: float = None):
+    """Thread nền: mỗi `interval` giây đổi các collection đang load sang version CURRENT mới; trả Event để dừng."""
+    interval = config.INDEX_WATCH_INTERVAL if interval is None else interval
+    if interval <= 0:
+        return None
+    stop = threading.Event()
+
+    def loop():
+        while not stop.wait(interval):
+            try:
+                get_collection_manager().check_for_updates()
+            except Exception as e:
+                logger.exception(f"[COLLECTIONS] index watcher error: {e}")
+
+    threading.Thread(target=loop, name="index-watcher", daemon=True).start()
+    return stop
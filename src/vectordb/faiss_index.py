@@ -1,49 +1,188 @@
 # src/vectordb/faiss_index.py
 """
-Vector DB wrapper using LangChain FAISS vectorstore + HuggingFace embeddings.
-- Build from chunks (list of texts)
-- Provide as_retriever() for use with RetrievalQA
+Vector DB: FAISS index (vector) + ChunkStore (text, mmap) + EmbeddingBuilder (torch / ONNX backend).
+- Build from chunks (list of texts): index.faiss + chunks.bin + offsets.npy + manifest.json trong index_path
+- search_documents_batch(): nhiều query -> 1 lần encode theo batch + 1 lần FAISS search nhiều query
+- search_documents(): embed query + FAISS search, đo thời gian từng bước; text của chunk
+  được cắt từ ChunkStore theo vector id khi cần (không unpickle cả corpus lúc load)
+- Index cũ của LangChain (index.faiss + index.pkl) được chuyển sang ChunkStore 1 lần khi load
+- sentence-transformers (torch) / onnxruntime chỉ được import khi tạo VectorDB
+  -> import module này (và src.api.main) không kéo theo torch.
 """
+import json
 import os
+import pickle
+import threading
+import time
 from pathlib import Path
-from langchain_community.vectorstores import FAISS
-from langchain_community.embeddings import HuggingFaceEmbeddings
+
+import faiss
+import numpy as np
 from langchain_core.documents import Document
 
+from src.embeddings.embedding_builder import EmbeddingBuilder
+from src.utils import admission
 from src.utils.config_loader import config
+from src.utils.metrics import FAISS_SEARCH_LATENCY, timed
+from src.vectordb import index_versions
+from src.vectordb.chunk_store import ChunkStore
+
+INDEX_FILE = "index.faiss"
+LEGACY_DOCSTORE_FILE = "index.pkl"
+MANIFEST_FILE = "manifest.json"
+
+
+def read_manifest(index_path) -> dict:
+    """manifest.json của 1 index ({} nếu index build trước khi có manifest)."""
+    path = Path(index_path) / MANIFEST_FILE
+    if not path.exists():
+        return {}
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
 
 class VectorDB:
-    def __init__(self, index_path: str = None, embedding_name: str = None):
+    def __init__(self, index_path: str = None, embedding_name: str = None, embeddings=None):
         self.index_path = index_path or config.FAISS_INDEX_PATH
         self.embedding_name = embedding_name or config.EMBEDDING_MODEL
-        self.embeddings = HuggingFaceEmbeddings(model_name=self.embedding_name)
-        self.vectordb = None
+        if embeddings is None:
+            embeddings = EmbeddingBuilder(model_name=self.embedding_name)
+        self.embeddings = embeddings
+        self.index = None   # faiss.Index
+        self.store = None   # ChunkStore, id i <-> vector i
+        self.manifest = {}
         self._load_if_exists()
 
+    @property
+    def vectordb(self):
+        """Index đã load (None nếu chưa build) - agent dùng để kiểm tra có FAISS hay không."""
+        return self.index if self.store is not None else None
+
+    @property
+    def resident_bytes(self) -> int:
+        """RAM của index đã load (~ kích thước index.faiss); chunks.bin / offsets.npy là mmap nên không tính."""
+        if self.vectordb is None:
+            return 0
+        return os.path.getsize(os.path.join(self.index_path, INDEX_FILE))
+
+    def close(self):
+        """Bỏ index khỏi RAM và đóng mmap (collection bị evict / thay thế)."""
+        if self.store is not None:
+            self.store.close()
+        self.index, self.store = None, None
+
     def _load_if_exists(self):
         idx_dir = Path(self.index_path)
-        if idx_dir.exists():
-            try:
-                self.vectordb = FAISS.load_local(self.index_path, self.embeddings)
-            except Exception:
-                self.vectordb = None
+        if not (idx_dir / INDEX_FILE).exists():
+            return
+        try:
+            if not ChunkStore.exists(idx_dir) and (idx_dir / LEGACY_DOCSTORE_FILE).exists():
+                self._migrate_legacy_docstore(idx_dir)
+            self.index = faiss.read_index(str(idx_dir / INDEX_FILE))
+            self.store = ChunkStore(idx_dir)
+            self.manifest = read_manifest(idx_dir)
+            if len(self.store) != self.index.ntotal:
+                raise ValueError(f"chunk store has {len(self.store)} chunks, index has {self.index.ntotal} vectors")
+        except Exception as e:
+            print(f"[VectorDB] cannot load index at {idx_dir}: {e}")
+            self.index, self.store = None, None
+
+    @staticmethod
+    def _migrate_legacy_docstore(idx_dir: Path):
+        """index.pkl (InMemoryDocstore của LangChain) -> chunks.bin + offsets.npy theo thứ tự vector id."""
+        with open(idx_dir / LEGACY_DOCSTORE_FILE, "rb") as f:
+            docstore, index_to_docstore_id = pickle.load(f)
+        texts = (docstore.search(index_to_docstore_id[i]).page_content for i in range(len(index_to_docstore_id)))
+        n = ChunkStore.write(idx_dir, texts)
+        print(f"[VectorDB] migrated {n} chunks from {LEGACY_DOCSTORE_FILE} to chunk store")
 
     def build_index(self, chunks: list):
         """
-        chunks: list of strings
+        chunks: list of strings (thứ tự = vector id)
         """
-        docs = [Document(page_content=c) for c in chunks]
-        self.vectordb = FAISS.from_documents(docs, self.embeddings)
+        vectors = np.asarray(self.embeddings.embed_documents(chunks), dtype=np.float32)
+        index = faiss.IndexFlatL2(vectors.shape[1])
+        index.add(vectors)
+
         os.makedirs(self.index_path, exist_ok=True)
-        self.vectordb.save_local(self.index_path)
+        ChunkStore.write(self.index_path, chunks)
+        tmp = os.path.join(self.index_path, f"{INDEX_FILE}.tmp")
+        faiss.write_index(index, tmp)
+        os.replace(tmp, os.path.join(self.index_path, INDEX_FILE))
+        self.manifest = {
+            "embedding_model": self.embedding_name,
+            "dimension": int(vectors.shape[1]),
+            "chunks": len(chunks),
+            "built_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        }
+        tmp = os.path.join(self.index_path, f"{MANIFEST_FILE}.tmp")
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(self.manifest, f, indent=2)
+        os.replace(tmp, os.path.join(self.index_path, MANIFEST_FILE))
 
-    def get_retriever(self, k: int = 4):
-        if not self.vectordb:
-            raise ValueError("Vector DB is not built")
-        return self.vectordb.as_retriever(search_kwargs={"k": k})
+        if self.store is not None:
+            self.store.close()
+        self.index = index
+        self.store = ChunkStore(self.index_path)
+
+    def _documents(self, scores, ids) -> list:
+        docs = []
+        for score, i in zip(scores, ids):
+            if i < 0:  # FAISS trả -1 khi index có ít hơn k vector
+                continue
+            docs.append(Document(page_content=self.store.get(int(i)),
+                                 metadata={"chunk_id": int(i), "score": float(score)}))
+        return docs
 
     def similarity_search(self, query: str, k: int = 4):
+        return [d.page_content for d in self.search_documents(query, k=k)]
+
+    def search_documents(self, query: str, k: int = 4) -> list:
+        """
+        Retrieval tách 2 bước (embed query -> FAISS search) để đo riêng từng bước.
+        Trả về list[Document] (metadata: chunk_id, score).
+        """
         if not self.vectordb:
             return []
-        docs = self.vectordb.similarity_search(query, k=k)
-        return [d.page_content for d in docs]
+        with admission.slot("embedding"), timed("retrieval.embed_query"):
+            embedding = np.asarray([self.embeddings.embed_query(query)], dtype=np.float32)
+        with timed("retrieval.faiss_search"):
+            start = time.perf_counter()
+            scores, ids = self.index.search(embedding, k)
+            FAISS_SEARCH_LATENCY.observe(time.perf_counter() - start)
+        return self._documents(scores[0], ids[0])
+
+    def search_documents_batch(self, queries: list, k: int = 4) -> list:
+        """list[list[Document]] theo thứ tự queries: embed cả batch 1 lần, FAISS search 1 lần."""
+        if not self.vectordb or not queries:
+            return [[] for _ in queries]
+        with admission.slot("embedding"), timed("retrieval.embed_batch"):
+            embeddings = np.asarray(self.embeddings.embed_documents(list(queries)), dtype=np.float32)
+        with timed("retrieval.faiss_search_batch"):
+            start = time.perf_counter()
+            scores, ids = self.index.search(embeddings, k)
+            FAISS_SEARCH_LATENCY.observe(time.perf_counter() - start)
+        return [self._documents(s, i) for s, i in zip(scores, ids)]
+
+
+_shared = None
+_shared_lock = threading.Lock()
+
+
+def get_vector_db() -> VectorDB:
+    """
+    VectorDB dùng chung (version CURRENT của config.FAISS_INDEX_PATH): embedding model + index chỉ load
+    1 lần cho mọi agent; sau hot-swap (set_vector_db) là VectorDB của version mới.
+    """
+    global _shared
+    with _shared_lock:
+        if _shared is None:
+            _shared = VectorDB(index_path=str(index_versions.resolve(config.FAISS_INDEX_PATH)))
+        return _shared
+
+
+def set_vector_db(db: VectorDB):
+    """Đổi VectorDB dùng chung (hot-swap sang version mới, xem CollectionManager.reload)."""
+    global _shared
+    with _shared_lock:
+        _shared = db
@@ -0,0 +1,67 @@
+# src/vectordb/index_versions.py
+"""
+Index có phiên bản trong 1 thư mục gốc (FAISS_INDEX_PATH hoặc COLLECTIONS_DIR/<name>):
+    <base>/versions/<version>/   index.faiss + chunks.bin + offsets.npy + manifest.json
+    <base>/CURRENT               tên version đang phục vụ
+- Build ghi vào version mới (thư mục riêng), xong hết mới publish(): ghi CURRENT.tmp rồi os.replace
+  -> reader luôn thấy CURRENT cũ hoặc mới, không bao giờ thấy index ghi dở.
+- Chưa có CURRENT (index build trước khi có version) -> dùng chính <base> như trước.
+- prune(): xóa version cũ, giữ `keep` version mới nhất + version đang phục vụ. Process đang mmap
+  file của version bị xóa vẫn đọc được (Linux chỉ giải phóng khi đóng file).
+"""
+import os
+import shutil
+from datetime import datetime
+from pathlib import Path
+
+CURRENT_FILE = "CURRENT"
+VERSIONS_DIR = "versions"
+
+
+def current_version(base) -> str | None:
+    path = Path(base) / CURRENT_FILE
+    if not path.exists():
+        return None
+    return path.read_text(encoding="utf-8").strip() or None
+
+
+def resolve(base) -> Path:
+    """Thư mục index đang phục vụ của `base`."""
+    version = current_version(base)
+    return Path(base) / VERSIONS_DIR / version if version else Path(base)
+
+
+def new_version(base) -> tuple:
+    """(version, thư mục rỗng để build vào); tên version sắp xếp được theo thời gian."""
+    version = datetime.now().strftime("%Y%m%d-%H%M%S-%f")
+    path = Path(base) / VERSIONS_DIR / version
+    path.mkdir(parents=True)
+    return version, path
+
+
+def publish(base, version: str):
+    """Trỏ CURRENT sang `version` (atomic)."""
+    if not (Path(base) / VERSIONS_DIR / version).is_dir():
+        raise FileNotFoundError(f"index version {version!r} not found in {base}")
+    tmp = Path(base) / f"{CURRENT_FILE}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        f.write(version)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, Path(base) / CURRENT_FILE)
+
+
+def versions(base) -> list:
+    root = Path(base) / VERSIONS_DIR
+    return sorted(p.name for p in root.iterdir() if p.is_dir()) if root.is_dir() else []
+
+
+def prune(base, keep: int) -> list:
+    """Xóa version cũ (giữ `keep` bản mới nhất và bản CURRENT), trả tên các version đã xóa."""
+    current = current_version(base)
+    removed = []
+    for version in versions(base)[:-keep] if keep > 0 else versions(base):
+        if version != current:
+            shutil.rmtree(Path(base) / VERSIONS_DIR / version, ignore_errors=True)
+            removed.append(version)
+    return removed
@@ -0,0 +1,128 @@
+import threading
+import time
+
+from fastapi.testclient import TestClient
+
+from src.utils import admission, llm_manager
+from src.utils.config_loader import config
+
+
+def _hold(limiter, session, order, release_event):
+    with limiter.slot(session):
+        order.append(session)
+        release_event.wait(5)
+
+
+def test_queue_full_and_timeout_are_rejected():
+    limiter = admission.FairLimiter("test-bounded", concurrency=1, max_queue=1, max_wait=0.2)
+    release = threading.Event()
+    holder = threading.Thread(target=_hold, args=(limiter, "a", [], release))
+    holder.start()
+    time.sleep(0.05)
+
+    errors = []
+    waiter = threading.Thread(target=lambda: errors.append(_try(limiter, "b")))
+    waiter.start()
+    time.sleep(0.05)
+    full = _try(limiter, "c")  # 1 slot đang giữ + 1 đang chờ -> hàng đợi đầy
+    waiter.join()
+    release.set()
+    holder.join()
+
+    assert isinstance(full, admission.Rejected) and full.reason == "queue_full"
+    assert full.retry_after >= 1
+    assert isinstance(errors[0], admission.Rejected) and errors[0].reason == "timeout"
+    assert limiter.active == 0 and limiter.waiting == 0
+    assert admission.ADMISSION_REJECTED.value(pool="test-bounded", reason="timeout") == 1
+
+
+def test_llm_pools_read_their_limit_from_admission_limits(monkeypatch):
+    monkeypatch.setattr(config, "ADMISSION_LIMITS", "knowledge=8,llm=3,llm:gemini-2.5-pro=1")
+    assert admission.pool_limit("llm:gemini-2.5-flash") == 3
+    assert admission.pool_limit("llm:gemini-2.5-pro") == 1
+    assert llm_manager._model_limiter("stub-limits-from-config").concurrency == 3
+
+
+def _try(limiter, session):
+    try:
+        with limiter.slot(session):
+            return None
+    except admission.Rejected as e:
+        return e
+
+
+def test_sessions_are_served_round_robin():
+    limiter = admission.FairLimiter("test-fair", concurrency=1, max_queue=20, max_wait=5)
+    order, release = [], threading.Event()
+    release.set()
+    blocker = threading.Event()
+    first = threading.Thread(target=_hold, args=(limiter, "heavy", order, blocker))
+    first.start()
+    time.sleep(0.05)
+
+    threads = []
+    for session in ["heavy"] * 4 + ["light"]:  # "light" đến sau 4 request của "heavy"
+        t = threading.Thread(target=_hold, args=(limiter, session, order, release))
+        t.start()
+        threads.append(t)
+        time.sleep(0.02)
+    blocker.set()
+    first.join()
+    for t in threads:
+        t.join()
+
+    # không phải chờ hết hàng của "heavy": tới lượt ngay sau 1 request của heavy
+    assert order.index("light") <= 2
+    assert len(order) == 6
+
+
+def test_api_returns_429_with_retry_after(monkeypatch):
+    from src.api import main
+    from src.api.routers import chat_router
+
+    class SlowAgent:
+        def run_admitted(self, query, **kwargs):
+            with admission.slot("test-api"):
+                time.sleep(0.3)
+            return {"answer": "ok"}
+
+    admission._limiters["test-api"] = admission.FairLimiter("test-api", concurrency=1, max_queue=0, max_wait=1)
+    monkeypatch.setattr(chat_router, "manual_agent", lambda name: SlowAgent())
+    client = TestClient(main.app)
+
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(
+        client.post("/chat", json={"query": "q", "agent": "code"}))) for _ in range(2)]
+    for t in threads:
+        t.start()
+        time.sleep(0.05)
+    for t in threads:
+        t.join()
+
+    statuses = sorted(r.status_code for r in results)
+    assert statuses == [200, 429]
+    rejected = next(r for r in results if r.status_code == 429)
+    assert int(rejected.headers["Retry-After"]) >= 1
+    assert rejected.json()["pool"] == "test-api"
+
+
+def test_rejection_with_fallback_answer_is_degraded_not_429(monkeypatch):
+    from src.api import main
+    from src.api.routers import chat_router
+
+    class FallbackAgent:
+        def run_admitted(self, query, **kwargs):
+            try:
+                with admission.slot("test-fallback"):
+                    return {"answer": "from web"}
+            except admission.Rejected:
+                return {"answer": "from faiss"}  # pool đầy -> đường fallback vẫn trả lời
+
+    admission._limiters["test-fallback"] = admission.FairLimiter("test-fallback", concurrency=1, max_queue=0)
+    admission._limiters["test-fallback"].active = 1  # pool đang đầy
+    monkeypatch.setattr(chat_router, "manual_agent", lambda name: FallbackAgent())
+
+    resp = TestClient(main.app).post("/chat", json={"query": "q", "agent": "knowledge"})
+    assert resp.status_code == 200
+    assert resp.json()["answer"] == "from faiss"
+    assert "overloaded:test-fallback" in resp.json()["usage"]["degraded"]
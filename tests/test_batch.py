@@ -0,0 +1,119 @@
+import json
+import time
+from collections import OrderedDict
+
+import numpy as np
+from fastapi.testclient import TestClient
+
+from src.agents import knowledge_agent
+from src.agents.batch import answer_batch
+from src.agents.memory import memory_manager
+from src.utils import admission, llm_manager
+from src.utils.config_loader import config
+from src.utils.metrics import LLM_CALLS_PER_REQUEST
+from src.utils.stubs import LatencyModel, StubChatModel
+from src.vectordb import faiss_index
+from src.vectordb.faiss_index import VectorDB
+
+
+class CountingEmbeddings:
+    """Embedding giả 8 chiều, đếm số lần encode (không cần tải model)."""
+
+    def __init__(self):
+        self.calls = 0
+
+    def _vec(self, text):
+        rng = np.random.default_rng(sum(text.encode()) % (2 ** 32))
+        return rng.standard_normal(8).tolist()
+
+    def embed_documents(self, texts):
+        self.calls += 1
+        return [self._vec(t) for t in texts]
+
+    def embed_query(self, text):
+        self.calls += 1
+        return self._vec(text)
+
+
+def _agent(tmp_path, monkeypatch, llm_seconds=0.05):
+    # short memory của agent ghi vào tmp_path, không đụng data/processed/conversation_history.json
+    monkeypatch.setattr(memory_manager, "DEFAULT_MEMORY_FILE", str(tmp_path / "conversation_history.json"))
+    monkeypatch.setattr(memory_manager, "SESSION_MEMORY_DIR", str(tmp_path / "sessions"))
+    monkeypatch.setattr(memory_manager, "_sessions", OrderedDict())
+    embeddings = CountingEmbeddings()
+    db = VectorDB(index_path=str(tmp_path), embeddings=embeddings)
+    db.build_index([f"paper chunk {i} about attention" for i in range(50)])
+    monkeypatch.setattr(faiss_index, "get_vector_db", lambda: db)
+    monkeypatch.setattr(knowledge_agent, "get_long_term_memory", lambda: None)
+    llm_manager.set_llm_override(
+        lambda m, t: StubChatModel(model=m, latency=LatencyModel("fixed", (llm_seconds,)), reply="stub answer")
+    )
+    return knowledge_agent.KnowledgeAgent(), embeddings
+
+
+def test_batch_embeds_once_and_beats_sequential(tmp_path, monkeypatch):
+    monkeypatch.setattr(config, "ADMISSION_LIMITS", f"{config.ADMISSION_LIMITS},llm=8")
+    agent, embeddings = _agent(tmp_path, monkeypatch)
+    queries = [f"question {i} about attention" for i in range(24)]
+    try:
+        start = time.perf_counter()
+        for q in queries:
+            agent.answer_from_docs(q, agent.vector_db.search_documents(q, k=4))
+        sequential = time.perf_counter() - start
+
+        embeddings.calls = 0
+        start = time.perf_counter()
+        items = list(answer_batch(queries, agent=agent, concurrency=8, k=4))
+        batched = time.perf_counter() - start
+    finally:
+        llm_manager.set_llm_override(None)
+
+    results, summary = items[:-1], items[-1]
+    assert embeddings.calls == 1  # 1 lần encode cho cả batch
+    assert sorted(r["index"] for r in results) == list(range(len(queries)))
+    assert all(r["answer"] == "stub answer" and len(r["sources"]) == 4 for r in results)
+    assert summary == {"done": True, "count": 24, "errors": 0, "total_ms": summary["total_ms"]}
+    assert batched * 3 < sequential
+
+
+def test_batch_endpoint_streams_jsonl(tmp_path, monkeypatch):
+    from src.api import main
+    from src.api.routers import chat_router
+
+    agent, _ = _agent(tmp_path, monkeypatch, llm_seconds=0.0)
+    monkeypatch.setattr(chat_router, "manual_agent", lambda name: agent)
+    before = LLM_CALLS_PER_REQUEST.snapshot()
+    try:
+        resp = TestClient(main.app).post("/chat/batch", json={"queries": ["a", "b", "c"], "concurrency": 2})
+    finally:
+        llm_manager.set_llm_override(None)
+
+    assert resp.status_code == 200
+    assert resp.headers["content-type"].startswith("application/x-ndjson")
+    lines = [json.loads(line) for line in resp.text.splitlines()]
+    assert {line["query"] for line in lines[:-1]} == {"a", "b", "c"}
+    assert lines[-1]["done"] is True and lines[-1]["count"] == 3
+    after = LLM_CALLS_PER_REQUEST.snapshot()
+    assert after["count"] == before["count"] + 1  # 1 request, ghi sau khi stream xong
+    assert after["sum"] - before["sum"] == 3      # không phải 0: LLM call chạy trong lúc stream
+
+
+def test_batch_reports_overload_per_item(tmp_path, monkeypatch):
+    agent, _ = _agent(tmp_path, monkeypatch, llm_seconds=0.0)
+
+    def overloaded(query, docs, history=""):
+        if query == "b":
+            raise admission.Rejected("llm:stub", "queue_full", 3)
+        return "ok"
+
+    monkeypatch.setattr(agent, "answer_from_docs", overloaded)
+    try:
+        items = list(answer_batch(["a", "b"], agent=agent, concurrency=2))
+    finally:
+        llm_manager.set_llm_override(None)
+
+    by_query = {item["query"]: item for item in items[:-1]}
+    assert by_query["a"]["answer"] == "ok"
+    assert by_query["b"]["status"] == 429 and by_query["b"]["retry_after"] == 3
+    assert by_query["b"]["pool"] == "llm:stub"
+    assert items[-1]["errors"] == 1
@@ -0,0 +1,82 @@
+import json
+import time
+
+from frontend.chat_index import ChatIndex, to_match_query
+
+
+def _write(path, title, messages):
+    data = {"title": title, "created_at": path.stem, "messages": messages}
+    path.write_text(json.dumps(data, ensure_ascii=False), encoding="utf-8")
+    return data
+
+
+def _chat(i):
+    return [{"role": "user", "content": f"question {i} about topic{i}"},
+            {"role": "assistant", "content": f"answer {i}: filler text for session {i}"}]
+
+
+def test_match_query_is_safe_and_prefix_matches_last_word():
+    assert to_match_query('attention "OR" (code') == '"attention" "OR" "code"*'
+    assert to_match_query("  ?! ") == ""
+
+
+def test_incremental_updates_and_ranked_snippets(tmp_path):
+    chats = tmp_path / "chats"
+    chats.mkdir()
+    index = ChatIndex(tmp_path / "index.sqlite", chats)
+
+    a = chats / "a.json"
+    data = _write(a, "Attention", [{"role": "user", "content": "Giải thích cơ chế attention trong transformer"}])
+    index.index_session(a, data)
+    data["messages"].append({"role": "assistant", "content": "Attention weights every token; attention is all you need."})
+    _write(a, "Attention", data["messages"])
+    index.index_session(a, data)  # chỉ thêm message mới
+    b = chats / "b.json"
+    index.index_session(b, _write(b, "RAG", [{"role": "user", "content": "what is retrieval augmented generation"}]))
+
+    hits = index.search("attention")
+    assert [h["session"] for h in hits] == ["a.json"]  # 1 kết quả mỗi session
+    assert hits[0]["position"] == 1 and "**Attention**" in hits[0]["snippet"]
+    assert index.search("giai thich")[0]["role"] == "user"  # không phân biệt dấu
+    assert index.search("retri")[0]["title"] == "RAG"     # tiền tố
+    assert index.search("nothing here") == []
+    assert index._conn.execute("SELECT count(*) FROM messages").fetchone()[0] == 3
+
+    index.remove_session(b)
+    assert index.search("retrieval") == []
+    assert set(index.titles()) == {"a.json"}
+
+
+def test_sync_picks_up_external_changes(tmp_path):
+    chats = tmp_path / "chats"
+    chats.mkdir()
+    for i in range(3):
+        _write(chats / f"{i}.json", f"Chat {i}", _chat(i))
+    index = ChatIndex(tmp_path / "index.sqlite", chats)
+    assert index.sync() == {"indexed": 3, "removed": 0}
+    assert index.sync() == {"indexed": 0, "removed": 0}  # không đổi -> không đọc lại file
+
+    (chats / "0.json").unlink()
+    _write(chats / "1.json", "Chat 1", [{"role": "user", "content": "rewritten entirely"}])
+    assert index.sync() == {"indexed": 1, "removed": 1}
+    assert index.search("topic0") == [] and index.search("topic1") == []
+    assert index.search("rewritten")[0]["session"] == "1.json"
+
+    # index lưu trên đĩa: mở lại không cần index lại
+    index.close()
+    assert ChatIndex(tmp_path / "index.sqlite", chats).sync() == {"indexed": 0, "removed": 0}
+
+
+def test_search_is_fast_across_thousands_of_sessions(tmp_path):
+    chats = tmp_path / "chats"
+    chats.mkdir()
+    index = ChatIndex(tmp_path / "index.sqlite", chats)
+    for i in range(3000):
+        path = chats / f"{i}.json"
+        index.index_session(path, {"title": f"Chat {i}", "messages": _chat(i)})
+    start = time.perf_counter()
+    hits = index.search("topic1234")
+    elapsed = time.perf_counter() - start
+    assert [h["session"] for h in hits] == ["1234.json"]
+    assert elapsed < 0.05
+    assert len(index.search("filler", limit=20)) == 20
@@ -0,0 +1,57 @@
+import numpy as np
+
+from src.vectordb.chunk_store import ChunkStore
+from src.vectordb.faiss_index import VectorDB
+
+
+class FakeEmbeddings:
+    """Embedding giả 8 chiều (không cần tải model)."""
+
+    def _vec(self, text):
+        rng = np.random.default_rng(abs(hash(text)) % (2 ** 32))
+        return rng.standard_normal(8).tolist()
+
+    def embed_documents(self, texts):
+        return [self._vec(t) for t in texts]
+
+    def embed_query(self, text):
+        return self._vec(text)
+
+
+def test_chunk_store_roundtrip(tmp_path):
+    texts = ["attention is all you need", "", "Tiếng Việt có dấu ✓", "x" * 10000]
+    assert ChunkStore.write(tmp_path, texts) == 4
+
+    store = ChunkStore(tmp_path)
+    assert len(store) == 4
+    assert [store.get(i) for i in range(4)] == texts
+    assert isinstance(store.get_bytes(2), memoryview)
+    assert store.nbytes == sum(len(t.encode("utf-8")) for t in texts)
+    try:
+        store.get(4)
+    except IndexError:
+        pass
+    else:
+        raise AssertionError("IndexError expected")
+    store.close()
+
+
+def test_vector_db_reads_text_from_chunk_store(tmp_path):
+    chunks = [f"chunk number {i}" for i in range(20)]
+    db = VectorDB(index_path=str(tmp_path), embeddings=FakeEmbeddings())
+    db.build_index(chunks)
+    assert not (tmp_path / "index.pkl").exists()
+
+    reopened = VectorDB(index_path=str(tmp_path), embeddings=FakeEmbeddings())
+    docs = reopened.search_documents("chunk number 7", k=3)
+    assert docs[0].page_content == "chunk number 7"
+    assert docs[0].metadata["chunk_id"] == 7
+    assert len(docs) == 3
+
+
+if __name__ == "__main__":
+    import tempfile
+    from pathlib import Path
+
+    test_chunk_store_roundtrip(Path(tempfile.mkdtemp()))
+    test_vector_db_reads_text_from_chunk_store(Path(tempfile.mkdtemp()))
@@ -0,0 +1,55 @@
+from pathlib import Path
+
+from tokenizers import Tokenizer, models, pre_tokenizers, processors, trainers
+from transformers import PreTrainedTokenizerFast
+
+from src.ingestion.chunking import TextChunker
+
+TEXT = Path("data/processed/Attention Is All You Need.txt").read_text(encoding="utf-8")
+
+
+def _fast_tokenizer(corpus: str) -> PreTrainedTokenizerFast:
+    """Fast tokenizer thật (Rust, có offsets) train tại chỗ -> test không cần tải model."""
+    tok = Tokenizer(models.WordLevel(unk_token="[UNK]"))
+    tok.pre_tokenizer = pre_tokenizers.BertPreTokenizer()
+    tok.train_from_iterator([corpus], trainers.WordLevelTrainer(special_tokens=["[UNK]", "[CLS]", "[SEP]"]))
+    tok.post_processor = processors.TemplateProcessing(
+        single="[CLS] $A [SEP]", special_tokens=[("[CLS]", 1), ("[SEP]", 2)]
+    )
+    return PreTrainedTokenizerFast(tokenizer_object=tok, unk_token="[UNK]", cls_token="[CLS]", sep_token="[SEP]")
+
+
+def test_token_chunks_fit_model_limit():
+    tokenizer = _fast_tokenizer(TEXT)
+    chunker = TextChunker(mode="tokens", max_tokens=128, overlap_tokens=24, tokenizer=tokenizer)
+    text = chunker.clean_text(TEXT)
+    chunks = chunker.chunk_text(text)
+
+    stats = chunker.token_stats(chunks)
+    assert stats["truncated_chunks"] == 0 and stats["tokens_dropped"] == 0
+    for chunk in chunks:
+        assert len(tokenizer(chunk)["input_ids"]) <= 128  # kể cả [CLS] / [SEP]
+
+    # phần lớn chunk kết thúc ở ranh giới câu, chunk liền nhau có overlap
+    ends = sum(1 for c in chunks[:-1] if c.rstrip().endswith((".", "?", "!")))
+    assert ends >= 0.8 * (len(chunks) - 1)
+    overlapping = sum(1 for a, b in zip(chunks, chunks[1:]) if b.split(". ")[0] in a)
+    assert overlapping >= 0.5 * (len(chunks) - 1)
+
+    # không mất nội dung: mọi từ của text đều nằm trong ít nhất 1 chunk
+    covered = set(" ".join(chunks).split())
+    assert set(text.split()) <= covered
+
+
+def test_word_chunks_are_truncated():
+    tokenizer = _fast_tokenizer(TEXT)
+    words = TextChunker(mode="words", max_tokens=256, tokenizer=tokenizer)
+    stats = words.token_stats(words.chunk_text(words.clean_text(TEXT)))
+    # cửa sổ 500 từ luôn vượt 256 token -> phần lớn text không được embed
+    assert stats["truncated_chunks"] == stats["chunks"]
+    assert stats["dropped_ratio"] > 0.4
+
+
+if __name__ == "__main__":
+    test_token_chunks_fit_model_limit()
+    test_word_chunks_are_truncated()
@@ -0,0 +1,210 @@
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+import pytest
+
+from src.agents import knowledge_agent
+from src.agents.memory import memory_manager
+from src.utils import admission, circuit_breaker, llm_manager, request_context
+from src.utils.circuit_breaker import CircuitBreaker, CircuitOpen
+from src.utils.config_loader import config
+from src.utils.metrics import LLM_LATENCY
+from src.utils.stubs import LatencyModel, StubChatModel
+from src.vectordb import faiss_index
+from src.vectordb.faiss_index import VectorDB
+
+
+def _fail(breaker, times):
+    for _ in range(times):
+        with pytest.raises(RuntimeError):
+            with breaker.guard():
+                raise RuntimeError("backend down")
+
+
+def test_opens_on_errors_then_half_open_probe_closes():
+    breaker = CircuitBreaker("test-errors", min_calls=3, window=5, failure_rate=0.5, open_seconds=0.2)
+    with breaker.guard():
+        pass
+    _fail(breaker, 1)
+    assert breaker.state == "closed"  # chưa đủ min_calls
+    _fail(breaker, 1)
+    assert breaker.state == "open" and breaker.is_open()  # 2/3 call hỏng
+    with pytest.raises(CircuitOpen) as info:
+        breaker.call(lambda: "never called")
+    assert info.value.breaker == "test-errors" and info.value.retry_after >= 1
+
+    time.sleep(0.25)
+    assert not breaker.is_open()
+    breaker.allow()  # call thử duy nhất của half-open
+    with pytest.raises(CircuitOpen):
+        breaker.allow()
+    breaker.record(True, 0.01)
+    assert breaker.state == "closed"
+    assert breaker.call(lambda: "ok") == "ok"
+
+
+def test_failed_probe_reopens():
+    breaker = CircuitBreaker("test-probe", min_calls=2, window=4, open_seconds=0.1)
+    _fail(breaker, 2)
+    time.sleep(0.15)
+    _fail(breaker, 1)
+    assert breaker.state == "open" and breaker.is_open()
+
+
+def test_slow_calls_count_as_failures_but_admission_rejections_do_not():
+    breaker = CircuitBreaker("test-slow", slow_seconds=0.05, min_calls=3, window=3)
+    for _ in range(3):
+        with pytest.raises(admission.Rejected):
+            with breaker.guard():
+                raise admission.Rejected("search", "queue_full", 1)
+    assert breaker.snapshot()["window"] == 0
+    for _ in range(3):
+        breaker.call(time.sleep, 0.06)
+    assert breaker.state == "open"
+
+
+def test_llm_breaker_fails_fast(monkeypatch):
+    monkeypatch.setattr(circuit_breaker, "_breakers", {})
+    monkeypatch.setattr(config, "BREAKER_MIN_CALLS", 2)
+    monkeypatch.setattr(config, "LLM_MAX_RETRIES", 0)
+    calls = {"n": 0}
+
+    class BrokenModel(StubChatModel):
+        def _generate(self, messages, stop=None, run_manager=None, **kwargs):
+            calls["n"] += 1
+            raise RuntimeError("model unavailable")
+
+    llm_manager.set_llm_override(lambda m, t: BrokenModel(model=m))
+    try:
+        llm = llm_manager.create_langchain_llm("stub-breaker")
+        for _ in range(2):
+            with pytest.raises(RuntimeError):
+                llm.invoke("hi")
+        with pytest.raises(CircuitOpen):
+            llm.invoke("hi")
+    finally:
+        llm_manager.set_llm_override(None)
+    assert calls["n"] == 2  # call thứ 3 không tới model
+    assert circuit_breaker.snapshot()["llm:stub-breaker"]["state"] == "open"
+
+
+def test_llm_queue_wait_does_not_count_as_slow(monkeypatch):
+    monkeypatch.setattr(circuit_breaker, "_breakers", {})
+    monkeypatch.setattr(config, "BREAKER_SLOW_SECONDS", "llm=0.25")
+    monkeypatch.setattr(config, "BREAKER_MIN_CALLS", 2)
+    monkeypatch.setattr(config, "ADMISSION_LIMITS", "llm:stub-queued=1")
+    monkeypatch.setattr(config, "LLM_HEDGE", False)
+    llm_manager.set_llm_override(lambda m, t: StubChatModel(model=m, latency=LatencyModel("fixed", (0.1,))))
+    try:
+        llm = llm_manager.create_langchain_llm("stub-queued")
+        threads = [threading.Thread(target=llm.invoke, args=("hi",)) for _ in range(5)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()  # call cuối chờ slot ~0.4s, nhưng provider chỉ mất 0.1s
+    finally:
+        llm_manager.set_llm_override(None)
+    snap = circuit_breaker.snapshot()["llm:stub-queued"]
+    assert snap["state"] == "closed" and snap["failures"] == 0
+    latency = LLM_LATENCY.snapshot(model="stub-queued")
+    assert latency["count"] == 5 and latency["sum"] < 5 * 0.25
+
+
+class FakeEmbeddings:
+    def _vec(self, text):
+        rng = np.random.default_rng(sum(text.encode()) % (2 ** 32))
+        return rng.standard_normal(8).tolist()
+
+    def embed_documents(self, texts):
+        return [self._vec(t) for t in texts]
+
+    def embed_query(self, text):
+        return self._vec(text)
+
+
+class SlowFailingSearch:
+    """Web retriever + DuckDuckGo giả: chờ rồi lỗi (DuckDuckGo chặn / timeout)."""
+
+    def __init__(self, seconds):
+        self.seconds = seconds
+        self.calls = 0
+
+    def _fail(self, query):
+        self.calls += 1
+        time.sleep(self.seconds)
+        raise TimeoutError("search timed out")
+
+    retrieve = invoke = _fail
+
+
+def test_open_search_breaker_routes_web_requests_to_faiss(tmp_path, monkeypatch):
+    monkeypatch.setattr(circuit_breaker, "_breakers", {})
+    monkeypatch.setattr(config, "BREAKER_MIN_CALLS", 2)
+    db = VectorDB(index_path=str(tmp_path), embeddings=FakeEmbeddings())
+    db.build_index([f"paper chunk {i} about attention" for i in range(20)])
+    monkeypatch.setattr(faiss_index, "get_vector_db", lambda: db)
+    monkeypatch.setattr(knowledge_agent, "get_long_term_memory", lambda: None)
+    llm_manager.set_llm_override(lambda m, t: StubChatModel(model=m, reply="faiss answer"))
+    search = SlowFailingSearch(0.2)
+    try:
+        agent = knowledge_agent.KnowledgeAgent()
+        agent._web_retriever = agent._web_tool = search
+        results, durations, degraded = [], [], []
+        for i in range(3):
+            ctx, token = request_context.begin_request(web_search=True)
+            try:
+                start = time.perf_counter()
+                results.append(agent.run(f"what is attention {i}"))
+                durations.append(time.perf_counter() - start)
+                degraded.append(list(ctx.degraded))
+            finally:
+                request_context.end_request(token)
+    finally:
+        llm_manager.set_llm_override(None)
+
+    # request đầu: retriever + DuckDuckGo cùng lỗi -> mạch mở -> vẫn trả lời từ FAISS
+    assert search.calls == 2
+    assert [r["source"] for r in results] == ["faiss"] * 3
+    assert all(r["answer"] == "faiss answer" for r in results)
+    assert max(durations[1:]) < 0.2  # các request sau không chờ search
+    assert degraded == [["web_search"]] * 3
+
+
+class CountingLLM:
+    def __init__(self):
+        self.calls = 0
+
+    def invoke(self, prompt):
+        self.calls += 1
+        return "direct answer"
+
+
+def test_faiss_path_does_not_retry_llm_when_rejected_or_circuit_open(tmp_path, monkeypatch):
+    monkeypatch.setattr(memory_manager, "DEFAULT_MEMORY_FILE", str(tmp_path / "conversation_history.json"))
+    monkeypatch.setattr(memory_manager, "SESSION_MEMORY_DIR", str(tmp_path / "sessions"))
+    monkeypatch.setattr(memory_manager, "_sessions", OrderedDict())
+    db = VectorDB(index_path=str(tmp_path), embeddings=FakeEmbeddings())
+    db.build_index([f"paper chunk {i} about attention" for i in range(20)])
+    monkeypatch.setattr(faiss_index, "get_vector_db", lambda: db)
+    monkeypatch.setattr(knowledge_agent, "get_long_term_memory", lambda: None)
+    llm_manager.set_llm_override(lambda m, t: StubChatModel(model=m, reply="unused"))
+    try:
+        agent = knowledge_agent.KnowledgeAgent()
+    finally:
+        llm_manager.set_llm_override(None)
+    agent.llm = CountingLLM()
+
+    def raise_(exc):
+        def answer_from_docs(*args, **kwargs):
+            raise exc
+        return answer_from_docs
+
+    agent.answer_from_docs = raise_(CircuitOpen("llm:stub", 5))
+    result = agent.run("what is attention")
+    assert result["source"] == "model" and result["answer"].startswith("Xin lỗi")
+    agent.answer_from_docs = raise_(admission.Rejected("llm", "queue_full", 1))
+    with pytest.raises(admission.Rejected):
+        agent.run("what is attention")
+    assert agent.llm.calls == 0
@@ -0,0 +1,67 @@
+import hashlib
+import os
+
+from src.agents.code_sandbox import SandboxPool
+from src.utils.config_loader import config
+
+
+def test_code_sandbox():
+    config.SANDBOX_WALL_TIMEOUT = 3
+    config.SANDBOX_CPU_SECONDS = 1
+    config.SANDBOX_MAX_OUTPUT = 100
+    config.SANDBOX_MAX_RUNS = 3
+    pool = SandboxPool(size=1)
+    try:
+        # print + import được phép
+        assert pool.run("import math\nprint(math.sqrt(16))") == "4.0"
+
+        # cache: cùng snippet -> cùng kết quả, không chạy lại
+        assert pool.run("import math\nprint(math.sqrt(16))") == "4.0"
+
+        # import không được phép
+        assert "not allowed" in pool.run("import os\nprint(os.getcwd())")
+
+        # vòng lặp vô hạn -> timeout / CPU limit, worker được thay mới
+        out = pool.run("while True:\n    pass")
+        assert out.startswith("Error:"), out
+        # timeout / CPU limit phụ thuộc tải lúc chạy -> không cache
+        assert hashlib.sha256(b"while True:\n    pass").hexdigest() not in pool._cache
+        assert pool.run("print(1 + 1)") == "2"
+
+        # cấp phát lớn -> MemoryError thay vì OOM backend
+        out = pool.run("x = bytearray(4 * 1024 * 1024 * 1024)")
+        assert "Error" in out, out
+
+        # stdout bị cắt
+        out = pool.run("print('a' * 1000)")
+        assert "output truncated" in out
+    finally:
+        pool.shutdown()
+
+
+
+def test_worker_does_not_inherit_secrets_or_filesystem(monkeypatch):
+    monkeypatch.setenv("GOOGLE_API_KEY", "secret-key")
+    pool = SandboxPool(size=1)
+    try:
+        assert pool.run("print('ready')") == "ready"  # worker đã tự cô lập xong
+        worker = pool._idle.get()
+        pid = worker.process.pid
+        with open(f"/proc/{pid}/environ", "rb") as f:
+            environ = f.read()
+        assert b"secret-key" not in environ and b"GOOGLE_API_KEY" not in environ
+        if os.geteuid() == 0:  # root: chroot vào thư mục tạm + bỏ quyền root
+            assert os.readlink(f"/proc/{pid}/root") == os.path.realpath(worker.workdir)
+            with open(f"/proc/{pid}/status") as f:
+                uid_line = next(line for line in f if line.startswith("Uid:"))
+            assert uid_line.split()[1] != "0"
+        else:
+            assert os.readlink(f"/proc/{pid}/cwd") == os.path.realpath(worker.workdir)
+        pool._idle.put(worker)
+    finally:
+        pool.shutdown()
+    assert not os.path.exists(worker.workdir)
+
+
+if __name__ == "__main__":
+    test_code_sandbox()
@@ -0,0 +1,116 @@
+import zlib
+
+import numpy as np
+import pytest
+from fastapi.testclient import TestClient
+
+from src.utils import request_context
+from src.vectordb import collection_manager, faiss_index
+from src.vectordb.collection_manager import COLLECTION_EVENTS, COLLECTION_RESIDENT_BYTES, CollectionManager
+from src.vectordb.faiss_index import VectorDB
+
+
+class HashEmbeddings:
+    """Embedding giả 8 chiều, ổn định giữa các process (không cần tải model)."""
+
+    def _vec(self, text):
+        rng = np.random.default_rng(zlib.crc32(text.encode()))
+        return rng.standard_normal(8).tolist()
+
+    def embed_documents(self, texts):
+        return [self._vec(t) for t in texts]
+
+    def embed_query(self, text):
+        return self._vec(text)
+
+
+@pytest.fixture
+def collections(tmp_path, monkeypatch):
+    """3 collection (papers, manuals, notes) cùng kích thước + collection "default"."""
+    embeddings = HashEmbeddings()
+    default = VectorDB(index_path=str(tmp_path / "default"), embeddings=embeddings)
+    default.build_index([f"default chunk {i}" for i in range(10)])
+    monkeypatch.setattr(faiss_index, "get_vector_db", lambda: default)
+    root = tmp_path / "collections"
+    for name in ("papers", "manuals", "notes"):
+        VectorDB(index_path=str(root / name), embeddings=embeddings).build_index(
+            [f"{name} chunk {i}" for i in range(100)])
+    size = (root / "papers" / faiss_index.INDEX_FILE).stat().st_size
+    return root, size
+
+
+def test_lazy_load_and_lru_eviction(collections):
+    root, size = collections
+    manager = CollectionManager(root=str(root), memory_budget_mb=2.5 * size / (1024 * 1024))  # vừa 2 collection
+    assert manager.names() == ["default", "manuals", "notes", "papers"]
+    assert not any(c["loaded"] for c in manager.stats()["collections"] if c["name"] != "default")
+
+    loads = COLLECTION_EVENTS.value(collection="papers", event="load")
+    with manager.lease("papers") as db:
+        assert db.search_documents("papers chunk 3", k=1)[0].page_content == "papers chunk 3"
+    with manager.lease("papers"):
+        pass
+    assert COLLECTION_EVENTS.value(collection="papers", event="load") == loads + 1  # load 1 lần
+    assert COLLECTION_RESIDENT_BYTES.value(collection="papers") == size
+
+    with manager.lease("manuals"):
+        pass
+    with manager.lease("papers"):  # papers dùng gần nhất -> manuals là LRU
+        pass
+    evictions = COLLECTION_EVENTS.value(collection="manuals", event="evict")
+    with manager.lease("notes"):
+        pass
+    assert COLLECTION_EVENTS.value(collection="manuals", event="evict") == evictions + 1
+    assert COLLECTION_RESIDENT_BYTES.value(collection="manuals") == 0
+    stats = manager.stats()
+    assert {c["name"] for c in stats["collections"] if c["loaded"]} - {"default"} == {"papers", "notes"}
+    assert stats["resident_bytes"] == 2 * size <= stats["memory_budget_bytes"]
+
+
+def test_evicted_collection_stays_usable_until_released(collections):
+    root, size = collections
+    manager = CollectionManager(root=str(root), memory_budget_mb=1.5 * size / (1024 * 1024))  # vừa 1 collection
+    entry = manager.acquire("papers")
+    with manager.lease("manuals"):
+        pass
+    # papers bị evict nhưng request đang giữ lease vẫn search được
+    assert "papers" not in {c["name"] for c in manager.stats()["collections"] if c["loaded"]}
+    assert entry.db.search_documents("papers chunk 7", k=1)[0].page_content == "papers chunk 7"
+    manager.release(entry)
+    assert entry.db.vectordb is None  # lease cuối cùng trả -> đóng
+
+
+def test_request_selects_collection(collections, monkeypatch):
+    root, _ = collections
+    manager = CollectionManager(root=str(root))
+    monkeypatch.setattr(collection_manager, "_manager", manager)
+
+    def in_use():
+        return {c["name"]: c["in_use"] for c in manager.stats()["collections"]}["notes"]
+
+    ctx, token = request_context.begin_request()
+    try:
+        ctx.collection = "notes"
+        db = collection_manager.collection_db()
+        assert collection_manager.collection_db() is db  # 1 lease cho cả request
+        assert db.search_documents("notes chunk 1", k=1)[0].page_content == "notes chunk 1"
+        assert in_use() == 1
+    finally:
+        request_context.end_request(token)
+    assert in_use() == 0
+
+    assert collection_manager.collection_db() is faiss_index.get_vector_db()  # ngoài request -> default
+    with pytest.raises(collection_manager.CollectionNotFound):
+        manager.acquire("../papers")
+
+
+def test_api_lists_collections_and_rejects_unknown(collections, monkeypatch):
+    from src.api import main
+
+    root, _ = collections
+    monkeypatch.setattr(collection_manager, "_manager", CollectionManager(root=str(root)))
+    client = TestClient(main.app)
+    body = client.get("/collections").json()
+    assert [c["name"] for c in body["collections"]] == ["default", "manuals", "notes", "papers"]
+    resp = client.post("/chat", json={"query": "hi", "collection": "missing"})
+    assert resp.status_code == 404
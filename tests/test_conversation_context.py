@@ -0,0 +1,95 @@
+import time
+from collections import OrderedDict
+
+from src.agents.memory import conversation_context, memory_manager
+from src.agents.memory.conversation_context import ConversationContext, get_conversation_context
+from src.utils import llm_manager, request_context
+from src.utils.stubs import LatencyModel, StubChatModel
+from src.utils.tokens import count_tokens
+
+
+def test_context_stays_bounded():
+    llm_manager.set_llm_override(lambda m, t: StubChatModel(model=m, reply="User asked about transformers (Vaswani et al.)."))
+    ctx = ConversationContext(recent_turns=4, max_tokens=200, summary_max_tokens=60)
+
+    sizes = []
+    for i in range(30):
+        ctx.add_message("user", f"Question {i}: tell me more about attention " + "detail " * 20)
+        ctx.add_message("assistant", f"Answer {i}: " + "attention weights " * 30)
+        sizes.append(count_tokens(ctx.render()))
+
+    ctx._drain()  # chờ các lần gộp ở background xong
+    history = ctx.render()
+    assert "Summary of earlier conversation" in history
+    assert "Vaswani" in history
+    assert "Answer 29" in history          # lượt mới nhất luôn còn
+    assert "Question 0" not in history     # lượt cũ chỉ còn trong summary
+    assert max(sizes) <= 200               # không phình theo độ dài hội thoại
+    llm_manager.set_llm_override(None)
+
+
+def test_add_message_and_render_do_not_wait_for_fold():
+    llm_manager.set_llm_override(
+        lambda m, t: StubChatModel(model=m, latency=LatencyModel("fixed", (0.5,)), reply="summary")
+    )
+    ctx = ConversationContext(recent_turns=1)
+    try:
+        ctx.add_message("user", "first")
+        ctx.add_message("assistant", "second")  # "first" -> fold 0.5s ở background
+        time.sleep(0.05)
+        start = time.perf_counter()
+        ctx.add_message("user", "third")
+        history = ctx.render()                  # không chờ gộp: message chưa gộp vẫn còn nguyên văn
+        assert time.perf_counter() - start < 0.2
+        assert "first" in history and "summary" not in history
+        ctx._drain()
+        assert "summary" in ctx.render() and "first" not in ctx.render()
+    finally:
+        llm_manager.set_llm_override(None)
+
+
+def test_anonymous_requests_do_not_share_context(tmp_path, monkeypatch):
+    monkeypatch.setattr(memory_manager, "SESSION_MEMORY_DIR", str(tmp_path))
+    monkeypatch.setattr(conversation_context, "_contexts", OrderedDict())
+    ctx_a, token = request_context.begin_request()
+    get_conversation_context().add_message("user", "secret of user A")
+    request_context.end_request(token)
+
+    ctx_b, token = request_context.begin_request()
+    try:
+        assert get_conversation_context().render() == ""
+    finally:
+        request_context.end_request(token)
+
+    ctx_s, token = request_context.begin_request(session_id="chat-1")
+    get_conversation_context().add_message("user", "hello")
+    request_context.end_request(token)
+    assert "hello" in get_conversation_context("chat-1").render()
+
+
+
+def test_context_is_shared_across_workers(tmp_path):
+    llm_manager.set_llm_override(lambda m, t: StubChatModel(model=m, reply="talked about FAISS"))
+    path = str(tmp_path / "chat-1.context.json")
+    worker_a = ConversationContext(recent_turns=2, state_file=path)  # 2 worker process, cùng 1 session
+    worker_b = ConversationContext(recent_turns=2, state_file=path)
+    try:
+        worker_a.add_message("user", "what is FAISS?")
+        worker_b.add_message("assistant", "a vector index")
+        worker_a.add_message("user", "how fast is it?")   # "what is FAISS?" -> chờ gộp
+
+        history = worker_b.render()
+        assert "what is FAISS?" in history and "how fast is it?" in history
+        worker_a._drain()
+        worker_b._drain()                                 # A đã gộp -> B không gộp lại
+        history = ConversationContext(recent_turns=2, state_file=path).render()
+        assert "talked about FAISS" in history and "what is FAISS?" not in history
+        assert "a vector index" in history and "how fast is it?" in history
+    finally:
+        llm_manager.set_llm_override(None)
+
+
+if __name__ == "__main__":
+    test_context_stays_bounded()
+    test_add_message_and_render_do_not_wait_for_fold()
+    test_anonymous_requests_do_not_share_context()
@@ -0,0 +1,27 @@
+import json
+
+from src.ingestion.dedup import MinHashDeduplicator
+
+CHUNKS = json.load(open("data/processed/chunks.json", encoding="utf-8"))[:120]
+
+
+def test_near_duplicates_are_removed():
+    near = [c.replace(" the ", " a ", 1) for c in CHUNKS[:30]]   # sửa 1 từ
+    exact = CHUNKS[30:40]
+    corpus = CHUNKS + near + exact
+
+    kept, report = MinHashDeduplicator(threshold=0.8).dedup(corpus)
+    assert report["removed"] == 40
+    assert kept == CHUNKS                      # giữ bản xuất hiện đầu tiên, đúng thứ tự
+    assert report["index_bytes_out"] < report["index_bytes_in"]
+
+
+def test_distinct_chunks_are_kept():
+    # chunk liền kề có overlap (cửa sổ trượt) nhưng không gần trùng
+    kept, report = MinHashDeduplicator(threshold=0.8).dedup(CHUNKS)
+    assert report["removed"] == 0 and kept == CHUNKS
+
+
+if __name__ == "__main__":
+    test_near_duplicates_are_removed()
+    test_distinct_chunks_are_kept()
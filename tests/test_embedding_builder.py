@@ -0,0 +1,79 @@
+import numpy as np
+import pytest
+from tokenizers import Tokenizer, models, pre_tokenizers, processors, trainers
+from transformers import PreTrainedTokenizerFast
+
+from src.embeddings.embedding_builder import EmbeddingBuilder, OnnxBackend, export_onnx, mean_pool, register_backend
+
+SENTENCES = [
+    "the transformer uses self attention over all tokens",
+    "retrieval augmented generation adds documents to the prompt",
+    "faiss searches dense vectors with inner product or l2 distance",
+    "quantization stores weights as int8 to save memory",
+    "attention weights are computed from queries and keys",
+    "the index returns the nearest chunks for each query",
+]
+
+
+def _fast_tokenizer() -> PreTrainedTokenizerFast:
+    """Fast tokenizer train tại chỗ -> test không cần tải model."""
+    tok = Tokenizer(models.WordLevel(unk_token="[UNK]"))
+    tok.pre_tokenizer = pre_tokenizers.BertPreTokenizer()
+    tok.train_from_iterator(SENTENCES, trainers.WordLevelTrainer(special_tokens=["[PAD]", "[UNK]", "[CLS]", "[SEP]"]))
+    tok.post_processor = processors.TemplateProcessing(
+        single="[CLS] $A [SEP]", special_tokens=[("[CLS]", 2), ("[SEP]", 3)]
+    )
+    return PreTrainedTokenizerFast(tokenizer_object=tok, unk_token="[UNK]", pad_token="[PAD]",
+                                   cls_token="[CLS]", sep_token="[SEP]")
+
+
+def test_mean_pool_ignores_padding():
+    hidden = np.array([[[1.0, 0.0], [3.0, 0.0], [100.0, 100.0]]], dtype=np.float32)
+    mask = np.array([[1, 1, 0]])
+    assert np.allclose(mean_pool(hidden, mask, normalize=False), [[2.0, 0.0]])
+    assert np.allclose(mean_pool(hidden, mask), [[1.0, 0.0]])
+
+
+def test_pluggable_backend():
+    class ConstantBackend:
+        def __init__(self, model_name, **kwargs):
+            self.dimension = 3
+
+        def embed_texts(self, texts, batch_size):
+            return np.ones((len(texts), 3), dtype=np.float32)
+
+    register_backend("constant", ConstantBackend)
+    builder = EmbeddingBuilder(model_name="any", backend="constant")
+    assert builder.embed_texts(["a", "b"]).shape == (2, 3)
+    assert builder.encode("a").shape == (3,)
+    assert len(builder.embed_query("a")) == builder.dimension == 3
+    with pytest.raises(ValueError):
+        EmbeddingBuilder(model_name="any", backend="missing")
+
+
+@pytest.mark.parametrize("quantize", [False, True])
+def test_onnx_matches_torch(tmp_path, quantize):
+    pytest.importorskip("onnxruntime")
+    pytest.importorskip("onnx")
+    import torch
+    from transformers import BertConfig, BertModel
+
+    torch.manual_seed(0)
+    tokenizer = _fast_tokenizer()
+    model = BertModel(BertConfig(vocab_size=len(tokenizer), hidden_size=64, num_hidden_layers=2,
+                                 num_attention_heads=4, intermediate_size=128)).eval()
+    enc = tokenizer(SENTENCES, padding=True, return_tensors="pt")
+    with torch.no_grad():
+        hidden = model(**enc).last_hidden_state.numpy()
+    expected = mean_pool(hidden, enc["attention_mask"].numpy())
+
+    # tính output torch trước: export (tracing) để lại trạng thái trên module
+    export_onnx(model, tmp_path, quantize=quantize, tokenizer=tokenizer)
+    onnx = OnnxBackend("tiny-bert", model_dir=str(tmp_path), quantize=quantize, max_length=32)
+    actual = onnx.embed_texts(SENTENCES, batch_size=4)
+
+    assert actual.shape == expected.shape == (len(SENTENCES), 64) and onnx.dimension == 64
+    cosine = np.sum(actual * expected, axis=1)
+    assert cosine.min() > (0.98 if quantize else 0.9999)
+    # cùng thứ tự hàng xóm gần nhất
+    assert (np.argsort(-(actual @ actual.T), axis=1)[:, :2] == np.argsort(-(expected @ expected.T), axis=1)[:, :2]).all()
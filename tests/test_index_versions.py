@@ -0,0 +1,159 @@
+import threading
+import time
+import zlib
+
+import numpy as np
+import pytest
+
+from src.utils import request_context
+from src.utils.config_loader import config
+from src.vectordb import collection_manager, faiss_index, index_versions
+from src.vectordb.collection_manager import CollectionManager
+from src.vectordb.faiss_index import VectorDB
+
+
+class HashEmbeddings:
+    """Embedding giả 8 chiều, ổn định giữa các process (không cần tải model)."""
+
+    def _vec(self, text):
+        rng = np.random.default_rng(zlib.crc32(text.encode()))
+        return rng.standard_normal(8).tolist()
+
+    def embed_documents(self, texts):
+        return [self._vec(t) for t in texts]
+
+    def embed_query(self, text):
+        return self._vec(text)
+
+
+EMBEDDINGS = HashEmbeddings()
+
+
+def build_version(base, tag: str) -> str:
+    version, path = index_versions.new_version(base)
+    VectorDB(index_path=str(path), embeddings=EMBEDDINGS).build_index([f"{tag} chunk {i}" for i in range(20)])
+    index_versions.publish(base, version)
+    return version
+
+
+def top_chunk(db, query="chunk 1") -> str:
+    return db.search_documents(query, k=1)[0].page_content
+
+
+def test_publish_resolve_and_prune(tmp_path):
+    base = tmp_path / "index"
+    base.mkdir()
+    assert index_versions.resolve(base) == base  # chưa có CURRENT -> layout phẳng như cũ
+    index_versions.new_version(base)  # build dở: không bao giờ được publish
+    versions = [build_version(base, f"v{i}") for i in range(4)]
+    assert index_versions.resolve(base) == base / "versions" / versions[-1]
+    with pytest.raises(FileNotFoundError):
+        index_versions.publish(base, "missing")
+
+    index_versions.publish(base, versions[0])  # rollback: CURRENT cũ hơn các bản giữ lại
+    index_versions.prune(base, keep=2)
+    assert index_versions.versions(base) == [versions[0]] + versions[-2:]
+
+
+@pytest.fixture
+def default_index(tmp_path, monkeypatch):
+    base = tmp_path / "faiss_index"
+    build_version(base, "old")
+    monkeypatch.setattr(config, "FAISS_INDEX_PATH", str(base))
+    monkeypatch.setattr(faiss_index, "_shared",
+                        VectorDB(index_path=str(index_versions.resolve(base)), embeddings=EMBEDDINGS))
+    manager = CollectionManager(root=str(tmp_path / "collections"))
+    monkeypatch.setattr(collection_manager, "_manager", manager)
+    return base, manager
+
+
+def test_swap_keeps_in_flight_request_on_old_version(default_index):
+    base, manager = default_index
+    ctx, token = request_context.begin_request()
+    try:
+        old_db = collection_manager.collection_db()
+        assert top_chunk(old_db).startswith("old")
+
+        build_version(base, "new")
+        assert manager.check_for_updates() == ["default"]
+        assert manager.check_for_updates() == []  # đã ở version CURRENT
+
+        # request mới -> version mới; request đang chạy vẫn dùng version cũ
+        with manager.lease() as new_db:
+            assert top_chunk(new_db).startswith("new")
+            assert new_db is faiss_index.get_vector_db()
+        assert collection_manager.collection_db() is old_db
+        assert top_chunk(old_db).startswith("old")
+    finally:
+        request_context.end_request(token)
+    assert old_db.vectordb is None  # lease cuối cùng của bản cũ trả -> đóng
+
+
+def test_no_errors_while_swapping_under_load(tmp_path, default_index):
+    _, manager = default_index
+    base = manager.path("papers")
+    build_version(base, "v0")
+    errors, seen = [], set()
+    stop = threading.Event()
+
+    def reader():
+        while not stop.is_set():
+            try:
+                with manager.lease("papers") as db:
+                    seen.add(top_chunk(db).split()[0])
+            except Exception as e:  # pragma: no cover - chỉ chạy khi có lỗi
+                errors.append(e)
+
+    threads = [threading.Thread(target=reader) for _ in range(4)]
+    for t in threads:
+        t.start()
+    try:
+        for i in range(1, 6):
+            build_version(base, f"v{i}")
+            assert manager.reload("papers")["swapped"]
+        deadline = time.monotonic() + 5
+        while "v5" not in seen and time.monotonic() < deadline:
+            time.sleep(0.01)
+    finally:
+        stop.set()
+        for t in threads:
+            t.join()
+    assert errors == []
+    assert "v5" in seen and len(seen) > 1
+
+
+def test_reload_endpoint_has_its_own_admin_gate(default_index, monkeypatch):
+    from fastapi.testclient import TestClient
+    from src.api import main
+
+    client = TestClient(main.app)
+    monkeypatch.setattr(config, "PROFILING_ENABLED", True)  # debug profiling không mở endpoint vận hành
+    monkeypatch.setattr(config, "PROFILING_TOKEN", "")
+    assert client.post("/admin/reload_index").status_code == 404
+
+    monkeypatch.setattr(config, "ADMIN_ENABLED", True)
+    monkeypatch.setattr(config, "ADMIN_TOKEN", "")
+    assert client.post("/admin/reload_index").status_code == 403   # endpoint đổi state cần token
+    assert client.get("/admin/breakers").status_code == 200         # chỉ đọc: không token vẫn được
+
+    monkeypatch.setattr(config, "ADMIN_TOKEN", "s3cret")
+    assert client.get("/admin/breakers").status_code == 403
+    assert client.post("/admin/reload_index", headers={"X-Admin-Token": "wrong"}).status_code == 403
+    assert client.post("/admin/reload_index", headers={"X-Admin-Token": "s3cret"}).status_code == 200
+
+
+def test_admin_and_profiling_tokens_are_checked(monkeypatch):
+    from fastapi import HTTPException
+    from src.api.routers import admin_router
+    from src.utils import profiling
+
+    monkeypatch.setattr(config, "PROFILING_ENABLED", True)
+    monkeypatch.setattr(config, "PROFILING_TOKEN", "s3cret")
+    assert profiling.should_profile({"x-profile": "1", "x-profile-token": "s3cret"})
+    assert not profiling.should_profile({"x-profile": "1", "x-profile-token": "wrong"})
+    assert not profiling.should_profile({"x-profile": "1"})
+    admin_router._check_admin("s3cret")
+    for token in (None, "wrong", "sécret"):  # không phải ASCII -> 403, không phải TypeError
+        with pytest.raises(HTTPException) as exc:
+            admin_router._check_admin(token)
+        assert exc.value.status_code == 403
@@ -0,0 +1,116 @@
+import threading
+import time
+
+from src.utils import llm_manager, request_context
+from src.utils.config_loader import config
+from src.utils.stubs import StubChatModel
+
+
+class ScriptedLatency:
+    """Latency giả theo thứ tự gọi: lần lượt lấy từ `script`, hết thì dùng `default`."""
+
+    def __init__(self, script, default):
+        self.script = list(script)
+        self.default = default
+        self._lock = threading.Lock()
+
+    def sample(self):
+        with self._lock:
+            return self.script.pop(0) if self.script else self.default
+
+    def should_fail(self):
+        return False
+
+
+def _hedging(monkeypatch, max_rate):
+    monkeypatch.setattr(config, "LLM_HEDGE", True)
+    monkeypatch.setattr(config, "LLM_HEDGE_MIN_SAMPLES", 5)
+    monkeypatch.setattr(config, "LLM_HEDGE_MIN_DELAY", 0.01)
+    monkeypatch.setattr(config, "LLM_HEDGE_MAX_RATE", max_rate)
+
+
+def _slow_sixth_call(model, slow):
+    """5 call nhanh (làm mẫu latency), call thứ 6 chậm `slow` giây; bản hedge của nó lại nhanh."""
+    latency = ScriptedLatency([0.02] * 5 + [slow], default=0.02)
+    llm_manager.set_llm_override(lambda m, t: StubChatModel(model=m, latency=latency, reply="ok"))
+    llm = llm_manager.create_langchain_llm(model)
+    for _ in range(5):
+        llm.invoke("warm up")
+    start = time.perf_counter()
+    answer = llm.invoke("tail call").content
+    return answer, time.perf_counter() - start
+
+
+def test_hedge_cuts_tail_latency(monkeypatch):
+    _hedging(monkeypatch, max_rate=1.0)
+    try:
+        before = llm_manager.LLM_HEDGES.value(model="stub-hedge", winner="hedge")
+        answer, elapsed = _slow_sixth_call("stub-hedge", slow=2.0)
+    finally:
+        llm_manager.set_llm_override(None)
+    assert answer == "ok"
+    assert elapsed < 0.5  # hedge gửi sau ~p90 (0.02s) và về trước bản gốc 2s
+    assert llm_manager.LLM_HEDGES.value(model="stub-hedge", winner="hedge") == before + 1
+    assert llm_manager.LLM_HEDGE_DELAY.value(model="stub-hedge") >= 0.02
+
+
+def test_hedge_rate_cap_disables_duplicates(monkeypatch):
+    _hedging(monkeypatch, max_rate=0.0)
+    try:
+        answer, elapsed = _slow_sixth_call("stub-hedge-capped", slow=0.3)
+    finally:
+        llm_manager.set_llm_override(None)
+    assert answer == "ok" and elapsed >= 0.3  # không có budget hedge -> chờ bản gốc
+    assert llm_manager.LLM_HEDGES.value(model="stub-hedge-capped", winner="hedge") == 0
+
+
+def test_hedge_budget_follows_max_rate(monkeypatch):
+    monkeypatch.setattr(config, "LLM_HEDGE_MAX_RATE", 0.1)
+    state = llm_manager._HedgeState("stub-budget")
+    granted = 0
+    for _ in range(30):
+        state.add_call()
+        granted += state.take_hedge()
+    assert granted == 3  # <= 10% số call
+    for _ in range(200):
+        state.add_call()
+    assert sum(state.take_hedge() for _ in range(10)) == llm_manager.HEDGE_BURST
+
+
+def test_disabled_hedge_is_plain_call(monkeypatch):
+    monkeypatch.setattr(config, "LLM_HEDGE", False)
+    assert llm_manager.hedged_call("stub-plain", lambda: threading.current_thread().name) \
+        == threading.current_thread().name
+
+
+def test_losing_hedge_is_charged_to_the_request(monkeypatch):
+    _hedging(monkeypatch, max_rate=1.0)
+    latency = ScriptedLatency([0.02] * 5 + [0.3], default=0.02)
+    llm_manager.set_llm_override(lambda m, t: StubChatModel(model=m, latency=latency, reply="ok"))
+    ctx, token = request_context.begin_request()
+    try:
+        llm = llm_manager.create_langchain_llm("stub-hedge-charged")
+        for _ in range(5):
+            llm.invoke("warm up")
+        before = ctx.total_tokens()
+        assert llm.invoke("tail call").content == "ok"  # bản hedge thắng, bản gốc còn chạy
+        winner = ctx.total_tokens() - before
+        time.sleep(0.4)                                  # bản gốc (thua) xong -> token của nó được ghi
+        assert ctx.total_tokens() - before == 2 * winner
+    finally:
+        request_context.end_request(token)
+        llm_manager.set_llm_override(None)
+
+
+def test_no_hedge_without_token_budget(monkeypatch):
+    _hedging(monkeypatch, max_rate=1.0)
+    monkeypatch.setattr(config, "REQUEST_TOKEN_BUDGET", 1)
+    ctx, token = request_context.begin_request()
+    try:
+        answer, elapsed = _slow_sixth_call("stub-hedge-budget", slow=0.3)
+    finally:
+        request_context.end_request(token)
+        llm_manager.set_llm_override(None)
+    assert answer == "ok" and elapsed >= 0.3
+    assert llm_manager.LLM_HEDGES.value(model="stub-hedge-budget", winner="hedge") == 0
+    assert "llm_hedge" in ctx.usage_snapshot()[1]
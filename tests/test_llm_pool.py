@@ -0,0 +1,96 @@
+import threading
+import time
+
+from src.utils import llm_manager
+from src.utils.config_loader import config
+from src.utils.stubs import LatencyModel, StubChatModel
+
+
+class RateLimited(Exception):
+    code = 429
+
+
+def test_clients_are_shared():
+    llm_manager.set_llm_override(lambda m, t: StubChatModel(model=m, temperature=t))
+    a = llm_manager.create_langchain_llm("stub-a", temperature=0.0)
+    b = llm_manager.create_langchain_llm("stub-a", temperature=0.0)
+    c = llm_manager.create_langchain_llm("stub-a", temperature=0.3)
+    assert a is b
+    assert a is not c
+    assert a.invoke("hi").content == "retrieve"
+    llm_manager.set_llm_override(None)
+
+
+def test_retry_on_429():
+    config.LLM_BACKOFF_BASE = 0.001
+    calls = {"n": 0}
+
+    def flaky():
+        calls["n"] += 1
+        if calls["n"] < 3:
+            raise RateLimited("quota")
+        return "ok"
+
+    assert llm_manager.call_with_limits("stub-retry", flaky) == "ok"
+    assert calls["n"] == 3
+
+
+def test_non_retryable_error_is_raised():
+    calls = {"n": 0}
+
+    def broken():
+        calls["n"] += 1
+        raise ValueError("bad request")
+
+    try:
+        llm_manager.call_with_limits("stub-broken", broken)
+    except ValueError:
+        pass
+    else:
+        raise AssertionError("ValueError expected")
+    assert calls["n"] == 1
+
+
+def test_per_model_concurrency_cap(monkeypatch):
+    monkeypatch.setattr(config, "ADMISSION_LIMITS", "llm=8,llm:stub-capped=2")
+    llm_manager.set_llm_override(
+        lambda m, t: StubChatModel(model=m, latency=LatencyModel("fixed", (0.05,)))
+    )
+    llm = llm_manager.create_langchain_llm("stub-capped")
+    peak = {"now": 0, "max": 0}
+    lock = threading.Lock()
+    original = llm.inner._generate
+
+    def counting_generate(*args, **kwargs):
+        with lock:
+            peak["now"] += 1
+            peak["max"] = max(peak["max"], peak["now"])
+        try:
+            return original(*args, **kwargs)
+        finally:
+            with lock:
+                peak["now"] -= 1
+
+    object.__setattr__(llm.inner, "_generate", counting_generate)
+    threads = [threading.Thread(target=llm.invoke, args=("q",)) for _ in range(6)]
+    start = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert peak["max"] <= 2
+    assert time.perf_counter() - start >= 0.14
+    llm_manager.set_llm_override(None)
+
+
+if __name__ == "__main__":
+    test_clients_are_shared()
+    test_retry_on_429()
+    test_non_retryable_error_is_raised()
+    test_per_model_concurrency_cap()
+
+
+def test_gemini_client_does_not_retry_itself(monkeypatch):
+    monkeypatch.setenv("GOOGLE_API_KEY", "test-key")
+    client = llm_manager._build_client("gemini-2.0-flash", 0.0)
+    assert client.max_retries == 1  # retry / backoff chỉ ở call_with_limits
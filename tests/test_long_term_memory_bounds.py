@@ -0,0 +1,100 @@
+import hashlib
+
+import numpy as np
+
+from src.agents.memory.long_term_memory import LongTermMemory
+from src.utils import llm_manager
+from src.utils.stubs import StubChatModel
+
+
+class HashEmbedder:
+    """Embedding giả: bag-of-words băm vào 384 chiều (câu giống nhau -> cosine cao)."""
+
+    def encode(self, texts):
+        out = np.zeros((len(texts), 384), dtype=np.float32)
+        for i, text in enumerate(texts):
+            for word in text.lower().split():
+                out[i, int(hashlib.md5(word.encode()).hexdigest(), 16) % 384] += 1.0
+        return out
+
+
+def _memory(tmp_path, **kwargs):
+    return LongTermMemory(
+        memory_index_path=str(tmp_path / "memory_index.faiss"),
+        meta_path=str(tmp_path / "memory_meta.npy"),
+        embedder=HashEmbedder(),
+        **kwargs,
+    )
+
+
+def _echo_summaries():
+    # summary = nguyên văn conversation (stub trả lại prompt sau dấu xuống dòng đôi)
+    class Echo(StubChatModel):
+        def _generate(self, messages, stop=None, run_manager=None, **kwargs):
+            result = super()._generate(messages, stop, run_manager, **kwargs)
+            result.generations[0].message.content = messages[-1].content.split("\n\n", 1)[-1]
+            return result
+
+    llm_manager.set_llm_override(lambda m, t: Echo(model=m))
+
+
+def test_near_duplicates_are_merged(tmp_path):
+    _echo_summaries()
+    mem = _memory(tmp_path, merge_threshold=0.9)
+    mem.add_memory("user asked about transformer attention heads")
+    mem.add_memory("user asked about transformer attention heads again")
+    mem.add_memory("weather in hanoi is rainy today")
+
+    stats = mem.stats()
+    assert stats["size"] == 2
+    assert stats["merges"] == 1
+    assert mem.retrieve_relevant_memory("transformer attention", top_k=1) == [
+        "user asked about transformer attention heads again"  # summary cũ nằm trọn trong summary mới
+    ]
+    llm_manager.set_llm_override(None)
+
+
+def test_merge_keeps_details_of_both_summaries_and_counts_a_hit(tmp_path):
+    _echo_summaries()
+    mem = _memory(tmp_path, merge_threshold=0.6)
+    mem.add_memory("user asked about transformer attention heads in BERT")
+    mem.add_memory("user asked about transformer attention heads in GPT")
+
+    (entry,) = mem.memory_texts
+    assert "BERT" in entry["summary"] and "GPT" in entry["summary"]
+    assert entry["hits"] == 1 and entry["merged"] == 1
+    llm_manager.set_llm_override(None)
+
+
+def test_capacity_evicts_least_used(tmp_path):
+    _echo_summaries()
+    mem = _memory(tmp_path, capacity=3, merge_threshold=1.1)
+    mem.add_memory("alpha topic one")
+    mem.add_memory("beta topic two")
+    mem.retrieve_relevant_memory("alpha", top_k=1)   # alpha được dùng -> giữ lại
+    mem.add_memory("gamma topic three")
+    mem.add_memory("delta topic four")
+
+    summaries = {e["summary"] for e in mem.memory_texts}
+    assert len(summaries) == 3 and mem.index.ntotal == 3
+    assert "alpha topic one" in summaries and "beta topic two" not in summaries
+    assert mem.stats()["evictions"] == 1
+
+    # reload từ đĩa giữ nguyên id và entries
+    again = _memory(tmp_path, capacity=3)
+    assert {e["summary"] for e in again.memory_texts} == summaries
+    llm_manager.set_llm_override(None)
+
+
+def test_workers_sharing_the_files_do_not_overwrite_each_other(tmp_path):
+    _echo_summaries()
+    worker_a = _memory(tmp_path, merge_threshold=1.1)
+    worker_b = _memory(tmp_path, merge_threshold=1.1)  # process khác, cùng file trên đĩa
+    worker_a.add_memory("alpha topic one")
+    worker_b.add_memory("beta topic two")              # nạp lại bản của A trước khi ghi
+    worker_a.add_memory("gamma topic three")
+
+    expected = {"alpha topic one", "beta topic two", "gamma topic three"}
+    assert {e["summary"] for e in _memory(tmp_path).memory_texts} == expected
+    assert worker_b.retrieve_relevant_memory("gamma", top_k=1) == ["gamma topic three"]
+    llm_manager.set_llm_override(None)
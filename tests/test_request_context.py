@@ -0,0 +1,74 @@
+import contextvars
+import threading
+from collections import OrderedDict
+
+from src.agents.base_agent import AgentBase
+from src.agents.memory import memory_manager
+from src.utils import request_context
+from src.utils.config_loader import config
+
+
+def test_web_search_flag_is_per_request():
+    seen = {}
+    barrier = threading.Barrier(2)
+
+    def handle(name, flag):
+        ctx, token = request_context.begin_request()
+        ctx.web_search = flag
+        barrier.wait()  # cả 2 request đã set flag trước khi đọc
+        seen[name] = request_context.web_search_enabled()
+        request_context.end_request(token)
+
+    threads = [
+        threading.Thread(target=contextvars.copy_context().run, args=(handle, "on", True)),
+        threading.Thread(target=contextvars.copy_context().run, args=(handle, "off", False)),
+    ]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert seen == {"on": True, "off": False}
+
+
+def test_web_search_defaults_outside_request():
+    assert request_context.web_search_enabled() is config.WEB_SEARCH_DEFAULT
+    ctx, token = request_context.begin_request()
+    assert request_context.web_search_enabled() is config.WEB_SEARCH_DEFAULT  # request không gửi flag
+    request_context.end_request(token)
+
+
+def test_short_memory_is_per_session(tmp_path, monkeypatch):
+    monkeypatch.setattr(memory_manager, "DEFAULT_MEMORY_FILE", str(tmp_path / "conversation_history.json"))
+    monkeypatch.setattr(memory_manager, "SESSION_MEMORY_DIR", str(tmp_path / "sessions"))
+    monkeypatch.setattr(memory_manager, "_sessions", OrderedDict())
+    agent = AgentBase("SharedAgent")  # 1 instance cho mọi session, như trong API
+
+    for session, text in (("alice", "alice's question"), ("bob", "bob's question"), (None, "anonymous question")):
+        ctx, token = request_context.begin_request(session_id=session)
+        agent.remember("user", text)
+        request_context.end_request(token)
+
+    assert memory_manager.get_short_memory("alice").get_context() == "user: alice's question"
+    assert memory_manager.get_short_memory("bob").get_context() == "user: bob's question"
+    assert "anonymous" not in memory_manager.get_short_memory("default").get_context()
+    assert len(list((tmp_path / "sessions").glob("*.json"))) == 2  # request ẩn danh không ghi file
+
+
+def test_session_history_is_shared_across_workers(tmp_path):
+    # 2 object cùng file = 2 worker process cùng phục vụ 1 session
+    path = str(tmp_path / "alice.json")
+    worker_a = memory_manager.MemoryManager(memory_file=path)
+    worker_b = memory_manager.MemoryManager(memory_file=path)
+    worker_a.add_message("user", "first question")
+    worker_b.add_message("assistant", "first answer")   # không ghi đè lượt của worker A
+    worker_a.add_message("user", "follow-up")
+
+    history = worker_b.get_context()
+    assert history == "user: first question\nassistant: first answer\nuser: follow-up"
+    assert worker_a.pop_context(3) == history
+    assert worker_b.pop_context(1) is None               # worker A đã đẩy đoạn này, B không đẩy lại
+
+
+if __name__ == "__main__":
+    test_web_search_flag_is_per_request()
+    test_web_search_defaults_outside_request()
@@ -0,0 +1,126 @@
+import time
+from collections import OrderedDict
+from types import SimpleNamespace
+
+from src.agents import router as router_module
+from src.agents.base_agent import AgentBase
+from src.agents.memory import memory_manager
+from src.agents.router import IntentRouter, RouterAgent, explicit_intent, split_compound
+from src.utils import llm_manager, request_context
+from src.utils.config_loader import config
+from src.utils.stubs import StubChatModel
+
+
+class SleepAgent(AgentBase):
+    """Agent giả: chờ `seconds` rồi trả lời (hoặc raise nếu fail=True)."""
+
+    vector_db = SimpleNamespace(vectordb=None)  # không có FAISS -> router bỏ speculative retrieval
+
+    def __init__(self, name, seconds, fail=False):
+        super().__init__(name)
+        self.seconds = seconds
+        self.fail = fail
+        self.queries = []
+
+    def run(self, query, **kwargs):
+        self.queries.append(query)
+        with self.stage("llm_answer"):
+            time.sleep(self.seconds)
+        if self.fail:
+            raise RuntimeError("backend down")
+        return {"answer": f"{self.name} answer"}
+
+
+def _isolate_memory(monkeypatch, tmp_path):
+    """Short memory ghi vào tmp_path, không đụng data/processed/conversation_history.json."""
+    monkeypatch.setattr(memory_manager, "DEFAULT_MEMORY_FILE", str(tmp_path / "conversation_history.json"))
+    monkeypatch.setattr(memory_manager, "SESSION_MEMORY_DIR", str(tmp_path / "sessions"))
+    monkeypatch.setattr(memory_manager, "_sessions", OrderedDict())
+
+
+def _router(reply, monkeypatch, tmp_path, explain_fail=False):
+    _isolate_memory(monkeypatch, tmp_path)
+    llm_manager.set_llm_override(lambda m, t: StubChatModel(model=m, reply=reply))
+    router = IntentRouter.__new__(IntentRouter)  # không load model / FAISS
+    router.router_agent = RouterAgent()
+    router.knowledge_agent = SleepAgent("KnowledgeAgent", 0.3)
+    router.explain_agent = SleepAgent("ExplainAgent", 0.3, fail=explain_fail)
+    router.code_agent = SleepAgent("CodeAgent", 0.3)
+    return router
+
+
+def test_split_compound():
+    assert split_compound("explain attention and show me PyTorch code for it") == [
+        ("explain", "explain attention"), ("code", "show me PyTorch code for it")]
+    assert split_compound("explain the difference between RAG and fine-tuning") == []
+    assert split_compound("Show me Python code for attention mechanism.") == []
+    assert [i for i, _ in split_compound("tóm tắt paper mới nhất về RAG; rồi viết code demo")] == ["retrieve", "code"]
+
+
+def test_intent_cues_match_whole_words():
+    assert explicit_intent("explain how the encoder works") == "explain"
+    assert explicit_intent("unicode normalization in the decoder") is None
+    assert explicit_intent("viết code cho tôi") == "code"
+    assert [i for i, _ in split_compound("explain how the encoder works and summarize the paper")] == [
+        "explain", "retrieve"]
+
+
+def test_questions_about_code_are_not_split():
+    assert explicit_intent("explain how this code works") == "explain"
+    assert explicit_intent("giải thích đoạn code này") == "explain"
+    assert explicit_intent("what does this function do") is None
+    assert split_compound("explain how this code works and why the function is slow") == []
+    assert split_compound("explain how this code works and then fix the bug in it") == [
+        ("explain", "explain how this code works"), ("code", "fix the bug in it")]
+
+
+def test_compound_query_runs_agents_in_parallel(monkeypatch, tmp_path):
+    plan = "explain: Explain the attention mechanism\ncode: Write PyTorch code for scaled dot-product attention"
+    router = _router(plan, monkeypatch, tmp_path)
+    planned_by_llm = router_module.ROUTER_FANOUT.value(planner="llm")
+    ctx, token = request_context.begin_request()
+    try:
+        start = time.perf_counter()
+        result = router.route("explain attention and show me PyTorch code for it")
+        elapsed = time.perf_counter() - start
+        timings = ctx.timings_block()["stages_ms"]
+    finally:
+        request_context.end_request(token)
+        llm_manager.set_llm_override(None)
+
+    assert elapsed < 0.55  # 2 nhánh 0.3s chạy song song, không phải 0.6s
+    assert result["intent"] == "multi"
+    assert [(p["intent"], p["agent"]) for p in result["parts"]] == [("explain", "ExplainAgent"), ("code", "CodeAgent")]
+    assert router.code_agent.queries == ["Write PyTorch code for scaled dot-product attention"]
+    assert all(p["elapsed_ms"] >= 300 for p in result["parts"])
+    assert "ExplainAgent answer" in result["answer"] and "CodeAgent answer" in result["answer"]
+    assert result["answer"].index("ExplainAgent answer") < result["answer"].index("CodeAgent answer")
+    assert "router.fanout.ExplainAgent" in timings and "router.fanout.CodeAgent" in timings
+    assert "router.classify_intent" not in timings
+    assert router_module.ROUTER_FANOUT.value(planner="llm") == planned_by_llm + 1
+
+
+def test_unparseable_plan_falls_back_to_heuristic_parts_and_isolates_failures(monkeypatch, tmp_path):
+    router = _router("I cannot do that", monkeypatch, tmp_path, explain_fail=True)
+    query = "explain attention and show me PyTorch code for it"
+    try:
+        result = router.route(query)
+    finally:
+        llm_manager.set_llm_override(None)
+    explain_part, code_part = result["parts"]
+    assert explain_part["error"] == "backend down" and explain_part["answer"] == ""
+    assert code_part["answer"] == "CodeAgent answer"
+    assert router.code_agent.queries[0].startswith("show me PyTorch code for it")
+    assert query in router.code_agent.queries[0]  # heuristic: kèm query gốc làm ngữ cảnh
+    assert "(no answer: backend down)" in result["answer"]
+
+
+def test_single_intent_and_disabled_fanout_route_to_one_agent(monkeypatch, tmp_path):
+    router = _router("code", monkeypatch, tmp_path)
+    try:
+        assert router.route("Show me Python code for attention.")["intent"] == "code"
+        monkeypatch.setattr(config, "ROUTER_FANOUT", False)
+        assert router.route("explain attention and show me PyTorch code for it")["intent"] == "code"
+    finally:
+        llm_manager.set_llm_override(None)
+    assert len(router.code_agent.queries) == 2 and router.explain_agent.queries == []
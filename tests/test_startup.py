@@ -0,0 +1,48 @@
+import subprocess
+import sys
+
+from fastapi.testclient import TestClient
+
+from src.api import warmup
+
+
+def test_import_does_not_load_heavy_dependencies():
+    code = (
+        "import sys, src.api.main\n"
+        "heavy = [m for m in ('torch', 'sentence_transformers', 'langchain_google_genai', 'src.agents.router')"
+        " if m in sys.modules]\n"
+        "assert not heavy, heavy\n"
+    )
+    result = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True,
+                            env={"WARMUP_ON_STARTUP": "false", "PATH": ""})
+    assert result.returncode == 0, result.stderr[-2000:]
+
+
+def test_ready_only_after_warmup(monkeypatch):
+    from src.api.main import app
+
+    client = TestClient(app)  # không chạy lifespan -> chưa warmup
+    assert client.get("/health").status_code == 200
+    resp = client.get("/ready")
+    assert resp.status_code == 503
+    assert "import" in resp.json()["phases"]
+
+    # load/probe thật cần model embedding -> thay bằng no-op, chỉ kiểm tra cờ ready + callback
+    monkeypatch.setattr(warmup, "load", lambda: None)
+    monkeypatch.setattr(warmup, "probe", lambda: None)
+    callbacks = []
+    warmup.on_ready(lambda: callbacks.append("ready"))
+    try:
+        warmup.run()
+        resp = client.get("/ready")
+        assert resp.status_code == 200
+        assert "warmup_total" in resp.json()["phases"]
+        assert callbacks == ["ready"]
+    finally:
+        with warmup._state_lock:
+            warmup._state["ready"] = False
+            warmup._ready_callbacks.clear()
+
+
+if __name__ == "__main__":
+    test_import_does_not_load_heavy_dependencies()
@@ -0,0 +1,73 @@
+import re
+import zlib
+
+import numpy as np
+
+from src.agents.summarizer import SUMMARY_LLM_CALLS_SAVED, WebSummarizer
+from src.utils.stubs import StubChatModel
+from src.utils.tokens import count_tokens
+
+
+class BagOfWordsEmbeddings:
+    """Embedding giả: đếm từ theo hash (không cần tải model)."""
+
+    def _vec(self, text):
+        v = np.zeros(64, dtype=np.float32)
+        for w in re.findall(r"\w+", text.lower()):
+            v[zlib.crc32(w.encode()) % 64] += 1
+        return v.tolist()
+
+    def embed_documents(self, texts):
+        return [self._vec(t) for t in texts]
+
+    def embed_query(self, text):
+        return self._vec(text)
+
+
+class CountingLLM(StubChatModel):
+    calls: int = 0
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs):
+        self.calls += 1
+        return super()._generate(messages, stop, run_manager, **kwargs)
+
+
+FILLER = [f"Unrelated filler sentence number {i} talks about weather and sports." for i in range(120)]
+PAGE = (
+    "[1] FAISS (https://example.com/faiss)\n"
+    + " ".join(FILLER[:60] + ["FAISS performs similarity search over dense vectors quickly."] + FILLER[60:])
+)
+
+
+def _summarizer(**kwargs):
+    llm = CountingLLM(reply="llm summary")
+    return WebSummarizer(llm=llm, embeddings=BagOfWordsEmbeddings(), model_name="stub",
+                         direct_max_tokens=200, target_tokens=80, **kwargs), llm
+
+
+def test_short_text_goes_direct_without_llm():
+    summarizer, llm = _summarizer(mode="extractive")
+    before = SUMMARY_LLM_CALLS_SAVED.value(mode="direct")
+    text = "[1] FAISS (https://example.com/faiss)\nFAISS is a vector search library."
+    assert summarizer.summarize("what is faiss", text) == (text, "direct")
+    assert llm.calls == 0
+    assert SUMMARY_LLM_CALLS_SAVED.value(mode="direct") == before + 1
+
+
+def test_long_text_is_summarized_extractively():
+    summarizer, llm = _summarizer(mode="extractive")
+    assert count_tokens(PAGE) > 200
+    summary, mode = summarizer.summarize("similarity search dense vectors", PAGE)
+    assert mode == "extractive"
+    assert llm.calls == 0
+    assert count_tokens(summary) <= 80 + 20  # + dòng nguồn
+    assert summary.startswith("[1] FAISS (https://example.com/faiss)\n")
+    assert "FAISS performs similarity search" in summary
+
+
+def test_llm_mode_calls_llm_per_block():
+    summarizer, llm = _summarizer(mode="llm")
+    summary, mode = summarizer.summarize("similarity search", PAGE)
+    assert mode == "llm"
+    assert llm.calls == len(WebSummarizer.llm_chunks(PAGE)) > 1
+    assert "llm summary" in summary
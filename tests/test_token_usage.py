@@ -0,0 +1,124 @@
+import uuid
+
+from fastapi.testclient import TestClient
+from langchain_core.outputs import Generation, LLMResult
+
+from src.agents.base_agent import AgentBase
+from src.agents.memory.conversation_context import ConversationContext
+from src.utils import llm_manager, request_context, token_usage
+from src.utils.config_loader import config
+from src.utils.metrics import timed
+from src.utils.stubs import StubChatModel
+
+
+def _stub_llm(model="gemini-2.5-flash"):
+    llm_manager.set_llm_override(lambda m, t: StubChatModel(model=m, reply="a reply of about twenty chars"))
+    return llm_manager.create_langchain_llm(model_name=model)
+
+
+def test_usage_recorded_by_request_session_agent_and_stage():
+    session = uuid.uuid4().hex
+    prompt = "x" * 400  # stub: input_tokens = chars // 4 = 100
+    try:
+        llm = _stub_llm()
+        before = token_usage.LLM_TOKENS.value(model="gemini-2.5-flash", kind="prompt",
+                                               agent="KnowledgeAgent", stage="KnowledgeAgent.llm_answer")
+        ctx, token = request_context.begin_request(session_id=session)
+        try:
+            with timed("KnowledgeAgent.llm_answer"):
+                llm.invoke(prompt)
+            with timed("router.classify_intent"):
+                llm.invoke(prompt)
+            block = token_usage.usage_block(ctx)
+        finally:
+            request_context.end_request(token)
+    finally:
+        llm_manager.set_llm_override(None)
+
+    assert block["prompt_tokens"] == 200 and block["completion_tokens"] == 14
+    assert block["by_agent"] == {"KnowledgeAgent": 107, "router": 107}
+    assert block["by_stage"]["router.classify_intent"] == {"prompt_tokens": 100, "completion_tokens": 7}
+    assert block["cost_usd"] == round((200 * 0.30 + 14 * 2.50) / 1e6, 6)
+    assert block["session"]["total_tokens"] == 214
+    assert token_usage.LLM_TOKENS.value(model="gemini-2.5-flash", kind="prompt", agent="KnowledgeAgent",
+                                        stage="KnowledgeAgent.llm_answer") == before + 100
+
+
+def test_estimates_tokens_without_usage_metadata():
+    callback = token_usage.TokenUsageCallback("no-usage-model")
+    run_id = uuid.uuid4()
+    ctx, token = request_context.begin_request()
+    try:
+        with timed("ExplainAgent.llm_answer"):
+            callback.on_llm_start({}, ["word " * 40], run_id=run_id)
+        callback.on_llm_end(LLMResult(generations=[[Generation(text="short answer")]]), run_id=run_id)
+        prompt, completion, cost = ctx.tokens["ExplainAgent.llm_answer"]
+    finally:
+        request_context.end_request(token)
+    assert prompt >= 30 and 1 <= completion <= 4 and cost == 0.0  # model không có giá -> 0
+
+
+def test_budget_degrades_instead_of_failing(monkeypatch):
+    monkeypatch.setattr(config, "REQUEST_TOKEN_BUDGET", 150)
+    conversation = ConversationContext(max_tokens=30)
+    for i in range(3):
+        conversation.add_message("user", f"message {i} " + "filler " * 5)
+    try:
+        llm = _stub_llm()
+        ctx, token = request_context.begin_request(session_id=uuid.uuid4().hex)
+        try:
+            assert AgentBase.render_history(conversation) == conversation.render()  # còn đủ budget
+            with timed("KnowledgeAgent.llm_answer"):
+                llm.invoke("y" * 400)  # 107 token -> còn 43
+            short = AgentBase.render_history(conversation)
+            assert token_usage.should_degrade("classify_intent", need=100)
+            assert not token_usage.should_degrade("tiny_step", need=10)
+            degraded = list(ctx.degraded)
+        finally:
+            request_context.end_request(token)
+    finally:
+        llm_manager.set_llm_override(None)
+    assert 0 < len(short) < len(conversation.render())
+    assert degraded == ["history", "classify_intent"]
+    assert token_usage.BUDGET_DEGRADATIONS.value(feature="classify_intent") >= 1
+
+
+def test_session_budget_applies_across_requests(monkeypatch):
+    monkeypatch.setattr(config, "SESSION_TOKEN_BUDGET", 200)
+    session = uuid.uuid4().hex
+    try:
+        llm = _stub_llm()
+        for _ in range(2):
+            ctx, token = request_context.begin_request(session_id=session)
+            try:
+                llm.invoke("z" * 400)
+            finally:
+                request_context.end_request(token)
+        ctx, token = request_context.begin_request(session_id=session)
+        try:
+            assert token_usage.remaining_tokens() == 0
+            assert token_usage.should_degrade("memory_summary", need=1)
+        finally:
+            request_context.end_request(token)
+    finally:
+        llm_manager.set_llm_override(None)
+
+
+def test_chat_response_has_usage_block(monkeypatch):
+    from src.api import main
+    from src.api.routers import chat_router
+
+    class EchoAgent(AgentBase):
+        def run(self, query, **kwargs):
+            with self.stage("llm_answer"):
+                return {"answer": self.llm.invoke(query).content}
+
+    agent = EchoAgent("EchoAgent")
+    try:
+        agent.llm = _stub_llm()
+        monkeypatch.setattr(chat_router, "manual_agent", lambda name: agent)
+        body = TestClient(main.app).post("/chat", json={"query": "q" * 80, "agent": "knowledge"}).json()
+    finally:
+        llm_manager.set_llm_override(None)
+    assert body["usage"]["by_stage"] == {"EchoAgent.llm_answer": {"prompt_tokens": 20, "completion_tokens": 7}}
+    assert body["usage"]["degraded"] == []
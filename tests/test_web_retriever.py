@@ -0,0 +1,103 @@
+import re
+import threading
+import time
+import zlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy as np
+
+from src.agents.web_retriever import HttpxFetcher, WebRetriever, extract_main_text, format_passages, split_passages
+
+PAGES = {
+    "/faiss": """<html><head><script>var tracking = 1;</script></head><body>
+        <nav>Home | About | Contact us today for more</nav>
+        <article><h1>FAISS</h1>
+        <p>FAISS is a library for efficient similarity search of dense vectors.</p>
+        <p>It supports flat indexes and inverted file indexes with product quantization.</p>
+        </article><footer>Copyright notice for the whole website here</footer></body></html>""",
+    "/cooking": """<html><body><main>
+        <p>Boil the pasta in salted water for about ten minutes.</p>
+        <p>Add the tomato sauce and serve with grated cheese on top.</p>
+        </main></body></html>""",
+}
+
+
+class Handler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path == "/slow":
+            time.sleep(2)
+        if self.path not in PAGES:
+            self.send_response(404)
+            self.end_headers()
+            return
+        body = PAGES[self.path].encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/html; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class BagOfWordsEmbeddings:
+    """Embedding giả: đếm từ theo hash (không cần tải model)."""
+
+    def _vec(self, text):
+        v = np.zeros(64, dtype=np.float32)
+        for w in re.findall(r"\w+", text.lower()):
+            v[zlib.crc32(w.encode()) % 64] += 1
+        return v.tolist()
+
+    def embed_documents(self, texts):
+        return [self._vec(t) for t in texts]
+
+    def embed_query(self, text):
+        return self._vec(text)
+
+
+class LocalSearcher:
+    def __init__(self, base, paths):
+        self.urls = [base + p for p in paths]
+
+    def search(self, query, n):
+        return [{"url": u, "title": u.rsplit("/", 1)[-1], "snippet": ""} for u in self.urls[:n]]
+
+
+def _serve():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}"
+
+
+def test_extract_and_split():
+    text = extract_main_text(PAGES["/faiss"])
+    assert "similarity search" in text
+    assert "tracking" not in text and "Contact" not in text and "Copyright" not in text
+    passages = split_passages(" ".join(["One two three four five six."] * 10), max_words=12)
+    assert all(len(p.split()) <= 12 for p in passages)
+    assert len(passages) == 5
+
+
+def test_retriever_ranks_relevant_passage_and_skips_bad_pages():
+    server, base = _serve()
+    try:
+        retriever = WebRetriever(
+            searcher=LocalSearcher(base, ["/cooking", "/missing", "/slow", "/faiss"]),
+            fetcher=HttpxFetcher(concurrency=4, per_host=4, timeout=1.0, deadline=1.5),
+            embeddings=BagOfWordsEmbeddings(), results=4, top_passages=2, passage_words=20,
+        )
+        start = time.perf_counter()
+        passages = retriever.retrieve("similarity search of dense vectors")
+        elapsed = time.perf_counter() - start
+    finally:
+        server.shutdown()
+
+    # trang chậm bị bỏ theo timeout, không chặn cả lượt; 404 bị bỏ qua
+    assert elapsed < 2.0
+    assert passages[0]["url"] == base + "/faiss"
+    assert "similarity search" in passages[0]["text"]
+    assert all("/slow" not in p["url"] and "/missing" not in p["url"] for p in passages)
+    assert passages[0]["score"] >= passages[-1]["score"]
+    assert f"({base}/faiss)" in format_passages(passages)